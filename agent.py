@@ -0,0 +1,144 @@
+"""Удалённый агент: выполняет задания очереди (`jobs.py`) на своём участке стенда.
+
+Агент забирает задания у координатора (машины с `app.py`) по HTTP, гоняет
+модули progTest локально против «своих» домофонов со своим syslog-сервером,
+продлевает аренду и по ходу прогона отправляет записи результатов.
+
+    python agent.py --coordinator http://192.168.0.69:5000 --name bench-2 \\
+        --segment 192.168.1.0/24 --syslog-address 192.168.1.10:5514
+
+Задания для агентов ставятся через POST /api/jobs с полем ``agent``:
+``"*"`` — любому агенту, или имя конкретного агента.  Координатор и агент
+должны знать общий токен: ``AGENT_TOKEN`` в окружении или ``--token``.
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+
+import requests
+
+POLL_INTERVAL = 3.0       # пауза между запросами, когда заданий нет
+HEARTBEAT_INTERVAL = 30.0
+
+
+def _local_address(devices: list) -> str:
+    """IP этой машины в сторону первого домофона (для Syslog.Address)."""
+    host = devices[0].get('IP_CAMERA', '').split(':')[0] if devices else ''
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect((host or '192.0.2.1', 9))
+            return sock.getsockname()[0]
+        except OSError:
+            return '127.0.0.1'
+
+
+class Agent:
+    def __init__(self, coordinator: str, name: str, segment=None, syslog_address=None,
+                 poll: float = POLL_INTERVAL, token: str = ''):
+        self.url = coordinator.rstrip('/')
+        self.name = name
+        self.segment = segment or []
+        self.syslog_address = syslog_address
+        self.poll = poll
+        self.http = requests.Session()
+        self.http.headers['X-Agent-Token'] = token
+        self._pending = []
+        self._pending_lock = threading.Lock()
+
+    def _post(self, path: str, payload: dict, timeout: float = 30):
+        return self.http.post(f'{self.url}{path}', json=dict(payload, agent=self.name), timeout=timeout)
+
+    def _take_pending(self) -> list:
+        with self._pending_lock:
+            records, self._pending = self._pending, []
+        return records
+
+    def _on_result(self, result) -> None:
+        with self._pending_lock:
+            self._pending.append(result.to_dict())
+
+    def _heartbeat(self, job_id: str, stop: threading.Event, lost: threading.Event) -> None:
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            records = self._take_pending()
+            try:
+                r = self._post(f'/api/agents/jobs/{job_id}/heartbeat', {'results': records})
+            except requests.RequestException as e:
+                print(f'[agent {self.name}] Координатор недоступен: {e}')
+                with self._pending_lock:
+                    self._pending[:0] = records
+                continue
+            if r.status_code == 409:
+                print(f'[agent {self.name}] Аренда задания {job_id} потеряна')
+                lost.set()
+                return
+
+    def run_once(self) -> bool:
+        """Claim and execute one job; False if the queue had nothing for us."""
+        r = self._post('/api/agents/claim', {'segment': self.segment})
+        if r.status_code == 204:
+            return False
+        r.raise_for_status()
+        job = r.json()
+        print(f"[agent {self.name}] Задание {job['id']} ({job['kind']}), домофонов: {len(job['devices'])}")
+
+        os.environ['SYSLOG_ADDRESS'] = self.syslog_address or \
+            f"{_local_address(job['devices'])}:{os.environ.get('SYSLOG_PORT', 5514)}"
+        import jobs
+
+        stop, lost = threading.Event(), threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job['id'], stop, lost), daemon=True).start()
+        result = error = None
+        try:
+            result = jobs.execute(job['kind'], job['params'], job['devices'], on_result=self._on_result)
+        except Exception as e:
+            error = str(e)
+        finally:
+            stop.set()
+        if not lost.is_set():
+            payload = {'result': result, 'error': error, 'results': self._take_pending()}
+            for attempt in range(5):
+                try:
+                    self._post(f"/api/agents/jobs/{job['id']}/finish", payload)
+                    break
+                except requests.RequestException as e:
+                    print(f'[agent {self.name}] Не удалось отправить результат: {e}')
+                    time.sleep(2 ** attempt)
+        self._take_pending()
+        return True
+
+    def serve_forever(self) -> None:
+        while True:
+            try:
+                if self.run_once():
+                    continue
+            except requests.RequestException as e:
+                print(f'[agent {self.name}] Координатор недоступен: {e}')
+            time.sleep(self.poll)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description='Агент удалённого запуска тестов')
+    parser.add_argument('--coordinator', required=True, help='адрес app.py, например http://host:5000')
+    parser.add_argument('--name', default=socket.gethostname(), help='имя агента (по умолчанию hostname)')
+    parser.add_argument('--segment', action='append', default=[],
+                        help='сеть домофонов агента в виде CIDR, можно несколько раз')
+    parser.add_argument('--syslog-address', help='host:port, куда домофонам слать syslog')
+    parser.add_argument('--syslog-port', type=int, help='UDP-порт локального syslog-сервера')
+    parser.add_argument('--poll', type=float, default=POLL_INTERVAL)
+    parser.add_argument('--token', default=os.environ.get('AGENT_TOKEN', ''),
+                        help='общий токен агентов (по умолчанию AGENT_TOKEN)')
+    args = parser.parse_args(argv)
+
+    # Настройки syslog_server читаются при импорте, поэтому задаём их до запуска заданий
+    if args.syslog_port:
+        os.environ['SYSLOG_PORT'] = str(args.syslog_port)
+    if not args.token:
+        parser.error('нужен токен агентов: --token или переменная AGENT_TOKEN')
+    Agent(args.coordinator, args.name, args.segment, args.syslog_address, args.poll,
+          args.token).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
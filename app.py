@@ -10,12 +10,15 @@ import json
 import zipfile
 from werkzeug.utils import secure_filename
 from io import BytesIO
-import acceptance as start
+import log_store
 from routes_extra import extra_bp
+import jobs
+from jobs import jobs_bp, start_workers
 from datetime import datetime
 
 app = Flask(__name__)
 app.register_blueprint(extra_bp)
+app.register_blueprint(jobs_bp)
 
 @app.route('/')
 def index():
@@ -29,33 +32,25 @@ def run_page():
 def tests_page():
     return render_template('tests.html')
 
-@app.route('/start1')
+@app.route('/start1', methods=['GET', 'POST'])
 def start1_view():
-    print(f"[{datetime.now()}] Запуск Acceptance теста через /start1")
-    result = start.run()
-    print(f"[{datetime.now()}] Acceptance тест завершен")
-    return jsonify(result=result)
+    return jobs.submit_response('acceptance')
 
-
-
-
-@app.route('/start1_progress')
+@app.route('/start1_progress', methods=['POST'])
 def start1_progress():
-    def generate():
-        devices = start.load_device_configs('config.txt')
-        total = len(devices)
-        if total == 0:
-            yield f"data: {json.dumps({'progress':100,'done':True,'result':'Нет устройств'})}\n\n"
-            return
-        # Имитируем прогресс, так как run() выполнит тест
-        for idx in range(1, total + 1):
-            pct = int(idx / total * 100)
-            yield f"data: {json.dumps({'progress':pct,'done':False})}\n\n"
-            time.sleep(0.1)
-        final = start.run()  # Выполняем тест один раз
-        yield f"data: {json.dumps({'progress':100,'done':True,'result':final})}\n\n"
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    """Acceptance-тест через очередь заданий; ход шагов — SSE /api/jobs/<id>/stream."""
+    return jobs.submit_response('acceptance')
 
+@app.route('/stop', methods=['POST'])
+def stop_view():
+    """Останавливает все идущие прогоны: шаги прерываются, домофоны получают
+    сообщение, уже полученные результаты остаются в логах.  Задания в
+    очереди отменяются, не начавшись."""
+    import cancel
+    stopped = cancel.cancel_all()
+    dropped = jobs.cancel_queued()
+    print(f"[{datetime.now()}] Остановка прогонов: {stopped}, отменено в очереди: {dropped}")
+    return jsonify(status='stopping' if stopped or dropped else 'idle', runs=stopped, queued=dropped)
 
 
 @app.route('/config', methods=['GET', 'POST'])
@@ -63,6 +58,12 @@ def config_page():
     config_path = os.path.join(os.getcwd(), 'config.txt')
     if request.method == 'POST':
         new_conf = request.form.get('config') or ''
+        import inventory
+        try:
+            inventory.parse(new_conf)
+        except inventory.InventoryError as e:
+            # Не сохраняем конфиг с ошибками, показываем их вместе с текстом
+            return render_template('config.html', config=new_conf, error=str(e)), 400
         with open(config_path, 'w', encoding='utf-8') as f:
             f.write(new_conf)
         return redirect(url_for('config_page'))
@@ -74,20 +75,41 @@ def config_page():
 def logs():
     return render_template('logs.html')
 
-@app.route('/api/logs')
-def api_logs_list():
-    logs_dir = os.path.join(os.getcwd(), 'logs')
+# Логи домофонов (syslog) отдаются теми же API под этим префиксом,
+# вместе с ротированными архивами .gz/.zst
+DEVICE_LOG_PREFIX = 'logsDomofon/'
+
+
+def _log_path(filename):
+    """Файл из logs/ или (с префиксом DEVICE_LOG_PREFIX) из logsDomofon/; None — вне их."""
+    if filename.startswith(DEVICE_LOG_PREFIX):
+        base, name = os.path.join(os.getcwd(), 'logsDomofon'), filename[len(DEVICE_LOG_PREFIX):]
+    else:
+        base, name = os.path.join(os.getcwd(), 'logs'), filename
+    base = os.path.realpath(base)
+    path = os.path.realpath(os.path.join(base, name))
+    return path if path.startswith(base + os.sep) else None
+
+
+def _list_files(directory, prefix='', skip=()):
     try:
-        files = sorted(os.listdir(logs_dir))
+        names = sorted(os.listdir(directory))
     except FileNotFoundError:
-        files = []
-    return jsonify(files=[f for f in files if os.path.isfile(os.path.join(logs_dir, f))])
+        return []
+    return [prefix + f for f in names
+            if os.path.isfile(os.path.join(directory, f)) and not f.endswith(skip)]
+
+@app.route('/api/logs')
+def api_logs_list():
+    files = _list_files(os.path.join(os.getcwd(), 'logs'))
+    # .idx — служебные индексы сегментов log_store
+    files += _list_files(os.path.join(os.getcwd(), 'logsDomofon'), DEVICE_LOG_PREFIX, skip=('.idx',))
+    return jsonify(files=files)
 
 @app.route('/api/logs/<path:filename>')
 def api_log_content(filename):
-    logs_dir = os.path.join(os.getcwd(), 'logs')
-    file_path = os.path.join(logs_dir, filename)
-    if not os.path.isfile(file_path):
+    file_path = _log_path(filename)
+    if not file_path or not os.path.isfile(file_path):
         return jsonify(error='File not found'), 404
     ext = os.path.splitext(filename)[1].lower()
     if ext in ['.jpg', '.jpeg', '.png', '.gif']:
@@ -96,24 +118,80 @@ def api_log_content(filename):
             filename=filename,
             url=url_for('download_log', filename=filename)
         )
-    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-        content = f.read()
+    if ext in log_store.COMPRESSED_SUFFIXES:
+        content = ''.join(log_store.iter_lines(file_path))
+    else:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            content = f.read()
     return jsonify(
         type='text',
         filename=filename,
         content=content
     )
 
+@app.route('/api/results/<path:filename>')
+def api_results(filename):
+    """Записи результатов прогона из logs/<name>.jsonl."""
+    from results import read_results
+    file_path = os.path.join(os.getcwd(), 'logs', filename)
+    if not filename.endswith('.jsonl') or not os.path.isfile(file_path):
+        return jsonify(error='File not found'), 404
+    return jsonify(results=[r.to_dict() for r in read_results(file_path)])
+
+@app.route('/api/screenshots/<name>')
+def api_screenshot_pack(name):
+    """Индекс архива скриншотов logs/screenshots/<name>.pack."""
+    from progTest import _artifacts
+    pack_path = os.path.join(os.getcwd(), _artifacts.ARTIFACT_DIR, secure_filename(name) + '.pack')
+    if not os.path.isfile(pack_path):
+        return jsonify(error='File not found'), 404
+    return jsonify(frames=list(_artifacts.read_index(pack_path)))
+
+@app.route('/api/screenshots/<name>/<int:number>')
+def api_screenshot_frame(name, number):
+    """Кадр номер ``number`` из архива скриншотов."""
+    from progTest import _artifacts
+    pack_path = os.path.join(os.getcwd(), _artifacts.ARTIFACT_DIR, secure_filename(name) + '.pack')
+    if not os.path.isfile(pack_path):
+        return jsonify(error='File not found'), 404
+    from progTest import _jpeg
+    for entry in _artifacts.read_index(pack_path):
+        if entry['n'] == number:
+            data = _artifacts.read_frame(pack_path, entry)
+            # В архиве есть и неудачные ответы (HTML ошибки и т.п.): как картинку
+            # отдаём только image/*, остальное — для скачивания, не для показа
+            mimetype = entry.get('type') or ('image/jpeg' if _jpeg.is_jpeg(data) else '')
+            if not mimetype.lower().startswith('image/'):
+                mimetype = 'application/octet-stream'
+            return Response(data, mimetype=mimetype)
+    return jsonify(error='Frame not found'), 404
+
+@app.route('/api/syslog/metrics')
+def api_syslog_metrics():
+    from syslog_server import syslog_metrics
+    return jsonify(syslog_metrics())
+
+@app.route('/api/syslog/<ip>')
+def api_syslog_day(ip):
+    """Логи домофона за день (?day=dd.mm.yyyy), архивы распаковываются потоком."""
+    from syslog_server import iter_device_log
+    day = request.args.get('day') or datetime.now().strftime('%d.%m.%Y')
+    return Response(stream_with_context(iter_device_log(ip, day)), mimetype='text/plain')
+
 @app.route('/api/logs/download/<path:filename>')
 def download_log(filename):
-    logs_dir = os.path.join(os.getcwd(), 'logs')
-    return send_from_directory(logs_dir, filename, as_attachment=True)
+    file_path = _log_path(filename)
+    if not file_path or not os.path.isfile(file_path):
+        return jsonify(error='File not found'), 404
+    return send_from_directory(os.path.dirname(file_path), os.path.basename(file_path), as_attachment=True)
 
 @app.route('/api/logs/delete/<path:filename>', methods=['DELETE'])
 def delete_log(filename):
-    logs_dir = os.path.join(os.getcwd(), 'logs')
-    path = os.path.join(logs_dir, filename)
-    if not os.path.isfile(path):
+    if filename.startswith(DEVICE_LOG_PREFIX):
+        # Сегменты пишет и сжимает syslog_server, удаляются они по сроку хранения
+        return jsonify(success=False, error='Логи домофонов удаляются автоматически'), 403
+    path = _log_path(filename)
+    if not path or not os.path.isfile(path):
         return jsonify(success=False, error='Файл не найден'), 404
     try:
         os.remove(path)
@@ -139,14 +217,16 @@ def download_all_logs():
 
 @app.route('/api/logs/analyze/<path:filename>', methods=['POST'])
 def analyze_log(filename):
-    logs_dir = os.path.join(os.getcwd(), 'logs')
-    file_path = os.path.join(logs_dir, filename)
-    if not os.path.isfile(file_path):
+    file_path = _log_path(filename)
+    if not file_path or not os.path.isfile(file_path):
         return jsonify(error='Файл не найден'), 404
 
     try:
         import log_analyzer
-        answer = log_analyzer.analyze_file(file_path)
+        if file_path.endswith(log_store.COMPRESSED_SUFFIXES):
+            answer = log_analyzer.analyze_text(''.join(log_store.iter_lines(file_path)))
+        else:
+            answer = log_analyzer.analyze_file(file_path)
         return jsonify(answer=answer)
     except FileNotFoundError:
         return jsonify(error='Файл не найден'), 404
@@ -160,11 +240,54 @@ def api_tests_list():
 
 @app.route('/api/tests/run', methods=['POST'])
 def api_tests_run():
-    import tests_runner
     data = request.get_json() or {}
-    selected = data.get('tests', [])
-    result = tests_runner.run_selected_tests(selected)
-    return jsonify(result=result)
+    workers = data.get('workers')
+    return jobs.submit_response('tests', {'tests': data.get('tests', []),
+                                          'workers': int(workers) if workers else None})
+
+@app.route('/api/tests/stream')
+def api_tests_stream():
+    """Queue a ``tests`` job and stream an SSE event per finished test.
+
+    The job goes through the queue like /api/tests/run, so it waits for
+    the device leases instead of testing an intercom that another job is
+    already using.
+    """
+    selected = request.args.getlist('tests')
+    workers = request.args.get('workers', type=int)
+    start_workers()
+
+    def sse(event):
+        return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    def generate():
+        try:
+            job_id = jobs.submit('tests', {'tests': selected, 'workers': workers})
+        except ValueError as e:
+            yield sse({'type': 'error', 'text': str(e)})
+            yield sse({'type': 'done', 'progress': 100, 'done': True})
+            return
+        yield sse({'type': 'queued', 'job': job_id})
+        total = None
+        finished = 0
+        for event in jobs.follow(job_id):
+            event = dict(event)
+            if event['type'] == 'start':
+                total = event['devices'] * event['tests']
+            elif event['type'] == 'result':
+                finished += 1
+                if total:
+                    event['progress'] = int(finished / total * 100)
+            yield sse(event)
+        job = jobs.get(job_id)
+        if job['status'] == 'failed':
+            yield sse({'type': 'error', 'text': f"Ошибка: {job['error']}"})
+        elif job['status'] == 'cancelled':
+            yield sse({'type': 'warning', 'text': 'Прогон остановлен.'})
+        yield sse({'type': 'done', 'progress': 100, 'done': True, 'job': job_id, 'status': job['status']})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
 if __name__ == '__main__':
+    start_workers()
     app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
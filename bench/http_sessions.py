@@ -0,0 +1,102 @@
+"""Соединения и задержка запросов к домофону: голый requests против progTest._http.
+
+Поднимает локальный «домофон» (HTTP/1.1 с keep-alive и Basic-авторизацией,
+``/image.jpg``), на установку каждого TCP-соединения тратит ``--setup`` мс —
+как слабый процессор камеры.  Делает ``--requests`` запросов так, как их
+делает тест скриншотов: раньше ``requests.get`` на каждый, теперь через
+сессию домофона.  Печатает число соединений, время и p50/p95 задержки.
+
+Запуск из корня проекта::
+
+    python -m bench.http_sessions --requests 200 --setup 20
+"""
+import argparse
+import statistics
+import threading
+import time
+from base64 import b64encode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from progTest import _http
+
+LOGIN, PASSWORD = 'admin', '123456'
+_IMAGE = b'\xff\xd8' + bytes(48 * 1024) + b'\xff\xd9'
+
+
+class _FakeDevice(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True   # иначе keep-alive упирается в delayed ACK клиента
+    connections = 0
+    setup_delay = 0.02
+    _lock = threading.Lock()
+    _auth = 'Basic ' + b64encode(f'{LOGIN}:{PASSWORD}'.encode()).decode()
+
+    def setup(self):
+        with _FakeDevice._lock:
+            _FakeDevice.connections += 1
+        time.sleep(self.setup_delay)
+        super().setup()
+
+    def do_GET(self):
+        if self.headers.get('Authorization') != self._auth:
+            self.send_response(401)
+            self.send_header('WWW-Authenticate', 'Basic realm="device"')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(_IMAGE)))
+        self.end_headers()
+        self.wfile.write(_IMAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+def _bare(url, n):
+    for _ in range(n):
+        t0 = time.perf_counter()
+        requests.get(url, auth=(LOGIN, PASSWORD), timeout=5).content
+        yield time.perf_counter() - t0
+
+
+def _pooled(url, ip, n):
+    http = _http.session(ip, LOGIN, PASSWORD)
+    for _ in range(n):
+        t0 = time.perf_counter()
+        http.get(url, timeout=_http.timeout(5)).content
+        yield time.perf_counter() - t0
+
+
+def bench(count, setup_ms):
+    _FakeDevice.setup_delay = setup_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeDevice)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ip = f'127.0.0.1:{server.server_port}'
+    url = f'http://{ip}/image.jpg'
+    print(f'{"способ":>16} {"соединений":>11} {"время, с":>9} {"p50, мс":>8} {"p95, мс":>8}')
+    try:
+        for label, samples in (('requests.get', lambda: _bare(url, count)),
+                               ('_http.session', lambda: _pooled(url, ip, count))):
+            _FakeDevice.connections = 0
+            t0 = time.perf_counter()
+            latencies = sorted(samples())
+            wall = time.perf_counter() - t0
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(f'{label:>16} {_FakeDevice.connections:>11} {wall:>9.2f} '
+                  f'{statistics.median(latencies) * 1000:>8.1f} {p95 * 1000:>8.1f}')
+    finally:
+        _http.close()
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--setup', type=float, default=20, help='установка соединения на «домофоне», мс')
+    args = parser.parse_args()
+    bench(args.requests, args.setup)
@@ -0,0 +1,122 @@
+"""Проверка кадров скриншотов: PIL против разбора маркеров JPEG.
+
+Для каждого способа печатает время на кадр (целые кадры) и сколько
+испорченных кадров он отбраковал.  Порча: обрезка посередине и в конце,
+потерянный EOI, битая длина сегмента, нулевой размер в SOF, нет SOI и
+испорченные байты внутри скана (их видит только полное декодирование).
+
+Кадры — синтетические (шум поверх градиента, как у ночной камеры) или
+настоящие: каталог с ``.jpg`` либо архив ``.pack`` из logs/screenshots.
+Запуск из корня проекта::
+
+    python -m bench.jpeg_validate --runs 200
+    python -m bench.jpeg_validate --frames logs/screenshots/192.168.0.50_85_20250101_120000_000000.pack
+"""
+import argparse
+import glob
+import os
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from progTest import _artifacts, _jpeg
+
+DECODE_EVERY = 100
+
+
+def _synthetic():
+    frames = []
+    for size in ((640, 480), (1280, 720), (1920, 1080)):
+        noise = Image.effect_noise(size, 20).convert('RGB')
+        gradient = Image.linear_gradient('L').resize(size).convert('RGB')
+        buf = BytesIO()
+        Image.blend(noise, gradient, 0.7).save(buf, 'JPEG', quality=80)
+        frames.append(buf.getvalue())
+    return frames
+
+
+def _load(path):
+    if path.endswith('.pack'):
+        return [_artifacts.read_frame(path, e) for e in _artifacts.read_index(path) if e['ok'] and not e['dup']]
+    frames = []
+    for name in sorted(glob.glob(os.path.join(path, '*.jp*g'))):
+        with open(name, 'rb') as f:
+            frames.append(f.read())
+    return frames
+
+
+def _corrupt(frame):
+    sof = frame.find(b'\xff\xc0')
+    sos = frame.find(b'\xff\xda')
+    bad_length = bytearray(frame)
+    bad_length[4:6] = b'\xff\xf0'                       # длина первого сегмента за концом кадра
+    zero_size = bytearray(frame)
+    zero_size[sof + 5:sof + 9] = bytes(4)               # высота и ширина 0
+    scan_noise = bytearray(frame)
+    middle = (sos + len(frame)) // 2
+    scan_noise[middle:middle + 64] = bytes(64)          # испорченные данные скана
+    return {
+        'обрезан на 50%': frame[:len(frame) // 2],
+        'обрезан на 99%': frame[:len(frame) * 99 // 100],
+        'нет EOI': frame[:-2],
+        'битая длина': bytes(bad_length),
+        'нулевой SOF': bytes(zero_size),
+        'нет SOI': frame[2:],
+        'мусор в скане': bytes(scan_noise),
+    }
+
+
+def _pil_verify(data):
+    Image.open(BytesIO(data)).verify()
+
+
+def _sampled():
+    counter = [0]
+
+    def check(data):
+        _jpeg.validate(data)
+        counter[0] += 1
+        if counter[0] % DECODE_EVERY == 1:
+            _jpeg.decode(data)
+    return check
+
+
+def _rejects(check, data):
+    try:
+        check(data)
+    except Exception:
+        return True
+    return False
+
+
+def bench(frames, runs):
+    methods = [('PIL verify (было)', _pil_verify), ('PIL decode', _jpeg.decode),
+               ('_jpeg.validate', _jpeg.validate), (f'validate + decode 1/{DECODE_EVERY}', _sampled())]
+    corrupted = [(kind, data) for frame in frames for kind, data in _corrupt(frame).items()]
+    kinds = list(dict.fromkeys(kind for kind, _ in corrupted))
+    print(f'кадров: {len(frames)}, средний размер {sum(map(len, frames)) // len(frames) // 1024} КБ, '
+          f'испорченных: {len(corrupted)}')
+    print(f'{"способ":>26} {"мкс/кадр":>9} {"отбраковано":>12}  ' + ', '.join(kinds))
+    for label, check in methods:
+        for frame in frames:
+            check(frame)    # целые кадры должны проходить
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            for frame in frames:
+                check(frame)
+        per_frame = (time.perf_counter() - t0) / (runs * len(frames)) * 1e6
+        caught = {kind: 0 for kind in kinds}
+        for kind, data in corrupted:
+            caught[kind] += _rejects(check, data)
+        total = sum(caught.values())
+        detail = ', '.join(f'{caught[kind]}/{len(frames)}' for kind in kinds)
+        print(f'{label:>26} {per_frame:>9.1f} {f"{total}/{len(corrupted)}":>12}  {detail}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', help='каталог с .jpg или архив .pack (по умолчанию синтетические кадры)')
+    parser.add_argument('--runs', type=int, default=100)
+    args = parser.parse_args()
+    bench(_load(args.frames) if args.frames else _synthetic(), args.runs)
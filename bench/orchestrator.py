@@ -0,0 +1,113 @@
+"""Масштабирование прогона по числу домофонов: память и время.
+
+Сценарий имитирует ``handle_one``: семь шагов, каждый ждёт «ответа
+домофона» (``time.sleep``) и немного считает.  Сравниваются старый способ
+(``multiprocessing.Pool`` на процесс на домофон) и ``orchestrator`` в
+режиме потоков с ограничением параллельности.  Память — пиковая суммарная
+PSS (или RSS, если PSS недоступна) процесса и его потомков.
+
+Запуск из корня проекта (Linux)::
+
+    python -m bench.orchestrator --devices 10 50 200 --step 0.2 --concurrency 64
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+import Regression  # noqa: F401 — те же импорты, что у реального прогона (requests, bs4, ...)
+from orchestrator import run_devices
+
+_STEPS = 7
+_step_delay = 0.2
+
+
+def _fake_handle(cfg):
+    out = []
+    for step in range(_STEPS):
+        time.sleep(_step_delay)
+        out.append(json.dumps({'step': step, 'cfg': cfg, 'data': list(range(200))}))
+    return len(out)
+
+
+def _memory_kb(pid):
+    for name, key in (('smaps_rollup', 'Pss:'), ('status', 'VmRSS:')):
+        try:
+            with open(f'/proc/{pid}/{name}') as f:
+                for line in f:
+                    if line.startswith(key):
+                        return int(line.split()[1])
+        except OSError:
+            continue
+    return 0
+
+
+def _children(pid):
+    found = []
+    try:
+        for tid in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{tid}/children') as f:
+                found.extend(int(c) for c in f.read().split())
+    except OSError:
+        pass
+    return found
+
+
+def _tree_kb(pid):
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        total += _memory_kb(p)
+        stack.extend(_children(p))
+    return total
+
+
+def _measure(fn):
+    peak = [0]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            peak[0] = max(peak[0], _tree_kb(os.getpid()))
+            stop.wait(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    t0 = time.perf_counter()
+    fn()
+    wall = time.perf_counter() - t0
+    stop.set()
+    sampler.join()
+    return wall, peak[0] / 1024
+
+
+def _legacy(devices):
+    with multiprocessing.Pool(processes=len(devices)) as pool:
+        list(pool.imap(_fake_handle, devices))
+
+
+def bench(counts, concurrency, skip_legacy_above):
+    print(f'{"домофонов":>10} {"режим":>22} {"время, с":>9} {"память, МБ":>11}')
+    for n in counts:
+        devices = [{'IP_CAMERA': f'10.0.{i // 250}.{i % 250 + 1}:85'} for i in range(n)]
+        runs = [(f'threads (cap {concurrency})',
+                 lambda: list(run_devices(_fake_handle, devices, concurrency, 'threads')))]
+        if n <= skip_legacy_above:
+            runs.insert(0, ('Pool на домофон', lambda: _legacy(devices)))
+        for label, fn in runs:
+            wall, mem = _measure(fn)
+            print(f'{n:>10} {label:>22} {wall:>9.2f} {mem:>11.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--step', type=float, default=_step_delay, help='«ответ домофона», с')
+    parser.add_argument('--legacy-max', type=int, default=200,
+                        help='не запускать Pool на домофон для большего числа устройств')
+    args = parser.parse_args()
+    _step_delay = args.step
+    bench(args.devices, args.concurrency, args.legacy_max)
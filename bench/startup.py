@@ -0,0 +1,44 @@
+"""Холодный старт веб-приложения.
+
+Каждый замер — отдельный процесс Python: ``import app`` и первый запрос
+списка тестов (``tests_runner.list_tests()``).  Печатает медиану и число
+загруженных модулей.
+
+Запуск из корня проекта::
+
+    python -m bench.startup --runs 7
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+_PROBE = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+import tests_runner
+tests_runner.list_tests()
+t2 = time.perf_counter()
+print(json.dumps({'app': t1 - t0, 'tests': t2 - t0, 'modules': len(sys.modules)}))
+'''
+
+
+def bench(runs):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', _PROBE], capture_output=True,
+                             text=True, check=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    app_ms = statistics.median(s['app'] for s in samples) * 1000
+    tests_ms = statistics.median(s['tests'] for s in samples) * 1000
+    print(f"import app: {app_ms:.0f} мс; app + список тестов: {tests_ms:.0f} мс; "
+          f"модулей: {samples[-1]['modules']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    bench(parser.parse_args().runs)
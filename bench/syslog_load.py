@@ -0,0 +1,96 @@
+"""Нагрузочный генератор для syslog_server.
+
+Поднимает сервер с выбранным движком на отдельном порту, несколько потоков
+шлют RFC3164-сообщения от имени «домофонов» с заданной суммарной скоростью
+(0 — максимально быстро), затем считает записанные строки и выводит
+устойчивую скорость приёма и долю потерь для каждого движка.
+
+Запуск из корня проекта::
+
+    python -m bench.syslog_load --engines batch threading --seconds 5 --senders 8
+"""
+import argparse
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import syslog_server
+
+_PAYLOAD = b'<14>Jul  4 12:00:00 intercom app[123]: STAT/DOOR1: 0 seq='
+
+
+def _sender(port, stop, rate, counter, idx):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    addr = ('127.0.0.1', port)
+    interval = 1.0 / rate if rate else 0.0
+    sent = 0
+    next_ts = time.perf_counter()
+    while not stop.is_set():
+        sock.sendto(_PAYLOAD + f'{idx}-{sent}'.encode(), addr)
+        sent += 1
+        if interval:
+            next_ts += interval
+            delay = next_ts - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    counter[idx] = sent
+    sock.close()
+
+
+def _count_lines(log_dir):
+    total = 0
+    for name in os.listdir(log_dir):
+        if name.endswith('.log') and name != 'server.log':
+            with open(os.path.join(log_dir, name), 'rb') as f:
+                total += sum(1 for _ in f)
+    return total
+
+
+def run_engine(engine, seconds, senders, rate, port, rcvbuf):
+    log_dir = tempfile.mkdtemp()
+    syslog_server._LOG_DIR = log_dir
+    syslog_server._PORT = port
+    syslog_server.start_syslog_server(engine=engine, rcvbuf=rcvbuf)
+    time.sleep(0.3)
+    try:
+        stop = threading.Event()
+        counter = [0] * senders
+        per_sender = rate / senders if rate else 0
+        threads = [threading.Thread(target=_sender, args=(port, stop, per_sender, counter, i))
+                   for i in range(senders)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        # Даём серверу дописать очередь
+        time.sleep(1.0)
+    finally:
+        syslog_server.shutdown_syslog_server()
+    received = _count_lines(log_dir)
+    shutil.rmtree(log_dir, ignore_errors=True)
+    sent = sum(counter)
+    drop = (sent - received) / sent * 100 if sent else 0.0
+    print(f"{engine:>9}: отправлено {sent:,}, записано {received:,} "
+          f"({received / elapsed:,.0f} сообщ/с), потери {drop:.2f}%")
+    return sent, received
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--engines', nargs='+', default=['batch', 'threading'])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--senders', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=0,
+                        help='суммарная скорость, сообщ/с (0 — без ограничения)')
+    parser.add_argument('--port', type=int, default=15514)
+    parser.add_argument('--rcvbuf', type=int, default=syslog_server._RCVBUF)
+    args = parser.parse_args()
+    for engine in args.engines:
+        run_engine(engine, args.seconds, args.senders, args.rate, args.port, args.rcvbuf)
@@ -0,0 +1,87 @@
+"""Сравнение пропускной способности записи логов syslog.
+
+``legacy`` — прежний обработчик: на каждый датаграм makedirs, два strftime,
+open/write/flush/close.  ``buffered`` — ``_LogWriter`` из syslog_server.
+
+Запуск из корня проекта::
+
+    python -m bench.syslog_writer --messages 50000 --devices 32
+"""
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import syslog_server
+
+# Разборщик прежнего обработчика (сервер теперь разбирает через syslog_parser)
+RFC3164_RE = re.compile(r'<(\d+)>([A-Z][a-z]{2}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2})\s+([^ ]+)\s+(.*)')
+
+
+def _legacy_handle(log_dir, raw, client_address):
+    data = raw.decode('utf-8', errors='replace').strip()
+    ip, port = client_address
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    match = RFC3164_RE.match(data)
+    if match:
+        pri = int(match.group(1))
+        line = (
+            f"{now} [{ip}:{port}] PRI={pri} (fac={pri >> 3}, sev={pri & 7}), "
+            f"time={match.group(2)}, host={match.group(3)}, msg={match.group(4)}\n"
+        )
+        path = os.path.join(log_dir, f"{ip}_{datetime.now().strftime('%d.%m.%Y')}.log")
+    else:
+        line = f"{now} [{ip}:{port}] RAW: {data}\n"
+        path = os.path.join(log_dir, 'raw.log')
+    os.makedirs(log_dir, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line)
+        f.flush()
+
+
+def _datagrams(messages, devices):
+    payload = b'<14>Jul  4 12:00:00 intercom app[123]: STAT/DOOR1: 0 some payload text'
+    return [(payload, (f'10.0.{i // 250}.{i % 250 + 1}', 514))
+            for i in (n % devices for n in range(messages))]
+
+
+def bench(messages, devices):
+    grams = _datagrams(messages, devices)
+    results = {}
+
+    tmp = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        for raw, addr in grams:
+            _legacy_handle(tmp, raw, addr)
+        results['legacy'] = time.perf_counter() - start
+    finally:
+        shutil.rmtree(tmp)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        writer = syslog_server._LogWriter(tmp)
+        writer.start()
+        start = time.perf_counter()
+        for raw, addr in grams:
+            syslog_server._process_datagram(raw, addr, writer)
+        writer.close()
+        results['buffered'] = time.perf_counter() - start
+    finally:
+        shutil.rmtree(tmp)
+
+    for name, elapsed in results.items():
+        print(f"{name:>9}: {elapsed:.3f} c, {messages / elapsed:,.0f} сообщ/с")
+    print(f"ускорение: x{results['legacy'] / results['buffered']:.1f}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--devices', type=int, default=32)
+    args = parser.parse_args()
+    bench(args.messages, args.devices)
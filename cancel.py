@@ -0,0 +1,144 @@
+"""Кооперативная отмена прогона и бюджеты времени шагов.
+
+`CancelToken` передаётся в функции progTest аргументом ``cancel``.  Вместо
+``time.sleep`` они вызывают ``cancel.sleep`` (просыпается сразу при
+остановке), таймауты HTTP берут из ``cancel.timeout(...)``, а между этапами
+вызывают ``cancel.check()``.  Токен шага (`CancelToken.child`) разделяет
+отмену с токеном прогона и добавляет свой дедлайн.  По остановке или
+истечению дедлайна бросается `Cancelled` / `DeadlineExceeded`.
+
+Все запущенные прогоны регистрируются здесь; `cancel_all` (маршрут
+``POST /stop``) отменяет их.
+"""
+import threading
+import time
+from typing import Optional, Set
+
+# Как часто длинные ожидания проверяют отмену, если ждут не на токене
+POLL_INTERVAL = 0.25
+
+
+class Cancelled(BaseException):
+    """The run was stopped.
+
+    Derives from ``BaseException`` (like ``asyncio.CancelledError``) so the
+    ``except Exception`` blocks in the tests do not swallow it.
+    """
+
+
+class DeadlineExceeded(Cancelled):
+    """The step ran out of its time budget."""
+
+
+class CancelToken:
+    __slots__ = ('_event', 'deadline')
+
+    def __init__(self, deadline: Optional[float] = None, _shared: Optional[list] = None):
+        # _shared = [Event, reason]: общий для прогона и всех его шагов
+        self._event = _shared or [threading.Event(), '']
+        self.deadline = deadline
+
+    def child(self, budget: Optional[float] = None) -> 'CancelToken':
+        """Token for a step: same cancellation, deadline at most ``budget`` seconds away."""
+        deadline = self.deadline
+        if budget is not None:
+            step_deadline = time.time() + budget
+            deadline = step_deadline if deadline is None else min(deadline, step_deadline)
+        return CancelToken(deadline, self._event)
+
+    def cancel(self, reason: str = 'Остановлено пользователем') -> None:
+        self._event[1] = reason
+        self._event[0].set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event[0].is_set()
+
+    @property
+    def reason(self) -> str:
+        return self._event[1]
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.time()
+
+    def check(self) -> None:
+        """Raise if the run was stopped or the step is past its deadline."""
+        if self._event[0].is_set():
+            raise Cancelled(self._event[1])
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise DeadlineExceeded('превышено время шага')
+
+    def timeout(self, default: float) -> float:
+        """``default`` capped by the time left before the deadline."""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return max(0.1, min(default, remaining))
+
+    def raise_if_stopped(self) -> None:
+        """Like :meth:`check`, but ignores the deadline (for waits with their own timeout)."""
+        if self._event[0].is_set():
+            raise Cancelled(self._event[1])
+
+    def wait(self, seconds: float) -> None:
+        """Sleep up to ``seconds``; raise only if the run is stopped meanwhile."""
+        self._event[0].wait(seconds)
+        self.raise_if_stopped()
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep, waking up (and raising) as soon as the run is stopped."""
+        self.check()
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            self._event[0].wait(max(0.0, remaining))
+        else:
+            self._event[0].wait(seconds)
+        self.check()
+
+    def __getstate__(self):
+        raise TypeError('CancelToken действует только внутри одного процесса')
+
+
+def sleep(seconds: float, cancel: Optional[CancelToken] = None) -> None:
+    """``time.sleep`` that honours ``cancel`` when one is given."""
+    if cancel is None:
+        time.sleep(seconds)
+    else:
+        cancel.sleep(seconds)
+
+
+def check(cancel: Optional[CancelToken]) -> None:
+    if cancel is not None:
+        cancel.check()
+
+
+def raise_if_stopped(cancel: Optional[CancelToken]) -> None:
+    if cancel is not None:
+        cancel.raise_if_stopped()
+
+
+def timeout(default: float, cancel: Optional[CancelToken] = None) -> float:
+    return default if cancel is None else cancel.timeout(default)
+
+
+_active: Set[CancelToken] = set()
+_active_lock = threading.Lock()
+
+
+def register(token: CancelToken) -> None:
+    with _active_lock:
+        _active.add(token)
+
+
+def unregister(token: CancelToken) -> None:
+    with _active_lock:
+        _active.discard(token)
+
+
+def cancel_all(reason: str = 'Остановлено пользователем') -> int:
+    """Cancel every registered run; returns how many were running."""
+    with _active_lock:
+        tokens = list(_active)
+    for token in tokens:
+        token.cancel(reason)
+    return len(tokens)
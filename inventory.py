@@ -0,0 +1,226 @@
+"""Список домофонов из config.txt.
+
+Формат прежний: блоки ``KEY=VALUE``, разделённые строками из ``_``;
+строки, начинающиеся с ``#``, — комментарии (``#`` дальше в строке —
+часть значения, например в пароле).  Дополнительно:
+
+* блок с заголовком ``[defaults]`` задаёт значения для всех домофонов;
+* блок с заголовком ``[<группа>]`` задаёт значения группы; домофоны после
+  него относятся к ней (``GROUP=<группа>``) до следующей группы;
+* ``IP_CAMERA`` может описывать сразу много домофонов: диапазон
+  ``192.168.1.10-60:85`` или ``192.168.1.10-192.168.2.40:85`` и подсеть
+  ``10.0.0.0/22:85`` (адреса хостов).
+
+Пример стенда на тысячу домофонов::
+
+    [defaults]
+    LOGIN=admin
+    PASSWORD=123456
+    __________________
+    [bench]
+    MAX_SCREENSHOTS=5
+    __________________
+    IP_CAMERA=10.10.0.0/22:85
+
+Значение берётся из блока домофона, затем из группы, затем из
+``[defaults]``.  Разбор кэшируется по mtime файла; ошибки (нет
+обязательного поля, нечисловое значение, повтор адреса) собираются в одно
+`InventoryError` с номерами строк.
+"""
+import ipaddress
+import os
+import re
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+CONFIG_PATH = 'config.txt'
+REQUIRED = ('IP_CAMERA', 'LOGIN', 'PASSWORD')
+INT_FIELDS = ('MAX_SCREENSHOTS', 'TIME', 'RESET', 'AttemptDoorOpen', 'MAX_FIRMWARE_UPLOADS',
+              'SCREENSHOT_CONCURRENCY', 'SCREENSHOT_KEEP_EVERY')
+FLOAT_FIELDS = ('SCREENSHOT_RATE',)
+MAX_EXPANSION = 65536   # защита от опечатки вида 10.0.0.0/8
+
+_HEADER_RE = re.compile(r'^\[\s*([\w.-]+)\s*\]$')
+_RANGE_RE = re.compile(r'^(\d+\.\d+\.\d+\.)(\d+)-(\d+)$')
+_FLOAT_RE = re.compile(r'^\d+(\.\d+)?$')
+
+
+class InventoryError(ValueError):
+    """config.txt could not be parsed; the message lists every problem."""
+
+
+class Device(Mapping):
+    """One intercom: read-only mapping of its config keys.
+
+    Records of one block (and of its whole range) share the dicts with the
+    block and group values, so only the address is stored per device.
+    """
+
+    __slots__ = ('address', '_own', '_shared')
+
+    def __init__(self, address: str, own: dict, shared: dict):
+        self.address = address      # IP_CAMERA, «ip:port»
+        self._own = own             # значения блока домофона
+        self._shared = shared       # [defaults] + группа
+
+    @property
+    def host(self) -> str:
+        return self.address.split(':')[0]
+
+    def __getitem__(self, key: str) -> str:
+        if key == 'IP_CAMERA':
+            return self.address
+        if key in self._own:
+            return self._own[key]
+        return self._shared[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield 'IP_CAMERA'
+        for key in self._shared:
+            if key not in self._own:
+                yield key
+        yield from self._own
+
+    def __len__(self) -> int:
+        return 1 + len(self._shared.keys() | self._own.keys())
+
+    def to_dict(self) -> dict:
+        return dict(self)
+
+    def __reduce__(self):
+        return Device, (self.address, self._own, self._shared)
+
+    def __repr__(self) -> str:
+        return f'Device({self.address!r})'
+
+
+def expand_address(value: str) -> List[str]:
+    """``ip[:port]``, ``a.b.c.d-e``, ``a.b.c.d-a.b.c.e`` or ``net/prefix`` -> addresses."""
+    host, sep, port = value.partition(':')
+    if sep and not (port.isdigit() and 0 < int(port) < 65536):
+        raise ValueError(f'неверный порт: {port!r}')
+    suffix = f':{port}' if sep else ''
+    try:
+        if '/' in host:
+            network = ipaddress.IPv4Network(host, strict=False)
+            if network.num_addresses > MAX_EXPANSION:
+                raise ValueError(f'слишком большая подсеть: {host}')
+            hosts = list(network.hosts()) or [network.network_address]
+            return [f'{ip}{suffix}' for ip in hosts]
+        if '-' in host and host[:1].isdigit():
+            match = _RANGE_RE.match(host)
+            if match:
+                first = ipaddress.IPv4Address(match.group(1) + match.group(2))
+                last = ipaddress.IPv4Address(match.group(1) + match.group(3))
+            else:
+                start, _, end = host.partition('-')
+                first, last = ipaddress.IPv4Address(start), ipaddress.IPv4Address(end)
+            count = int(last) - int(first) + 1
+            if count < 1:
+                raise ValueError(f'пустой диапазон: {host}')
+            if count > MAX_EXPANSION:
+                raise ValueError(f'слишком большой диапазон: {host}')
+            return [f'{ipaddress.IPv4Address(int(first) + i)}{suffix}' for i in range(count)]
+    except ipaddress.AddressValueError as e:
+        raise ValueError(f'неверный адрес: {host} ({e})') from None
+    if not host or ' ' in host:
+        raise ValueError(f'неверный адрес: {value!r}')
+    return [value]
+
+
+def _blocks(text: str) -> Iterator[Tuple[int, Optional[str], List[Tuple[int, str, str]]]]:
+    """Yield ``(first_line, header, [(line_no, key, value), ...])`` per block."""
+    header, items, first = None, [], 0
+    for no, raw in enumerate(text.splitlines(), 1):
+        line = raw.strip()
+        if line.startswith('_'):
+            if header or items:
+                yield first, header, items
+            header, items, first = None, [], 0
+            continue
+        if not line or line.startswith('#'):
+            continue
+        first = first or no
+        match = _HEADER_RE.match(line)
+        if match:
+            header = match.group(1)
+            continue
+        if '=' not in line:
+            items.append((no, None, line))
+            continue
+        key, val = line.split('=', 1)
+        items.append((no, key.strip(), val.strip()))
+    if header or items:
+        yield first, header, items
+
+
+def parse(text: str, source: str = CONFIG_PATH) -> List[Device]:
+    """Parse config text into device records (raises `InventoryError`)."""
+    devices: List[Device] = []
+    errors: List[str] = []
+    seen: Dict[str, int] = {}
+    defaults: dict = {}
+    group: dict = {}
+    shared: dict = {}
+    for first, header, items in _blocks(text):
+        values = {}
+        for no, key, val in items:
+            if key is None:
+                errors.append(f'{source}:{no}: строка без «=»: {val!r}')
+            elif key in INT_FIELDS and not val.isdigit():
+                errors.append(f'{source}:{no}: {key} должно быть целым числом, а не {val!r}')
+            elif key in FLOAT_FIELDS and not _FLOAT_RE.match(val):
+                errors.append(f'{source}:{no}: {key} должно быть числом, а не {val!r}')
+            else:
+                values[key] = val
+        if header is not None:
+            if 'IP_CAMERA' in values:
+                errors.append(f'{source}:{first}: IP_CAMERA в блоке [{header}]')
+            if header == 'defaults':
+                defaults.update(values)
+            else:
+                group = dict(values, GROUP=header)
+            shared = {**defaults, **group}
+            continue
+        address = values.pop('IP_CAMERA', None)
+        missing = [key for key in REQUIRED[1:] if key not in values and key not in shared]
+        if not address:
+            missing.insert(0, 'IP_CAMERA')
+        if missing:
+            errors.append(f'{source}:{first}: нет обязательных полей: {", ".join(missing)}')
+            continue
+        try:
+            addresses = expand_address(address)
+        except ValueError as e:
+            errors.append(f'{source}:{first}: IP_CAMERA: {e}')
+            continue
+        for addr in addresses:
+            if addr in seen:
+                errors.append(f'{source}:{first}: {addr} уже описан в строке {seen[addr]}')
+                continue
+            seen[addr] = first
+            devices.append(Device(addr, values, shared))
+    if errors:
+        raise InventoryError('\n'.join(errors))
+    return devices
+
+
+_cache: Dict[str, tuple] = {}
+_cache_lock = threading.Lock()
+
+
+def load(path: str = CONFIG_PATH) -> List[Device]:
+    """Devices from ``path``; the file is parsed again only after it changes."""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == stamp:
+            return list(cached[1])
+    with open(path, 'r', encoding='utf-8') as f:
+        devices = tuple(parse(f.read(), os.path.basename(path)))
+    with _cache_lock:
+        _cache[path] = (stamp, devices)
+    return list(devices)
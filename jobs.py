@@ -0,0 +1,564 @@
+"""Очередь заданий на прогон тестов с арендой домофонов.
+
+Задание (``acceptance``, ``regression`` или ``tests``) сохраняется в SQLite
+и выполняется пулом фоновых потоков.  Перед запуском задание арендует все
+свои домофоны: два задания на непересекающихся домофонах идут параллельно,
+а задания на одном домофоне ждут друг друга.  Аренда продлевается, пока
+задание работает; после перезапуска сервера незавершённые задания снова
+встают в очередь.  Ход локального задания (процент и текущие шаги
+домофонов) отдаёт ``GET /api/jobs/<id>``; ``POST /stop`` отменяет идущие
+задания и ещё не начатые локальные — они получают статус ``cancelled``.
+
+Задание можно отдать удалённым агентам (``agent.py``): они забирают его по
+HTTP (``/api/agents/...``), выполняют на своём участке стенда со своим
+syslog-сервером, продлевают аренду heartbeat-запросами и присылают записи
+результатов.  Если агент пропал, аренда истекает и задание снова в очереди.
+Запросы агентов подписываются общим токеном ``AGENT_TOKEN`` (переменная
+окружения координатора и агентов, заголовок ``X-Agent-Token``); без него
+API агентов закрыто.  Имена ``local`` и ``local-*`` заняты локальными
+воркерами.
+"""
+import functools
+import hmac
+import ipaddress
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+import cancel as cancellation
+from cancel import Cancelled, CancelToken
+
+DB_PATH = os.path.join('state', 'jobs.sqlite3')
+JOB_WORKERS = 2          # сколько заданий выполнять одновременно
+LEASE_TTL = 300          # аренда истекает, если её не продлевать столько секунд
+POLL_INTERVAL = 1.0
+KINDS = ('acceptance', 'regression', 'tests')
+FINISHED = ('done', 'failed', 'cancelled')
+RESULTS_DIR = 'logs'     # записи результатов заданий: logs/job_<id>.jsonl
+AGENT_TOKEN = os.environ.get('AGENT_TOKEN', '')   # общий секрет API агентов
+LOCAL = 'local'          # target и префикс имён локальных воркеров
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id       TEXT PRIMARY KEY,
+    kind     TEXT NOT NULL,
+    params   TEXT NOT NULL,
+    devices  TEXT NOT NULL,
+    status   TEXT NOT NULL,
+    created  REAL NOT NULL,
+    started  REAL,
+    finished REAL,
+    worker   TEXT,
+    target   TEXT NOT NULL DEFAULT 'local',
+    result   TEXT,
+    error    TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created);
+CREATE TABLE IF NOT EXISTS leases (
+    device  TEXT PRIMARY KEY,
+    job_id  TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+'''
+
+jobs_bp = Blueprint('jobs', __name__)
+
+_wakeup = threading.Event()
+_workers: List[threading.Thread] = []
+_workers_lock = threading.Lock()
+# Ход заданий, которые сейчас выполняет этот процесс: id -> progress.Snapshot
+_live: Dict[str, object] = {}
+# События тестов (tests_runner on_event) для SSE-подписчиков: id -> _EventLog
+_event_logs: Dict[str, '_EventLog'] = {}
+_live_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(_SCHEMA)
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+    if 'target' not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN target TEXT NOT NULL DEFAULT 'local'")
+    return conn
+
+
+def _device_key(cfg: dict) -> str:
+    return cfg.get('IP_CAMERA', '').split(':')[0]
+
+
+def _row_to_dict(row: sqlite3.Row, with_result: bool = True) -> dict:
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['devices'] = [d.get('IP_CAMERA') for d in json.loads(job['devices'])]
+    if not with_result:
+        job.pop('result', None)
+    return job
+
+
+def results_path(job_id: str) -> str:
+    return os.path.join(RESULTS_DIR, f'job_{job_id}.jsonl')
+
+
+def submit(kind: str, params: Optional[dict] = None, devices: Optional[List[dict]] = None,
+           target: str = 'local') -> str:
+    """Store a new job and return its id.
+
+    ``devices`` are config dicts; by default all devices from ``config.txt``.
+    ``target`` is ``'local'`` (this server's workers), ``'*'`` (any agent)
+    or the name of a particular agent.
+    """
+    if kind not in KINDS:
+        raise ValueError(f'Неизвестный тип задания: {kind}')
+    if devices is None:
+        import Regression
+        devices = Regression.load_device_configs('config.txt')
+    if not devices:
+        raise ValueError('Нет домофонов для задания')
+    job_id = uuid.uuid4().hex[:12]
+    with _connect() as conn:
+        conn.execute(
+            'INSERT INTO jobs (id, kind, params, devices, status, created, target) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(params or {}, ensure_ascii=False),
+             json.dumps([dict(cfg) for cfg in devices], ensure_ascii=False), 'queued', time.time(), target),
+        )
+    _wakeup.set()
+    return job_id
+
+
+def get(job_id: str) -> Optional[dict]:
+    with _connect() as conn:
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return _row_to_dict(row) if row else None
+
+
+def list_jobs(limit: int = 50) -> List[dict]:
+    with _connect() as conn:
+        rows = conn.execute('SELECT * FROM jobs ORDER BY created DESC LIMIT ?', (limit,)).fetchall()
+    return [_row_to_dict(row, with_result=False) for row in rows]
+
+
+def _in_segment(keys: set, segment: Optional[List[str]]) -> bool:
+    if not segment:
+        return True
+    networks = [ipaddress.ip_network(net, strict=False) for net in segment]
+    try:
+        return all(any(ipaddress.ip_address(key) in net for net in networks) for key in keys)
+    except ValueError:
+        return False
+
+
+def claim(worker: str, targets=('local',), segment: Optional[List[str]] = None) -> Optional[sqlite3.Row]:
+    """Atomically pick the oldest queued job whose devices are all free.
+
+    Only jobs addressed to one of ``targets`` are considered; an agent may
+    also restrict itself to devices inside the ``segment`` networks.
+    """
+    conn = _connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        conn.execute('DELETE FROM leases WHERE expires < ?', (now,))
+        # Задания пропавших агентов: аренда истекла, а статус остался running
+        conn.execute("UPDATE jobs SET status = 'queued', started = NULL, worker = NULL "
+                     "WHERE status = 'running' AND id NOT IN (SELECT job_id FROM leases)")
+        busy = {row['device'] for row in conn.execute('SELECT device FROM leases')}
+        marks = ','.join('?' * len(targets))
+        rows = conn.execute(f"SELECT * FROM jobs WHERE status = 'queued' AND target IN ({marks}) "
+                            "ORDER BY created", tuple(targets))
+        for row in rows:
+            keys = {_device_key(cfg) for cfg in json.loads(row['devices'])}
+            if keys & busy or not _in_segment(keys, segment):
+                continue
+            conn.executemany('INSERT INTO leases (device, job_id, expires) VALUES (?, ?, ?)',
+                             [(key, row['id'], now + LEASE_TTL) for key in keys])
+            conn.execute("UPDATE jobs SET status = 'running', started = ?, worker = ? WHERE id = ?",
+                         (now, worker, row['id']))
+            conn.execute('COMMIT')
+            return row
+        conn.execute('COMMIT')
+        return None
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def _owns(conn: sqlite3.Connection, job_id: str, worker: str) -> bool:
+    row = conn.execute("SELECT worker FROM jobs WHERE id = ? AND status = 'running'", (job_id,)).fetchone()
+    return row is not None and bool(worker) and row['worker'] == worker
+
+
+def renew(job_id: str, worker: str) -> bool:
+    """Extend the leases of a running job; False if ``worker`` no longer owns it."""
+    with _connect() as conn:
+        if not _owns(conn, job_id, worker):
+            return False
+        conn.execute('UPDATE leases SET expires = ? WHERE job_id = ?', (time.time() + LEASE_TTL, job_id))
+    return True
+
+
+def finish(job_id: str, result: Optional[str] = None, error: Optional[str] = None, *,
+           worker: str, cancelled: bool = False) -> bool:
+    """Store the outcome of a job and release its device leases.
+
+    The status is ``failed`` with an ``error``, ``cancelled`` if the run was
+    stopped (its partial ``result`` is kept), ``done`` otherwise.
+
+    Returns False (and changes nothing) if ``worker`` no longer owns the job,
+    e.g. an agent reporting after its lease expired and the job was requeued.
+    """
+    with _connect() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        if not _owns(conn, job_id, worker):
+            conn.execute('ROLLBACK')
+            return False
+        conn.execute('UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? WHERE id = ?',
+                     ('failed' if error else 'cancelled' if cancelled else 'done',
+                      time.time(), result, error, job_id))
+        conn.execute('DELETE FROM leases WHERE job_id = ?', (job_id,))
+        conn.execute('COMMIT')
+    _wakeup.set()
+    return True
+
+
+def cancel_queued() -> int:
+    """Cancel local jobs that are still waiting in the queue; returns how many."""
+    with _connect() as conn:
+        return conn.execute("UPDATE jobs SET status = 'cancelled', finished = ? "
+                            "WHERE status = 'queued' AND target = 'local'", (time.time(),)).rowcount
+
+
+def add_results(job_id: str, records: List[dict]) -> None:
+    """Append result records (``TestResult.to_dict()``) to the job's JSONL file."""
+    from results import ResultSink, TestResult
+    with ResultSink(results_path(job_id)) as sink:
+        for record in records:
+            sink.write(TestResult.from_dict(record))
+
+
+def recover() -> int:
+    """Requeue local jobs left ``running`` by a previous server process.
+
+    Jobs held by agents keep their leases: the agents are still working.
+    """
+    with _connect() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        count = conn.execute("UPDATE jobs SET status = 'queued', started = NULL, worker = NULL "
+                             "WHERE status = 'running' AND target = 'local'").rowcount
+        conn.execute("DELETE FROM leases WHERE job_id NOT IN "
+                     "(SELECT id FROM jobs WHERE status = 'running')")
+        conn.execute('COMMIT')
+    return count
+
+
+def execute(kind: str, params: dict, devices: List[dict], on_result=None,
+            progress=None, cancel=None, on_event=None) -> str:
+    """Run one job in this process and return its text log.
+
+    Used by the local workers and by ``agent.py``; ``on_result`` receives
+    each ``TestResult`` as soon as it is known, step progress goes to
+    ``progress`` (`progress.Progress`), ``cancel`` stops the run.  For
+    ``tests`` jobs ``on_event`` also gets the raw ``tests_runner`` events.
+    """
+    if kind == 'acceptance':
+        import acceptance
+        return acceptance.run(devices=devices, on_result=on_result, concurrency=params.get('workers'),
+                              progress=progress, cancel=cancel)
+    if kind == 'regression':
+        import Regression
+        return Regression.run(devices=devices, on_result=on_result, concurrency=params.get('workers'),
+                              progress=progress, cancel=cancel)
+    import tests_runner
+
+    def relay(event):
+        if on_event:
+            on_event(event)
+        if progress is None:
+            return
+        # Тест отдельного прогона — один «шаг» домофона
+        if event['type'] == 'start':
+            progress.start(event['devices'], event['tests'])
+        elif event['type'] == 'result':
+            progress.step(event['device'], event['test'], 100, event['status'])
+    return tests_runner.run_selected_tests(params.get('tests', []), workers=params.get('workers'),
+                                           on_event=relay if progress or on_event else None,
+                                           devices=devices, on_result=on_result, cancel=cancel)
+
+
+class _EventLog:
+    """Events of one job, kept whole so a late SSE subscriber replays them."""
+
+    def __init__(self):
+        self.events: List[dict] = []
+        self.closed = False
+        self.subscribers = 0    # под _live_lock
+        self._cond = threading.Condition()
+
+    def put(self, event: dict) -> None:
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def read(self, start: int, timeout: float):
+        """Events after ``start`` (waits up to ``timeout``) and whether the log is closed."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.events) > start or self.closed, timeout)
+            return self.events[start:], self.closed
+
+
+def _event_log(job_id: str, subscribe: bool = False) -> _EventLog:
+    with _live_lock:
+        log = _event_logs.setdefault(job_id, _EventLog())
+        log.subscribers += subscribe
+        return log
+
+
+def follow(job_id: str, interval: float = POLL_INTERVAL):
+    """Yield the ``tests_runner`` events of a local job until it has finished.
+
+    The subscriber may connect before a worker picks the job up or after
+    it is done; events already published are replayed.
+    """
+    log = _event_log(job_id, subscribe=True)
+    seen = 0
+    try:
+        while True:
+            events, closed = log.read(seen, interval)
+            seen += len(events)
+            yield from events
+            job = get(job_id)
+            # Лог закрывается до записи статуса; без лога — задание завершилось
+            # до подписки или выполнено не здесь
+            if job is None or job['status'] in FINISHED:
+                events, _ = log.read(seen, 0)
+                yield from events
+                return
+            if closed:
+                time.sleep(min(interval, 0.1))
+    finally:
+        job = get(job_id)
+        with _live_lock:
+            log.subscribers -= 1
+            # Лог выполняемого задания остаётся для переподключения
+            running = not log.closed and job is not None and job['status'] == 'running'
+            if _event_logs.get(job_id) is log and not log.subscribers and not running:
+                _event_logs.pop(job_id)
+
+
+def _execute(row: sqlite3.Row, cancel) -> str:
+    from progress import Progress, Snapshot
+    from results import ResultSink
+    snapshot = Snapshot()
+    events = _event_log(row['id'])
+    with _live_lock:
+        _live[row['id']] = snapshot
+    try:
+        with ResultSink(results_path(row['id'])) as sink:
+            return execute(row['kind'], json.loads(row['params']), json.loads(row['devices']),
+                           on_result=sink.write, progress=Progress(snapshot), cancel=cancel,
+                           on_event=events.put)
+    finally:
+        events.close()
+        with _live_lock:
+            _live.pop(row['id'], None)
+            if _event_logs.get(row['id']) is events and not events.subscribers:
+                _event_logs.pop(row['id'])
+
+
+def _heartbeat(job_id: str, worker: str, stop: threading.Event) -> None:
+    while not stop.wait(LEASE_TTL / 3):
+        renew(job_id, worker)
+
+
+def _worker_loop(name: str) -> None:
+    while True:
+        try:
+            row = claim(name)
+        except sqlite3.Error as e:
+            print(f'[jobs] Ошибка очереди: {e}')
+            row = None
+        if row is None:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(row['id'], name, stop), daemon=True).start()
+        token = CancelToken()
+        cancellation.register(token)    # /stop достаёт задание и до начала прогона
+        try:
+            result = _execute(row, token)
+            finish(row['id'], result=result, worker=name, cancelled=token.cancelled)
+        except Cancelled as e:
+            finish(row['id'], result=f'Отменено: {e}', worker=name, cancelled=True)
+        except Exception as e:
+            finish(row['id'], error=str(e), worker=name)
+        finally:
+            cancellation.unregister(token)
+            stop.set()
+
+
+def start_workers(count: int = JOB_WORKERS) -> None:
+    """Requeue interrupted jobs and start the worker pool (idempotent)."""
+    with _workers_lock:
+        if _workers:
+            return
+        recovered = recover()
+        if recovered:
+            print(f'[jobs] Возвращено в очередь после перезапуска: {recovered}')
+        for i in range(count):
+            t = threading.Thread(target=_worker_loop, args=(f'{LOCAL}-{i}',), daemon=True)
+            t.start()
+            _workers.append(t)
+
+
+# ===================== API =====================
+
+def submit_response(kind: str, params: Optional[dict] = None):
+    """Queue a job on all configured devices; 202 with its id (or 400)."""
+    start_workers()
+    try:
+        job_id = submit(kind, params)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    print(f'[jobs] Задание {kind} поставлено в очередь: {job_id}')
+    return jsonify(id=job_id, status='queued'), 202
+
+
+@jobs_bp.route('/api/jobs', methods=['POST'])
+def api_submit():
+    start_workers()
+    data = request.get_json() or {}
+    kind = data.get('kind', 'tests')
+    devices = None
+    if data.get('devices'):
+        import Regression
+        wanted = set(data['devices'])
+        devices = [cfg for cfg in Regression.load_device_configs('config.txt')
+                   if cfg.get('IP_CAMERA') in wanted or _device_key(cfg) in wanted]
+        if not devices:
+            return jsonify(error='Указанные домофоны не найдены в config.txt'), 400
+    params = {'tests': data.get('tests', []), 'workers': data.get('workers')}
+    try:
+        job_id = submit(kind, params, devices, target=data.get('agent') or 'local')
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(id=job_id, status='queued'), 202
+
+
+@jobs_bp.route('/api/jobs')
+def api_list():
+    start_workers()
+    return jsonify(jobs=list_jobs())
+
+
+def _with_progress(job: dict) -> dict:
+    """Add ``progress`` and the live ``steps`` of a running job."""
+    job_id = job['id']
+    with _live_lock:
+        snapshot = _live.get(job_id)
+    if snapshot is not None:
+        state = snapshot.state()
+        job['progress'] = state['progress']
+        job['steps'] = state['devices']     # {ip: {step, percent}}
+    elif job['status'] in FINISHED:
+        job['progress'] = 100
+    else:
+        job['progress'] = 0
+    if os.path.isfile(results_path(job_id)):
+        job['results_file'] = os.path.basename(results_path(job_id))  # см. /api/results/<file>
+    return job
+
+
+@jobs_bp.route('/api/jobs/<job_id>')
+def api_get(job_id):
+    job = get(job_id)
+    if job is None:
+        return jsonify(error='Задание не найдено'), 404
+    return jsonify(_with_progress(job))
+
+
+@jobs_bp.route('/api/jobs/<job_id>/stream')
+def api_stream(job_id):
+    """SSE: ход задания (``progress``, ``steps``) до ``done: true`` с результатом."""
+    from progress import sse_stream
+    if get(job_id) is None:
+        return jsonify(error='Задание не найдено'), 404
+
+    def state():
+        job = _with_progress(get(job_id))
+        message = {'status': job['status'], 'progress': job['progress'], 'steps': job.get('steps', {}),
+                   'done': job['status'] in FINISHED}
+        if message['done']:
+            message['result'] = job.get('error') or job.get('result')
+        return message
+    return Response(stream_with_context(sse_stream(state)), mimetype='text/event-stream')
+
+
+# ===================== API агентов =====================
+
+def _agent_api(view):
+    """Check the shared token and the agent name; the view gets ``(data, agent, ...)``."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get('X-Agent-Token', '')
+        if not AGENT_TOKEN or not hmac.compare_digest(token.encode(), AGENT_TOKEN.encode()):
+            return jsonify(error='Неверный токен агента (AGENT_TOKEN)'), 403
+        data = request.get_json(silent=True) or {}
+        agent = data.get('agent')
+        if not agent or not isinstance(agent, str):
+            return jsonify(error='Не указано имя агента'), 400
+        if agent == LOCAL or agent.startswith(LOCAL + '-'):
+            return jsonify(error=f'Имя агента {agent!r} занято локальными воркерами'), 400
+        return view(data, agent, *args, **kwargs)
+    return wrapper
+
+
+@jobs_bp.route('/api/agents/claim', methods=['POST'])
+@_agent_api
+def api_agent_claim(data, agent):
+    """Выдать агенту задание: {agent, segment: [cidr, ...]} -> задание или 204."""
+    row = claim(agent, targets=('*', agent), segment=data.get('segment'))
+    if row is None:
+        return '', 204
+    return jsonify(id=row['id'], kind=row['kind'], params=json.loads(row['params']),
+                   devices=json.loads(row['devices']), lease_ttl=LEASE_TTL)
+
+
+@jobs_bp.route('/api/agents/jobs/<job_id>/heartbeat', methods=['POST'])
+@_agent_api
+def api_agent_heartbeat(data, agent, job_id):
+    """Продлить аренду и принять накопленные записи результатов."""
+    if not renew(job_id, agent):
+        return jsonify(error='Задание больше не принадлежит агенту'), 409
+    if data.get('results'):
+        add_results(job_id, data['results'])
+    return jsonify(ok=True)
+
+
+@jobs_bp.route('/api/agents/jobs/<job_id>/finish', methods=['POST'])
+@_agent_api
+def api_agent_finish(data, agent, job_id):
+    with _connect() as conn:
+        owned = _owns(conn, job_id, agent)
+    if not owned:
+        return jsonify(error='Задание больше не принадлежит агенту'), 409
+    if data.get('results'):
+        add_results(job_id, data['results'])
+    finish(job_id, result=data.get('result'), error=data.get('error'), worker=agent)
+    return jsonify(ok=True)
@@ -0,0 +1,356 @@
+"""Сегментированное хранилище логов домофонов в ``logsDomofon``.
+
+Строки по-прежнему пишутся обычным текстом, но файл дня режется на сегменты
+фиксированного размера::
+
+    <ip>_<dd.mm.yyyy>.log       сегмент 0
+    <ip>_<dd.mm.yyyy>.1.log     сегмент 1, и т.д.
+
+Рядом с каждым сегментом лежит разреженный индекс ``<сегмент>.idx`` —
+пары ``(время приёма, смещение строки)`` примерно через каждые
+``INDEX_STRIDE`` байт.  ``read_range()`` по индексу находит смещение и
+читает только нужный кусок сегмента через mmap.
+
+Закрытые сегменты и ротированные ``raw.log``/``server.log`` старше
+``COMPRESS_AFTER`` сжимаются в фоне (zstd, если установлен ``zstandard``,
+иначе gzip), а через ``RETENTION_DAYS`` удаляются.  Все функции чтения
+прозрачно распаковывают такие файлы потоком.
+"""
+import bisect
+import gzip
+import mmap
+import os
+import struct
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # необязательная зависимость, без неё сжимаем gzip
+    zstandard = None
+
+SEGMENT_SIZE = 16 * 1024 * 1024
+INDEX_STRIDE = 64 * 1024
+
+# Политика ротации и сжатия
+ROTATE_SIZE = 16 * 1024 * 1024     # raw.log и server.log ротируются по размеру
+COMPRESS_AFTER = 10 * 60           # закрытый файл сжимается, если не менялся столько секунд
+RETENTION_DAYS = 30                # сжатые архивы старше удаляются (0 — хранить всегда)
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+
+_ENTRY = struct.Struct('<dQ')
+_TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def segment_name(ip: str, day: str, number: int) -> str:
+    if number == 0:
+        return f"{ip}_{day}.log"
+    return f"{ip}_{day}.{number}.log"
+
+
+def plain_path(path: str) -> str:
+    """Strip a compression suffix: ``x.log.gz`` -> ``x.log``."""
+    for suffix in COMPRESSED_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def index_name(segment: str) -> str:
+    return plain_path(segment)[:-len('.log')] + '.idx'
+
+
+def open_log(path: str):
+    """Open a log file for binary reading, decompressing on the fly."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f'Для чтения {path} нужен пакет zstandard')
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def open_segment(path: str):
+    """``(path, file)`` for a listed segment, even if ``maintain`` compressed it since.
+
+    Raises ``FileNotFoundError`` only if no form of the segment is left.
+    """
+    try:
+        return path, open_log(path)
+    except FileNotFoundError:
+        plain = plain_path(path)
+        for candidate in (plain, *(plain + suffix for suffix in COMPRESSED_SUFFIXES)):
+            if candidate != path and os.path.exists(candidate):
+                try:
+                    return candidate, open_log(candidate)
+                except FileNotFoundError:
+                    continue
+        raise
+
+
+def iter_lines(path: str) -> Iterable[str]:
+    """Yield decoded lines of a plain or compressed log file."""
+    with open_log(path) as f:
+        for raw in split_lines(f):
+            yield raw.decode('utf-8', errors='replace')
+
+
+def _segment_number(name: str, prefix: str) -> Optional[int]:
+    name = plain_path(name)
+    if not name.startswith(prefix) or not name.endswith('.log'):
+        return None
+    middle = name[len(prefix):-len('.log')]
+    if middle == '':
+        return 0
+    if middle.startswith('.') and middle[1:].isdigit():
+        return int(middle[1:])
+    return None
+
+
+def list_segments(log_dir: str, ip: str, day: str) -> List[str]:
+    """Return full paths of the day's segments for ``ip`` in write order."""
+    prefix = f"{ip}_{day}"
+    try:
+        names = os.listdir(log_dir)
+    except FileNotFoundError:
+        return []
+    found = {}
+    for name in names:
+        number = _segment_number(name, prefix)
+        # Если сжатие прервалось, рядом лежат оба файла — читаем несжатый
+        if number is not None and (number not in found or name.endswith('.log')):
+            found[number] = name
+    return [os.path.join(log_dir, found[number]) for number in sorted(found)]
+
+
+class SegmentTracker:
+    """Decides which segment a new line goes to and when to index it.
+
+    Not thread-safe by itself: the caller (``_LogWriter``) serialises calls.
+    """
+
+    def __init__(self, log_dir: str, segment_size: int = SEGMENT_SIZE,
+                 stride: int = INDEX_STRIDE):
+        self.log_dir = log_dir
+        self.segment_size = segment_size
+        self.stride = stride
+        # (ip, day) -> [номер сегмента, размер, смещение следующей записи индекса]
+        self._state: Dict[Tuple[str, str], list] = {}
+
+    def _resume(self, ip: str, day: str) -> list:
+        segments = list_segments(self.log_dir, ip, day)
+        if not segments:
+            return [0, 0, 0]
+        last = segments[-1]
+        number = _segment_number(os.path.basename(last), f"{ip}_{day}")
+        if last.endswith(COMPRESSED_SUFFIXES):
+            # Последний сегмент уже сжат — начинаем следующий
+            return [number + 1, 0, 0]
+        size = os.path.getsize(last)
+        # После перезапуска индексируем первую же новую строку
+        return [number, size, size]
+
+    def place(self, ip: str, day: str, received: float, nbytes: int):
+        """Return ``(segment_filename, index_entry_or_None)`` for a line."""
+        key = (ip, day)
+        state = self._state.get(key)
+        if state is None:
+            state = self._state[key] = self._resume(ip, day)
+        if state[1] and state[1] + nbytes > self.segment_size:
+            state[0] += 1
+            state[1] = 0
+            state[2] = 0
+        entry = None
+        if state[1] >= state[2]:
+            entry = _ENTRY.pack(received, state[1])
+            state[2] = state[1] + self.stride
+        state[1] += nbytes
+        return segment_name(ip, day, state[0]), entry
+
+    def active_names(self) -> List[str]:
+        return [segment_name(ip, day, state[0]) for (ip, day), state in self._state.items()]
+
+    def clear(self) -> None:
+        self._state.clear()
+
+
+def _load_index(segment: str) -> List[Tuple[float, int]]:
+    try:
+        with open(index_name(segment), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    usable = len(data) - len(data) % _ENTRY.size
+    return list(_ENTRY.iter_unpack(data[:usable]))
+
+
+def _scan(segment: str, offset: int, since: bytes, until: bytes) -> Tuple[List[str], bool]:
+    """Read lines of ``segment`` from ``offset`` within [since, until].
+
+    Returns the lines and whether the scan stopped past ``until``.
+    """
+    lines = []
+    if segment.endswith(COMPRESSED_SUFFIXES):
+        return _scan_stream(segment, offset, since, until)
+    with open(segment, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or offset >= size:
+            return lines, False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = offset
+            while pos < size:
+                end = mm.find(b'\n', pos)
+                if end == -1:
+                    break  # недописанная строка
+                stamp = mm[pos:pos + 19]
+                if stamp > until:
+                    return lines, True
+                if stamp >= since:
+                    lines.append(mm[pos:end + 1].decode('utf-8', errors='replace'))
+                pos = end + 1
+    return lines, False
+
+
+def _scan_stream(segment: str, offset: int, since: bytes, until: bytes) -> Tuple[List[str], bool]:
+    lines = []
+    with open_log(segment) as f:
+        if offset:
+            f.seek(offset)
+        for raw in split_lines(f):
+            stamp = raw[:19]
+            if stamp > until:
+                return lines, True
+            if stamp >= since:
+                lines.append(raw.decode('utf-8', errors='replace'))
+    return lines, False
+
+
+def split_lines(f):
+    pending = b''
+    while True:
+        chunk = f.read(256 * 1024)
+        if not chunk:
+            if pending:
+                yield pending
+            return
+        parts = (pending + chunk).split(b'\n')
+        pending = parts.pop()
+        for part in parts:
+            yield part + b'\n'
+
+
+def read_range(log_dir: str, ip: str, t0: float, t1: float) -> List[str]:
+    """Return lines from ``ip`` received between ``t0`` and ``t1`` (epoch seconds)."""
+    if t1 < t0:
+        return []
+    since = datetime.fromtimestamp(int(t0)).strftime(_TS_FORMAT).encode()
+    until = datetime.fromtimestamp(int(t1)).strftime(_TS_FORMAT).encode()
+    result: List[str] = []
+    day = datetime.fromtimestamp(t0).date()
+    last_day = datetime.fromtimestamp(t1).date()
+    while day <= last_day:
+        segments = list_segments(log_dir, ip, day.strftime('%d.%m.%Y'))
+        indexes = [_load_index(seg) for seg in segments]
+        for i, segment in enumerate(segments):
+            # Сегмент целиком раньше t0, если следующий начался до этой секунды
+            if i + 1 < len(indexes) and indexes[i + 1] and indexes[i + 1][0][0] < int(t0):
+                continue
+            index = indexes[i]
+            if index and index[0][0] > t1 + 1:
+                break
+            offset = 0
+            if index:
+                pos = bisect.bisect_left([ts for ts, _ in index], int(t0)) - 1
+                if pos >= 0:
+                    offset = index[pos][1]
+            lines, past_end = _scan(segment, offset, since, until)
+            result.extend(lines)
+            if past_end:
+                return result
+        day += timedelta(days=1)
+    return result
+
+
+def read_day(log_dir: str, ip: str, day: str) -> List[str]:
+    """Return all lines of ``ip`` for ``day`` (``dd.mm.yyyy``) across segments."""
+    lines: List[str] = []
+    for segment in list_segments(log_dir, ip, day):
+        lines.extend(iter_lines(segment))
+    return lines
+
+
+def rotated_name(path: str) -> str:
+    stem = path[:-len('.log')] if path.endswith('.log') else path
+    return f"{stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+
+
+def rotate_if_large(path: str, max_size: int = ROTATE_SIZE) -> Optional[str]:
+    """Rename ``path`` aside when it grew past ``max_size``; return the new name."""
+    try:
+        if os.path.getsize(path) < max_size:
+            return None
+        target = rotated_name(path)
+        os.replace(path, target)
+        return target
+    except OSError:
+        return None
+
+
+def compress_file(path: str) -> str:
+    """Compress ``path`` next to itself and remove the original."""
+    suffix = '.zst' if zstandard is not None else '.gz'
+    target = path + suffix
+    tmp = target + '.tmp'
+    with open(path, 'rb') as src:
+        if zstandard is not None:
+            with open(tmp, 'wb') as raw:
+                zstandard.ZstdCompressor(level=3).copy_stream(src, raw)
+        else:
+            with gzip.open(tmp, 'wb', compresslevel=6) as dst:
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+    os.replace(tmp, target)
+    os.remove(path)
+    return target
+
+
+def maintain(log_dir: str, active: Iterable[str] = (), now: float = None) -> Dict[str, int]:
+    """Compress closed log files and delete expired archives.
+
+    ``active`` are file names still being written (skipped regardless of age).
+    Returns counters ``{'compressed': n, 'deleted': n}``.
+    """
+    now = time.time() if now is None else now
+    active = set(active) | {'raw.log', 'server.log'}
+    stats = {'compressed': 0, 'deleted': 0}
+    try:
+        names = os.listdir(log_dir)
+    except FileNotFoundError:
+        return stats
+    for name in names:
+        path = os.path.join(log_dir, name)
+        try:
+            age = now - os.path.getmtime(path)
+            if name.endswith(COMPRESSED_SUFFIXES):
+                if RETENTION_DAYS and age > RETENTION_DAYS * 86400:
+                    os.remove(path)
+                    idx = index_name(path)
+                    if os.path.exists(idx):
+                        os.remove(idx)
+                    stats['deleted'] += 1
+            elif name.endswith('.log') and name not in active and age > COMPRESS_AFTER:
+                if name + '.gz' in names or name + '.zst' in names:
+                    # Сжатие прервалось после записи архива — дочищаем оригинал
+                    os.remove(path)
+                    continue
+                compress_file(path)
+                stats['compressed'] += 1
+        except OSError:
+            # Файл ещё открыт (Windows) или удалён параллельно — попробуем позже
+            continue
+    return stats
@@ -0,0 +1,44 @@
+"""Параллельный прогон сценария по многим домофонам с ограничением параллельности.
+
+Раньше Regression/acceptance запускали ``multiprocessing.Pool`` на процесс
+на каждый домофон; почти всё время такой процесс спит в ``time.sleep`` или
+ждёт ответа ``requests``, а памяти занимает как целый интерпретатор.
+Здесь сценарий (``handle_one``) выполняется в пуле потоков одного процесса,
+одновременно не больше ``concurrency`` домофонов.  Режим ``'processes'``
+оставлен для сценариев, которым нужна изоляция, — тоже с ограничением.
+
+Масштабирование по памяти и времени: ``python -m bench.orchestrator``.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# Сколько домофонов обрабатывать одновременно (переопределяется ORCHESTRATOR_CONCURRENCY)
+DEFAULT_CONCURRENCY = int(os.environ.get('ORCHESTRATOR_CONCURRENCY', 64))
+# 'threads' — пул потоков в текущем процессе, 'processes' — multiprocessing.Pool
+DEFAULT_MODE = os.environ.get('ORCHESTRATOR_MODE', 'threads')
+MODES = ('threads', 'processes')
+
+
+def run_devices(handler: Callable[[dict], object], devices: List[dict],
+                concurrency: Optional[int] = None,
+                mode: Optional[str] = None) -> Iterator[Tuple[dict, object]]:
+    """Run ``handler(cfg)`` for every device, at most ``concurrency`` at a time.
+
+    Yields ``(cfg, result)`` in the order of ``devices`` as soon as each
+    result (and all before it) is ready.  In ``'processes'`` mode
+    ``handler`` must be picklable (a module-level function).
+    """
+    mode = mode or DEFAULT_MODE
+    if mode not in MODES:
+        raise ValueError(f'Неизвестный режим оркестратора: {mode}')
+    if not devices:
+        return
+    workers = max(1, min(concurrency or DEFAULT_CONCURRENCY, len(devices)))
+    if mode == 'processes':
+        with multiprocessing.Pool(processes=workers) as pool:
+            yield from zip(devices, pool.imap(handler, devices))
+        return
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='device') as pool:
+        yield from zip(devices, pool.map(handler, devices))
@@ -0,0 +1,101 @@
+"""Перехват print() отдельно для каждого теста и домофона.
+
+``redirect_stdout`` подменяет ``sys.stdout`` на весь процесс, поэтому при
+параллельном запуске вывод разных домофонов перемешивается.  Здесь
+``sys.stdout`` один раз заменяется на :class:`_RoutedStdout`, который пишет
+в приёмник из контекстной переменной текущего потока/задачи, а без
+приёмника — в исходный поток вывода.
+"""
+import contextvars
+import io
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Строки с такими фрагментами (журнал HTTP-запросов) в лог не попадают
+NOISE = ('GET /', 'POST /')
+SPOOL_MEMORY = 256 * 1024   # сколько вывода держать в памяти до сброса во временный файл
+
+_sink = contextvars.ContextVar('output_sink', default=None)
+
+
+class _RoutedStdout(io.TextIOBase):
+    def __init__(self, fallback):
+        self._fallback = fallback
+
+    def write(self, s):
+        sink = _sink.get()
+        if sink is None:
+            return self._fallback.write(s)
+        sink.write(s)
+        return len(s)
+
+    def flush(self):
+        self._fallback.flush()
+
+    @property
+    def encoding(self):
+        return getattr(self._fallback, 'encoding', 'utf-8')
+
+    def isatty(self):
+        return False
+
+
+def install() -> None:
+    """Route ``sys.stdout`` through the context sink (idempotent)."""
+    if not isinstance(sys.stdout, _RoutedStdout):
+        sys.stdout = _RoutedStdout(sys.stdout)
+
+
+class LineSink:
+    """Line-filtering spool for captured output.
+
+    Writes are split into lines, ``NOISE`` lines are dropped on the fly and
+    the rest goes to a ``SpooledTemporaryFile``, so memory stays bounded by
+    ``SPOOL_MEMORY`` however much a test prints.
+    """
+
+    def __init__(self, max_memory: int = SPOOL_MEMORY):
+        self._spool = tempfile.SpooledTemporaryFile(max_size=max_memory, mode='w+',
+                                                    encoding='utf-8')
+        self._partial = ''
+        self._lock = threading.Lock()
+
+    def write(self, s: str) -> None:
+        with self._lock:
+            data = self._partial + s
+            lines = data.split('\n')
+            self._partial = lines.pop()
+            for line in lines:
+                if not any(noise in line for noise in NOISE):
+                    self._spool.write(line + '\n')
+
+    def copy_to(self, out) -> None:
+        """Write everything captured so far into the text stream ``out``."""
+        with self._lock:
+            if self._partial:
+                if not any(noise in self._partial for noise in NOISE):
+                    self._spool.write(self._partial + '\n')
+                self._partial = ''
+            self._spool.seek(0)
+            while True:
+                chunk = self._spool.read(64 * 1024)
+                if not chunk:
+                    break
+                out.write(chunk)
+            self._spool.seek(0, io.SEEK_END)
+
+    def close(self) -> None:
+        self._spool.close()
+
+
+@contextmanager
+def capture(sink: LineSink):
+    """Send ``print`` output of the current context to ``sink``."""
+    install()
+    token = _sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _sink.reset(token)
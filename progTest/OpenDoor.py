@@ -3,184 +3,133 @@
 
 import os
 import requests
-from requests.auth import HTTPBasicAuth
 from datetime import datetime
-from syslog_server import LogDomofon
+from syslog_server import wait_for_log
 import time
 import re
 import paho.mqtt.publish as publish
 
-def run(ip: str, login: str, password: str, attempt: int = 3):
+import cancel as cancellation
+from progTest import _http
+from results import CANCELLED, FAIL, OK, TestResult
+
+OPEN_PATTERN = re.compile(r'STAT/DOOR1:\s*1')
+LOG_TIMEOUT = 7
+
+
+def _confirm(host_only: str, since: float, num: int, after: str, how: str, cancel=None) -> bool:
+    """Ждёт строку об открытии двери в syslog, пришедшую после ``since``."""
+    print(f"[Попытка {num}] Проверяем логи после {after}...")
+    match = wait_for_log(host_only, OPEN_PATTERN, since=since, timeout=LOG_TIMEOUT, cancel=cancel)
+    if match is None:
+        print(f"[Попытка {num}] ❌ Подтверждающий лог после {how} не найден.")
+        return False
+    log_ts = datetime.fromtimestamp(match.received).replace(microsecond=0)
+    print(f"[Попытка {num}] ✅ Дверь открыта по {how} (лог {log_ts}, дельта {match.elapsed:.1f}с).")
+    return True
+
+
+def run(ip: str, login: str, password: str, attempt: int = 3, cancel=None, session=None):
+    """Открывает дверь ``attempt`` раз каждым способом (API, кнопка, ключ).
+
+    Возвращает `results.TestResult`: ok, только если каждый способ
+    подтвердился в syslog во всех попытках; при отмене — cancelled со
+    счётчиками начатых попыток.
+    """
     host_only = ip.split(':')[0]
 
     url = f"http://{ip}/api/v1/doors/1/open"
-    auth = HTTPBasicAuth(login, password)
-    header_ts_pattern = re.compile(r'^(?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})')
-    open_pattern = re.compile(r'STAT/DOOR1:\s*1')
+    http = session or _http.session(ip, login, password)
 
     api_success = 0
     mqtt_success = 0
     key_success = 0
-    resp = requests.post(url, auth=auth, timeout=5)
-    for num in range(1, attempt + 1):
-        print("\nОжидание 3 секунды перед API...")
-        time.sleep(3)
-
-        start_time = datetime.now().replace(microsecond=0)
-        print(f"[Попытка {num}] Этап 1: Отправка API-команды на {url} в {start_time}...")
-        try:
-            resp = requests.post(url, auth=auth, timeout=5)
-        except requests.RequestException as e:
-            print(f"[Попытка {num}] Ошибка HTTP-запроса: {e}")
-            continue
-
-        if resp.status_code == 204:
-            print("Ждём 3 секунды перед проверкой логов...")
-            time.sleep(3)
-
-            print(f"[Попытка {num}] Проверяем логи после API-команды...")
-            found = False
-            deadline = time.time() + 7
-
-            for line in LogDomofon(host_only, follow=True):
-                if time.time() > deadline:
-                    print(f"[Попытка {num}] Время ожидания лога истекло.")
-                    break
-
-                m_header = header_ts_pattern.match(line)
-                if not m_header:
-                    continue
-                try:
-                    log_ts = datetime.strptime(m_header.group('ts'), "%Y-%m-%d %H:%M:%S")
-                except ValueError:
-                    continue
-
-                delta = (log_ts - start_time).total_seconds()
-                if abs(delta) > 10:
-                    continue
-
-                if open_pattern.search(line):
-                    print(f"[Попытка {num}] ✅ Дверь открыта по API (лог {log_ts}, дельта {delta:.1f}с).")
-                    api_success += 1
-                    found = True
-                    break
-
-            if not found:
-                print(f"[Попытка {num}] ❌ Подтверждающий лог после API не найден.")
-        else:
-            print(f"[Попытка {num}] Некорректный код ответа: {resp.status_code}")
-
-        print("Ждём 3 секунды перед MQTT этапом...")
-        time.sleep(3)
-
-        mqtt_start = datetime.now().replace(microsecond=0)
-        print(f"[Попытка {num}] Этап 2: Отправка команды MQTT (ESP/Relay6CH/Door_2: 1)...")
-        try:
-            publish.single(
-                topic="ESP/Relay6CH/Door_2",
-                payload="1",
-                hostname="m8.wqtt.ru",
-                port=19376,
-                auth={"username": "u_SV3FSP", "password": "xRFgu00s"},
-                keepalive=5,
-            )
-        except Exception as e:
-            print(f"[Попытка {num}] Ошибка при отправке MQTT: {e}")
-            continue
-
-        print("Ждём 3 секунды перед проверкой логов MQTT...")
-        time.sleep(3)
-
-        print(f"[Попытка {num}] Проверяем логи после MQTT-команды...")
-        found_mqtt = False
-        deadline = time.time() + 7
-
-        for line in LogDomofon(host_only, follow=True):
-            if time.time() > deadline:
-                print(f"[Попытка {num}] Время ожидания лога MQTT истекло.")
-                break
-
-            m_header = header_ts_pattern.match(line)
-            if not m_header:
-                continue
+    resp = http.post(url, timeout=_http.timeout(5, cancel))
+    tried = 0   # начатых попыток
+    cancelled = None
+    try:
+        for num in range(1, attempt + 1):
+            tried = num
+            print("\nОжидание 3 секунды перед API...")
+            cancellation.sleep(3, cancel)
+
+            start_ts = time.time()
+            start_time = datetime.fromtimestamp(start_ts).replace(microsecond=0)
+            print(f"[Попытка {num}] Этап 1: Отправка API-команды на {url} в {start_time}...")
             try:
-                log_ts = datetime.strptime(m_header.group('ts'), "%Y-%m-%d %H:%M:%S")
-            except ValueError:
+                resp = http.post(url, timeout=_http.timeout(5, cancel))
+            except requests.RequestException as e:
+                print(f"[Попытка {num}] Ошибка HTTP-запроса: {e}")
                 continue
 
-            delta = (log_ts - mqtt_start).total_seconds()
-            if abs(delta) > 10:
-                continue
+            if resp.status_code == 204:
+                if _confirm(host_only, start_ts, num, "API-команды", "API", cancel):
+                    api_success += 1
+            else:
+                print(f"[Попытка {num}] Некорректный код ответа: {resp.status_code}")
 
-            if open_pattern.search(line):
-                print(f"[Попытка {num}] ✅ Дверь открыта по MQTT (лог {log_ts}, дельта {delta:.1f}с).")
-                mqtt_success += 1
-                found_mqtt = True
-                break
-
-        if not found_mqtt:
-            print(f"[Попытка {num}] ❌ Подтверждающий лог после MQTT не найден.")
-
-        print("Ждём 3 секунды перед этапом ключа...")
-        time.sleep(3)
-
-        key_start = datetime.now().replace(microsecond=0)
-        print(f"[Попытка {num}] Этап 3: Отправка команды ключом (ESP/Relay6CH/Servo)...")
-        try:
-            publish.single(
-                topic="ESP/Relay6CH/Servo",
-                payload="speed:15 Angle:75",
-                hostname="m8.wqtt.ru",
-                port=19376,
-                auth={"username": "u_SV3FSP", "password": "xRFgu00s"},
-                keepalive=5,
-            )
-        except Exception as e:
-            print(f"[Попытка {num}] Ошибка при отправке команды ключом: {e}")
-            continue
-
-        print("Ждём 3 секунды перед проверкой логов ключа...")
-        time.sleep(3)
-
-        print(f"[Попытка {num}] Проверяем логи после команды ключом...")
-        found_key = False
-        deadline = time.time() + 7
-
-        for line in LogDomofon(host_only, follow=True):
-            if time.time() > deadline:
-                print(f"[Попытка {num}] Время ожидания лога ключа истекло.")
-                break
-
-            m_header = header_ts_pattern.match(line)
-            if not m_header:
-                continue
+            print("Ждём 3 секунды перед MQTT этапом...")
+            cancellation.sleep(3, cancel)
+
+            mqtt_start = time.time()
+            print(f"[Попытка {num}] Этап 2: Отправка команды MQTT (ESP/Relay6CH/Door_2: 1)...")
             try:
-                log_ts = datetime.strptime(m_header.group('ts'), "%Y-%m-%d %H:%M:%S")
-            except ValueError:
+                publish.single(
+                    topic="ESP/Relay6CH/Door_2",
+                    payload="1",
+                    hostname="m8.wqtt.ru",
+                    port=19376,
+                    auth={"username": "u_SV3FSP", "password": "xRFgu00s"},
+                    keepalive=5,
+                )
+            except Exception as e:
+                print(f"[Попытка {num}] Ошибка при отправке MQTT: {e}")
                 continue
 
-            delta = (log_ts - key_start).total_seconds()
-            if abs(delta) > 10:
+            if _confirm(host_only, mqtt_start, num, "MQTT-команды", "MQTT", cancel):
+                mqtt_success += 1
+
+            print("Ждём 3 секунды перед этапом ключа...")
+            cancellation.sleep(3, cancel)
+
+            key_start = time.time()
+            print(f"[Попытка {num}] Этап 3: Отправка команды ключом (ESP/Relay6CH/Servo)...")
+            try:
+                publish.single(
+                    topic="ESP/Relay6CH/Servo",
+                    payload="speed:15 Angle:75",
+                    hostname="m8.wqtt.ru",
+                    port=19376,
+                    auth={"username": "u_SV3FSP", "password": "xRFgu00s"},
+                    keepalive=5,
+                )
+            except Exception as e:
+                print(f"[Попытка {num}] Ошибка при отправке команды ключом: {e}")
                 continue
 
-            if open_pattern.search(line):
-                print(f"[Попытка {num}] ✅ Дверь открыта по ключу (лог {log_ts}, дельта {delta:.1f}с).")
+            if _confirm(host_only, key_start, num, "команды ключом", "ключу", cancel):
                 key_success += 1
-                found_key = True
-                break
-
-        if not found_key:
-            print(f"[Попытка {num}] ❌ Подтверждающий лог после ключа не найден.")
 
-        if num < attempt:
-            print("Ждём 3 секунд перед следующей полной попыткой...")
-            time.sleep(3)
+            if num < attempt:
+                print("Ждём 3 секунд перед следующей полной попыткой...")
+                cancellation.sleep(3, cancel)
+    except cancellation.Cancelled as e:
+        # Остановка или конец бюджета шага: отчитываемся о начатых попытках
+        cancelled = e
+        print(f"Отменено на попытке {tried} из {attempt}: {e}")
 
     result = (
         f"\nСтатистика:\n"
-        f"API метод: {api_success} из {attempt} попыток\n"
-        f"Открытие физической кнопкой: {mqtt_success} из {attempt} попыток\n"
-        f"Открытие ключом: {key_success} из {attempt} попыток"
+        f"API метод: {api_success} из {tried} попыток\n"
+        f"Открытие физической кнопкой: {mqtt_success} из {tried} попыток\n"
+        f"Открытие ключом: {key_success} из {tried} попыток"
     )
+    metrics = {'API метод': api_success, 'Открытие физической кнопкой': mqtt_success,
+               'Открытие ключом': key_success, 'Попыток': tried}
+    if cancelled is not None:
+        result += f"\nОтменено: {cancelled} (начато {tried} из {attempt})"
+        status = CANCELLED
+    else:
+        status = OK if min(api_success, mqtt_success, key_success) == attempt else FAIL
     print(result)
-    return result
+    return TestResult('OpenDoor', ip, status, metrics, message=result)
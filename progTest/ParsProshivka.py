@@ -1,8 +1,17 @@
+import re
+
 import requests
-from requests.auth import HTTPBasicAuth
 from bs4 import BeautifulSoup
 
-def get_device_info(ip: str, login: str, password: str) -> str:
+import cancel as cancellation
+from progTest import _device_cache, _http
+
+# Подписи времени работы на status.cgi (ищутся как подстрока, без учёта регистра)
+UPTIME_LABELS = ('время работы', 'аптайм', 'uptime')
+# Вывод команды uptime, который веб-интерфейс OpenIPC показывает как есть
+_UPTIME_OUTPUT_RE = re.compile(r'\bup\s+((?:\d+\s+days?,\s*)?\d+:\d{2}|\d+\s+min)', re.IGNORECASE)
+
+def get_device_info(ip: str, login: str, password: str, cancel=None, session=None) -> str:
     """
     Возвращает многострочную строку:
       MAC: …
@@ -22,84 +31,35 @@ def get_device_info(ip: str, login: str, password: str) -> str:
           Ядро: …
           RootFS: …
     В случае ошибки возвращает сообщение об ошибке.
+
+    Разобранные данные кешируются (`_device_cache`): в течение `CACHE_TTL`
+    домофон не опрашивается, позже перечитывается только status.cgi.
     """
-    session = requests.Session()
-    session.auth = HTTPBasicAuth(login, password)
+    cached = _device_cache.fresh(ip)
+    if cached:
+        return _render(cached)
+
+    session = session or _http.session(ip, login, password)
 
     try:
-        # Получаем и парсим status.cgi
-        r = session.get(f"http://{ip}/cgi-bin/status.cgi", timeout=5)
+        r = session.get(f"http://{ip}/cgi-bin/status.cgi", timeout=_http.timeout(5, cancel))
         r.raise_for_status()
-        soup = BeautifulSoup(r.text, 'html.parser')
-
-        # Извлекаем MAC
-        div_info = soup.find('div', class_='col-md-7 mb-2')
-        if not div_info:
-            raise RuntimeError("не найден div.col-md-7.mb-2 на status.cgi")
-        tokens = [t.strip() for t in div_info.get_text(strip=True).split(',')]
-        mac = tokens[-1]
-
-        # Ищем секцию «Информация»
-        info_header = soup.find('h2', string='Информация')
-        if not info_header:
-            raise RuntimeError("не найден заголовок h2 Информация")
-        row = info_header.find_next_sibling(
-            'div',
-            class_='row row-cols-1 row-cols-md-2 row-cols-lg-3 g-4 mb-4'
-        )
-        if not row:
-            raise RuntimeError("не найден блок с классом row… под h2 Информация")
-
-        # Собираем разделы «Железо» и «Прошивка»
-        sections = {}
-        for col in row.find_all('div', class_='col', limit=2):
-            title = col.find('h3')
-            dl = col.find('dl', class_='small list')
-            if not title or not dl:
-                continue
-            name = title.get_text(strip=True)
-            items = {
-                dt.get_text(strip=True): dd.get_text(strip=True)
-                for dt, dd in zip(dl.find_all('dt'), dl.find_all('dd'))
-            }
-            sections[name] = items
-
-        hw = sections.get('Железо', {})
-        fw = sections.get('Прошивка', {})
-
-        # Получаем kernel и rootfs из firmware.cgi
-        r2 = session.get(f"http://{ip}/cgi-bin/firmware.cgi", timeout=5)
-        r2.raise_for_status()
-        soup2 = BeautifulSoup(r2.text, 'html.parser')
-        row2 = soup2.find('div', class_='row row-cols-1 row-cols-md-2 row-cols-lg-3 g-4 mb-4')
-        kernel = rootfs = None
-        if row2:
-            col2 = row2.find('div', class_='col')
-            if col2:
-                dl2 = col2.find('dl', class_='list small')
-                if dl2:
-                    items2 = {
-                        dt.get_text(strip=True): dd.get_text(strip=True)
-                        for dt, dd in zip(dl2.find_all('dt'), dl2.find_all('dd'))
-                    }
-                    kernel = items2.get('Ядро')
-                    rootfs = items2.get('RootFS')
-
-        # Формируем вывод
-        lines = [f"MAC: {mac}", "Железо:"]
-        for key in ('Процессор', 'Семейство', 'Сенсор', 'Флэш-память', 'Вариант устройства'):
-            if key in hw:
-                lines.append(f"        {key}: {hw[key]}")
-
-        lines.append("Прошивка:")
-        for key in ('Сборка', 'Majestic', 'Web UI', 'U-Boot', 'UICL', 'MCU'):
-            if key in fw:
-                lines.append(f"        {key}: {fw[key]}")
-        # Добавляем ядро и rootfs
-        lines.append(f"        Ядро: {kernel}")
-        lines.append(f"        RootFS: {rootfs}")
-
-        return "\n".join(lines)
+        mac, hw, fw, uptime = _parse_status(r.text)
+
+        # firmware.cgi перечитываем, только если сменилась сборка или домофон перезагружался
+        previous = _device_cache.reusable(ip, mac, fw.get('Сборка'), uptime)
+        if previous:
+            kernel, rootfs = previous['kernel'], previous['rootfs']
+        else:
+            cancellation.check(cancel)
+            r2 = session.get(f"http://{ip}/cgi-bin/firmware.cgi", timeout=_http.timeout(5, cancel))
+            r2.raise_for_status()
+            kernel, rootfs = _parse_firmware(r2.text)
+
+        info = {'mac': mac, 'hw': hw, 'fw': fw, 'build': fw.get('Сборка'),
+                'kernel': kernel, 'rootfs': rootfs}
+        _device_cache.store(ip, info, uptime)
+        return _render(info)
 
     except requests.exceptions.RequestException as e:
         return f"Не удалось подключиться к устройству: {e}"
@@ -111,6 +71,97 @@ def get_device_info(ip: str, login: str, password: str) -> str:
         return f"Неизвестная ошибка: {e}"
 
 
+def _parse_status(html: str):
+    """Разбирает status.cgi: MAC, разделы «Железо»/«Прошивка» и время работы."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Извлекаем MAC
+    div_info = soup.find('div', class_='col-md-7 mb-2')
+    if not div_info:
+        raise RuntimeError("не найден div.col-md-7.mb-2 на status.cgi")
+    tokens = [t.strip() for t in div_info.get_text(strip=True).split(',')]
+    mac = tokens[-1]
+
+    # Ищем секцию «Информация»
+    info_header = soup.find('h2', string='Информация')
+    if not info_header:
+        raise RuntimeError("не найден заголовок h2 Информация")
+    row = info_header.find_next_sibling(
+        'div',
+        class_='row row-cols-1 row-cols-md-2 row-cols-lg-3 g-4 mb-4'
+    )
+    if not row:
+        raise RuntimeError("не найден блок с классом row… под h2 Информация")
+
+    # Собираем разделы «Железо» и «Прошивка»
+    sections = {}
+    for col in row.find_all('div', class_='col', limit=2):
+        title = col.find('h3')
+        dl = col.find('dl', class_='small list')
+        if not title or not dl:
+            continue
+        name = title.get_text(strip=True)
+        items = {
+            dt.get_text(strip=True): dd.get_text(strip=True)
+            for dt, dd in zip(dl.find_all('dt'), dl.find_all('dd'))
+        }
+        sections[name] = items
+
+    # Время работы ищем по всей странице: по нему замечаем перезагрузку.
+    # Не нашли — uptime=None, и кеш не будет переиспользовать firmware.cgi.
+    uptime = None
+    for dt in soup.find_all('dt'):
+        label = dt.get_text(strip=True).lower()
+        if any(known in label for known in UPTIME_LABELS):
+            dd = dt.find_next_sibling('dd')
+            uptime = _device_cache.parse_uptime(dd.get_text(strip=True) if dd else None)
+            break
+    if uptime is None:
+        match = _UPTIME_OUTPUT_RE.search(soup.get_text(' '))
+        if match:
+            uptime = _device_cache.parse_uptime(match.group(1))
+
+    return mac, sections.get('Железо', {}), sections.get('Прошивка', {}), uptime
+
+
+def _parse_firmware(html: str):
+    """Достаёт версии ядра и RootFS из firmware.cgi."""
+    soup2 = BeautifulSoup(html, 'html.parser')
+    row2 = soup2.find('div', class_='row row-cols-1 row-cols-md-2 row-cols-lg-3 g-4 mb-4')
+    kernel = rootfs = None
+    if row2:
+        col2 = row2.find('div', class_='col')
+        if col2:
+            dl2 = col2.find('dl', class_='list small')
+            if dl2:
+                items2 = {
+                    dt.get_text(strip=True): dd.get_text(strip=True)
+                    for dt, dd in zip(dl2.find_all('dt'), dl2.find_all('dd'))
+                }
+                kernel = items2.get('Ядро')
+                rootfs = items2.get('RootFS')
+    return kernel, rootfs
+
+
+def _render(info: dict) -> str:
+    """Формирует вывод."""
+    hw, fw = info['hw'], info['fw']
+    lines = [f"MAC: {info['mac']}", "Железо:"]
+    for key in ('Процессор', 'Семейство', 'Сенсор', 'Флэш-память', 'Вариант устройства'):
+        if key in hw:
+            lines.append(f"        {key}: {hw[key]}")
+
+    lines.append("Прошивка:")
+    for key in ('Сборка', 'Majestic', 'Web UI', 'U-Boot', 'UICL', 'MCU'):
+        if key in fw:
+            lines.append(f"        {key}: {fw[key]}")
+    # Добавляем ядро и rootfs
+    lines.append(f"        Ядро: {info['kernel']}")
+    lines.append(f"        RootFS: {info['rootfs']}")
+
+    return "\n".join(lines)
+
+
 if __name__ == "__main__":
     IP       = "192.168.0.245:85"
     LOGIN    = "admin"
@@ -1,14 +1,17 @@
 import requests
-from requests.auth import HTTPBasicAuth
-import time
-def run(ip: str, login: str, password: str, reset: int = 0) -> str:
+
+import cancel as cancellation
+from progTest import _device_cache, _http
+
+
+def run(ip: str, login: str, password: str, reset: int = 0, cancel=None, session=None) -> str:
     """
     Если reset == 1, выполняет сброс через resetSystemEx.
     Если reset == 0, возвращает сообщение об отключённом сбросе.
     Иначе — сообщение об ошибочном значении reset.
     """
     if reset == 1:
-        return runse(ip, login, password)
+        return runse(ip, login, password, cancel, session)
     elif reset == 0:
         return "Сброс к заводским настройкам отключён. Чтобы включить — в конфиге установи переменной `RESET` значение `1`."
     else:
@@ -16,17 +19,20 @@ def run(ip: str, login: str, password: str, reset: int = 0) -> str:
                 "должно быть 1 (сброс) или 0 (не сбрасывать). "
                 "Настройте конфиг")
 
-def runse(ip: str, login: str, password: str) -> str:
+def runse(ip: str, login: str, password: str, cancel=None, session=None) -> str:
     """
     Делает GET‐запрос на resetSystemEx и возвращает строку с результатом.
     """
     url = f"http://{ip}/cgi-bin/magicBox.cgi?action=resetSystemEx"
-    auth = HTTPBasicAuth(login, password)
+    http = session or _http.session(ip, login, password)
 
     try:
-        response = requests.get(url, auth=auth, timeout=5)
+        cancellation.check(cancel)
+        response = http.get(url, timeout=_http.timeout(5, cancel))
         response.raise_for_status()
-        time.sleep(10)
+        _device_cache.invalidate(ip)
+        _http.close(ip)  # домофон перезагружается, старые соединения не годятся
+        cancellation.sleep(10, cancel)
         print("Сброс настроек успешный")
         return "Успешный сброс настроек"
     except requests.exceptions.RequestException as e:
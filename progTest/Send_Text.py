@@ -1,14 +1,17 @@
 
 import requests
-from requests.auth import HTTPBasicAuth
 
-def run(ip, login, password, SendText = "Тест", duration = 2):
+import cancel as cancellation
+from progTest import _http
+
+def run(ip, login, password, SendText = "Тест", duration = 2, cancel = None, session = None):
     url = "http://"+ ip +"/api/v1/display/message"
-    auth = HTTPBasicAuth(login, password)
+    http = session or _http.session(ip, login, password)
     payload = {"text": SendText,"duration": int(duration)}
     print("Сообщение отправленно")
     try:
-        response = requests.post(url, json=payload, auth=auth, timeout=5)
+        cancellation.check(cancel)
+        response = http.post(url, json=payload, timeout=_http.timeout(5, cancel))
         response.raise_for_status()
         return 'Успешно отправленно'
     except requests.exceptions.RequestException as e:
@@ -0,0 +1,150 @@
+"""Packed screenshot storage written in the background.
+
+Instead of one ``.jpg`` per frame, each test run on a device appends its
+frames to one pack ``logs/screenshots/<ip>_<ts>.pack`` with a JSON-lines
+index next to it (``.pack.idx``: frame number, offset, size, sha1, time,
+ok flag, Content-Type of the response and note).  A frame whose content was already stored in the pack
+(a frozen camera returns the same JPEG) only gets an index line pointing
+at the earlier bytes.  ``keep_every=N`` keeps one good frame in N; failed
+frames are always kept.
+
+The capture loop only hands the bytes to ``Pack.add``; hashing and disk
+writes happen in one writer thread shared by all packs, behind a bounded
+queue (the loop waits if the disk falls behind).
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Iterator, Optional
+
+ARTIFACT_DIR = os.path.join('logs', 'screenshots')
+QUEUE_SIZE = 256            # кадров в очереди на запись, дальше add() ждёт
+INDEX_SUFFIX = '.idx'
+
+_queue: 'queue.Queue' = queue.Queue(maxsize=QUEUE_SIZE)
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+
+def _write_loop() -> None:
+    while True:
+        pack, item = _queue.get()
+        try:
+            if item is None:
+                pack._finish()
+            else:
+                pack._store(*item)
+        except Exception as e:
+            pack.error = str(e)
+            print(f"[{datetime.now()}] Ошибка записи {pack.path}: {e}")
+            if item is None:
+                pack._done.set()
+
+
+def _ensure_writer() -> None:
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_loop, name='artifact-writer', daemon=True)
+            _writer.start()
+
+
+class Pack:
+    """Append-only frame archive of one run on one device."""
+
+    def __init__(self, ip: str, keep_every: int = 1, directory: str = ARTIFACT_DIR):
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        self.path = os.path.join(directory, f"{ip.replace(':', '_')}_{timestamp}.pack")
+        self.keep_every = max(1, int(keep_every or 1))
+        self.frames = 0         # кадров передано в add()
+        self.good = 0           # из них успешных (для выборки)
+        self.stored = 0         # записано байтами
+        self.duplicates = 0     # записано ссылкой на такой же кадр
+        self.size = 0
+        self.error = ''
+        self._seen = {}
+        self._data = None
+        self._index = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        _ensure_writer()
+
+    def add(self, data: bytes, ok: bool = True, note: str = '', content_type: str = '') -> bool:
+        """Queue a frame; returns False if the sampling policy skipped it."""
+        with self._lock:
+            self.frames += 1
+            number = self.frames
+            if ok:
+                self.good += 1
+                if (self.good - 1) % self.keep_every:
+                    return False
+        _queue.put((self, (number, data, ok, note, content_type, time.time())))
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Wait until every queued frame is on disk and close the files."""
+        _queue.put((self, None))
+        self._done.wait(timeout)
+
+    def __enter__(self) -> 'Pack':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # Вызывается только из потока записи
+    def _store(self, number: int, data: bytes, ok: bool, note: str, content_type: str,
+               received: float) -> None:
+        if self._data is None:
+            self._data = open(self.path, 'ab')
+            self._index = open(self.path + INDEX_SUFFIX, 'a', encoding='utf-8')
+        digest = hashlib.sha1(data).hexdigest()
+        known = self._seen.get(digest)
+        if known is None:
+            offset = self._data.tell()
+            self._data.write(data)
+            self._seen[digest] = known = (offset, len(data))
+            self.stored += 1
+            self.size += len(data)
+            duplicate = False
+        else:
+            self.duplicates += 1
+            duplicate = True
+        entry = {'n': number, 'offset': known[0], 'size': known[1], 'sha1': digest,
+                 'time': received, 'ok': ok, 'dup': duplicate}
+        if content_type:
+            entry['type'] = content_type
+        if note:
+            entry['note'] = note
+        self._index.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def _finish(self) -> None:
+        if self._data is not None:
+            self._data.close()
+            self._index.close()
+        self._done.set()
+
+    def summary(self) -> str:
+        return (f"Кадров в архиве: {self.stored + self.duplicates}, "
+                f"повторов: {self.duplicates}, {self.size // 1024} КБ")
+
+
+def read_index(pack_path: str) -> Iterator[dict]:
+    """Index entries of a pack, skipping a torn last line."""
+    with open(pack_path + INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def read_frame(pack_path: str, entry: dict) -> bytes:
+    with open(pack_path, 'rb') as f:
+        f.seek(entry['offset'])
+        return f.read(entry['size'])
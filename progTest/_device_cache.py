@@ -0,0 +1,118 @@
+"""Persistent cache of parsed device info (status.cgi + firmware.cgi).
+
+Entries are keyed by the device address and indexed by MAC, so a device
+that got a new DHCP address is still recognised.  An entry younger than
+``CACHE_TTL`` is returned without touching the device; an older one is
+revalidated with ``status.cgi`` only and the ``firmware.cgi`` part is
+reused while the firmware build is the same and the device has not
+rebooted since (boot time derived from uptime).  If the page showed no
+uptime, a reboot cannot be detected, so such an entry is never reused.
+Resets and firmware uploads drop the entry explicitly via ``invalidate``.
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+CACHE_PATH = os.path.join('state', 'device_info.json')
+CACHE_TTL = 300           # секунд без обращения к домофону
+BOOT_TOLERANCE = 120      # расхождение времени загрузки, которое не считаем перезагрузкой
+
+_lock = threading.Lock()
+_cache: Optional[dict] = None
+_mtime = 0.0
+
+_UNITS = {'d': 86400, 'д': 86400, 'h': 3600, 'ч': 3600, 'm': 60, 'м': 60, 's': 1, 'с': 1}
+_CLOCK_RE = re.compile(r'(\d+):(\d{2})(?::(\d{2}))?')
+_UNIT_RE = re.compile(r'(\d+)\s*([a-zа-я])', re.IGNORECASE)
+
+
+def parse_uptime(text: Optional[str]) -> Optional[int]:
+    """Convert an uptime string like ``3 days, 04:05:06`` or ``2д 3ч`` to seconds."""
+    if not text:
+        return None
+    total = 0
+    clock = _CLOCK_RE.search(text)
+    if clock:
+        total += int(clock.group(1)) * 3600 + int(clock.group(2)) * 60 + int(clock.group(3) or 0)
+        text = text[:clock.start()] + text[clock.end():]
+    found = bool(clock)
+    for value, unit in _UNIT_RE.findall(text):
+        mult = _UNITS.get(unit.lower())
+        if mult:
+            total += int(value) * mult
+            found = True
+    return total if found else None
+
+
+def _load() -> dict:
+    global _cache, _mtime
+    try:
+        mtime = os.stat(CACHE_PATH).st_mtime
+    except OSError:
+        mtime = 0.0
+    if _cache is None or mtime != _mtime:
+        try:
+            with open(CACHE_PATH, 'r', encoding='utf-8') as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+        _mtime = mtime
+    return _cache
+
+
+def _save() -> None:
+    global _mtime
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    tmp = f'{CACHE_PATH}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(_cache, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, CACHE_PATH)
+    _mtime = os.stat(CACHE_PATH).st_mtime
+
+
+def fresh(ip: str, ttl: float = CACHE_TTL) -> Optional[dict]:
+    """Return the cached entry for ``ip`` if it was validated less than ``ttl`` ago."""
+    with _lock:
+        entry = _load().get(ip)
+    if entry and entry.get('boot') is not None and time.time() - entry['checked'] < ttl:
+        return entry
+    return None
+
+
+def reusable(ip: str, mac: str, build: Optional[str], uptime: Optional[int]) -> Optional[dict]:
+    """Return a previous entry for the same device whose firmware info is still valid."""
+    with _lock:
+        cache = _load()
+        entry = cache.get(ip)
+        if not entry or entry.get('mac') != mac:
+            entry = next((e for e in cache.values() if e.get('mac') == mac), None)
+    if not entry or entry.get('build') != build:
+        return None
+    # Без времени работы перезагрузку не заметить — запись считаем устаревшей
+    if uptime is None or entry.get('boot') is None:
+        return None
+    if abs((time.time() - uptime) - entry['boot']) > BOOT_TOLERANCE:
+        return None
+    return entry
+
+
+def store(ip: str, info: dict, uptime: Optional[int]) -> None:
+    now = time.time()
+    entry = dict(info, checked=now, boot=None if uptime is None else now - uptime)
+    with _lock:
+        cache = _load()
+        for key in [k for k, e in cache.items() if k != ip and e.get('mac') == info.get('mac')]:
+            del cache[key]
+        cache[ip] = entry
+        _save()
+
+
+def invalidate(ip: str) -> None:
+    """Forget everything known about the device at ``ip`` (after reset or flashing)."""
+    with _lock:
+        cache = _load()
+        if cache.pop(ip, None) is not None:
+            _save()
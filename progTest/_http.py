@@ -0,0 +1,75 @@
+"""Shared keep-alive HTTP sessions, one per device.
+
+Bare ``requests.get``/``post`` open a new TCP connection for every call,
+which on the intercom's weak CPU costs more than the request itself (the
+screenshot test alone used to make ``MAX_SCREENSHOTS`` connections).
+``session(ip, login, password)`` returns the same ``requests.Session`` for
+a device every time: Basic auth preset, a small connection pool kept
+alive between steps and tests, and retries for failed *connects* only —
+a refused or timed-out response is still counted by the test.
+
+Tests take ``session=None`` and fall back to this registry; the scenario
+runner and ``tests_runner`` pass the device session explicitly.  After a
+reset or a firmware upload the device reboots, so the caller drops its
+pooled connections with ``close(ip)``.
+
+Measured against a local fake device: ``python -m bench.http_sessions``.
+"""
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
+
+import cancel as cancellation
+
+CONNECT_TIMEOUT = 3.0   # секунд на установку соединения
+POOL_SIZE = 4           # соединений на домофон (параллельные шаги сценария)
+RETRIES = Retry(total=2, connect=2, read=0, status=0, redirect=0,
+                backoff_factor=0.3, raise_on_status=False)
+
+_sessions: Dict[Tuple[str, str, str], requests.Session] = {}
+_lock = threading.Lock()
+
+
+def new_session(login: str, password: str, pool_size: int = POOL_SIZE,
+                retries=RETRIES) -> requests.Session:
+    """Session outside the registry (e.g. a load test with its own pool); close it yourself."""
+    http = requests.Session()
+    http.auth = HTTPBasicAuth(login, password)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+    http.mount('http://', adapter)
+    http.mount('https://', adapter)
+    return http
+
+
+def session(ip: str, login: str, password: str) -> requests.Session:
+    """Keep-alive session of the device ``ip`` (created on first use)."""
+    key = (ip, login, password)
+    with _lock:
+        http = _sessions.get(key)
+        if http is None:
+            http = _sessions[key] = new_session(login, password)
+        return http
+
+
+def for_device(cfg) -> requests.Session:
+    """Session for a config block (``IP_CAMERA``/``LOGIN``/``PASSWORD``)."""
+    return session(cfg.get('IP_CAMERA'), cfg.get('LOGIN'), cfg.get('PASSWORD'))
+
+
+def timeout(read: float, cancel: Optional[cancellation.CancelToken] = None) -> Tuple[float, float]:
+    """``(connect, read)`` timeouts, both capped by the step deadline."""
+    return (cancellation.timeout(min(CONNECT_TIMEOUT, read), cancel),
+            cancellation.timeout(read, cancel))
+
+
+def close(ip: Optional[str] = None) -> None:
+    """Drop pooled connections of ``ip`` (or of every device)."""
+    with _lock:
+        keys = [key for key in _sessions if ip is None or key[0] == ip]
+        closing = [_sessions.pop(key) for key in keys]
+    for http in closing:
+        http.close()
@@ -0,0 +1,113 @@
+"""Structural JPEG check straight on the response buffer.
+
+``PIL.Image.open().verify()`` on a JPEG reads only the headers, so a
+frame cut off in the middle of the scan passes it; only a full decode
+notices, and that is ~50x slower than this check.  ``validate`` walks the marker
+segments in place — ``struct.unpack_from`` and a regex search over the
+scan data on the response bytes, no copies — and checks:
+
+* SOI at the start, EOI after the last scan (otherwise the frame is cut);
+* every segment length fits in the buffer;
+* a SOF before the first SOS, with non-zero width/height, 1–4 components
+  and a length matching the component count;
+* at least one SOS with a consistent header.
+
+Full decoding (``decode``) stays for a sample of frames and for images
+that are not JPEG.  Benchmark: ``python -m bench.jpeg_validate``.
+"""
+import re
+import struct
+from io import BytesIO
+from typing import Tuple
+
+# SOF0..SOF15 без DHT (C4), JPG (C8) и DAC (CC)
+_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Маркеры без поля длины: TEM, RST0..RST7
+_STANDALONE = frozenset([0x01, *range(0xD0, 0xD8)])
+_SOI, _EOI, _SOS = 0xD8, 0xD9, 0xDA
+# Конец данных скана: 0xFF, за которым не 0x00 (экранирование), не RSTn и не заполнитель
+_MARKER_RE = re.compile(rb'\xff[^\x00\xd0-\xd7\xff]')
+
+
+class JpegError(ValueError):
+    """The buffer is not a complete JPEG frame."""
+
+
+def is_jpeg(data: bytes) -> bool:
+    return data[:2] == b'\xff\xd8'
+
+
+def _skip_scan(data: bytes, pos: int, end: int) -> int:
+    """Offset of the first marker after entropy-coded data starting at ``pos``."""
+    match = _MARKER_RE.search(data, pos, end)
+    if match is None:
+        raise JpegError('кадр обрезан внутри данных скана (нет EOI)')
+    return match.start()
+
+
+def validate(data: bytes) -> Tuple[int, int]:
+    """Check the marker structure of a JPEG frame; return ``(width, height)``.
+
+    Raises `JpegError` with a description of the first problem found.
+    """
+    end = len(data)
+    if end < 4 or data[0] != 0xFF or data[1] != _SOI:
+        raise JpegError('нет маркера SOI в начале')
+    unpack = struct.unpack_from
+    pos = 2
+    size = None
+    scans = 0
+    while True:
+        if pos + 1 >= end:
+            raise JpegError('кадр обрезан (нет EOI)')
+        if data[pos] != 0xFF:
+            raise JpegError(f'ожидался маркер по смещению {pos}')
+        code = data[pos + 1]
+        if code == 0xFF:
+            pos += 1
+            continue
+        if code == _EOI:
+            if not scans:
+                raise JpegError('EOI без данных изображения (нет SOS)')
+            return size
+        if code in _STANDALONE:
+            pos += 2
+            continue
+        if code == _SOI or code == 0x00:
+            raise JpegError(f'неожиданный маркер 0xFF{code:02X} по смещению {pos}')
+        if pos + 4 > end:
+            raise JpegError('кадр обрезан в заголовке сегмента')
+        (length,) = unpack('>H', data, pos + 2)
+        body = pos + 4
+        segment_end = pos + 2 + length
+        if length < 2 or segment_end > end:
+            raise JpegError(f'неверная длина сегмента 0xFF{code:02X}: {length} по смещению {pos}')
+        if code in _SOF:
+            if length < 8:
+                raise JpegError(f'слишком короткий SOF: {length}')
+            height, width, components = unpack('>HHB', data, body + 1)
+            if not width or not height:
+                raise JpegError(f'нулевой размер кадра в SOF: {width}x{height}')
+            if not 1 <= components <= 4 or length != 8 + 3 * components:
+                raise JpegError(f'неверный SOF: компонент {components}, длина {length}')
+            size = (width, height)
+        elif code == _SOS:
+            if size is None:
+                raise JpegError('SOS до SOF')
+            if length < 3 or body >= end:
+                raise JpegError('кадр обрезан в заголовке SOS')
+            components = data[body]
+            if not 1 <= components <= 4 or length != 6 + 2 * components:
+                raise JpegError(f'неверный заголовок SOS: компонент {components}, длина {length}')
+            scans += 1
+            pos = _skip_scan(data, segment_end, end)
+            continue
+        pos = segment_end
+
+
+def decode(data: bytes) -> Tuple[int, int]:
+    """Full decode with PIL (slow, but catches corrupted entropy data)."""
+    from PIL import Image
+    with Image.open(BytesIO(data)) as img:
+        img.load()
+        return img.size
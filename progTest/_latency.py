@@ -0,0 +1,80 @@
+"""Compact latency histogram for load tests.
+
+Latencies are counted in logarithmic buckets (``PRECISION`` relative
+width), so a million requests take a few hundred counters and any
+percentile is known within a few percent, whatever the spread.  Threads
+record into one histogram under its lock; histograms of several devices
+can be merged.
+"""
+import math
+import threading
+from typing import Dict
+
+PRECISION = 0.02     # относительная ширина корзины
+MIN_LATENCY = 1e-4   # всё быстрее 0.1 мс попадает в первую корзину
+
+_LOG_BASE = math.log1p(PRECISION)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'count', 'total', 'min', 'max', '_lock')
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(seconds: float) -> int:
+        return max(0, int(math.log(max(seconds, MIN_LATENCY) / MIN_LATENCY) / _LOG_BASE))
+
+    def record(self, seconds: float) -> None:
+        index = self._bucket(seconds)
+        with self._lock:
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+            self.count += 1
+            self.total += seconds
+            self.min = min(self.min, seconds)
+            self.max = max(self.max, seconds)
+
+    def merge(self, other: 'Histogram') -> None:
+        with self._lock:
+            for index, n in other.buckets.items():
+                self.buckets[index] = self.buckets.get(index, 0) + n
+            self.count += other.count
+            self.total += other.total
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> float:
+        """Latency (seconds) below which ``p`` percent of requests fall."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = max(1, math.ceil(self.count * p / 100))
+            seen = 0
+            for index in sorted(self.buckets):
+                seen += self.buckets[index]
+                if seen >= rank:
+                    # середина корзины, но не за пределами наблюдённых значений
+                    value = MIN_LATENCY * (1 + PRECISION) ** (index + 0.5)
+                    return min(max(value, self.min), self.max)
+            return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> dict:
+        """``count``, ``mean``/``p50``/``p95``/``p99``/``max`` in milliseconds."""
+        return {
+            'count': self.count,
+            'mean': round(self.mean * 1000, 1),
+            'p50': round(self.percentile(50) * 1000, 1),
+            'p95': round(self.percentile(95) * 1000, 1),
+            'p99': round(self.percentile(99) * 1000, 1),
+            'max': round(self.max * 1000, 1),
+        }
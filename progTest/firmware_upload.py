@@ -3,7 +3,10 @@ import requests
 import os
 from datetime import datetime
 
-def upload_firmware(ip, username, password, firmware_path):
+import cancel as cancellation
+from progTest import _device_cache, _http
+
+def upload_firmware(ip, username, password, firmware_path, cancel=None, session=None):
     """
     Загружает файл прошивки на устройство через upgrader.cgi.
 
@@ -12,6 +15,8 @@ def upload_firmware(ip, username, password, firmware_path):
         username: Имя пользователя для аутентификации.
         password: Пароль для аутентификации.
         firmware_path: Путь к файлу прошивки (rootfs.squashfs.gk7205v200.signed).
+        cancel: cancel.CancelToken — остановка прогона до начала загрузки.
+        session: requests.Session домофона (по умолчанию из progTest._http).
 
     Returns:
         dict: Результат загрузки:
@@ -19,12 +24,16 @@ def upload_firmware(ip, username, password, firmware_path):
               - 'error_message': Сообщение об ошибке (если есть).
     """
     url = f"http://{ip}/cgi-bin/upgrader.cgi"
+    http = session or _http.session(ip, username, password)
     try:
+        cancellation.check(cancel)
         with open(firmware_path, 'rb') as f:
             files = {'rootfs': ('rootfs.squashfs.gk7205v200.signed', f, 'application/octet-stream')}
-            response = requests.post(url, auth=(username, password), files=files, timeout=60)
+            response = http.post(url, files=files, timeout=60)
         
         if response.status_code == 200:
+            _device_cache.invalidate(ip)
+            _http.close(ip)
             return {'success': True, 'error_message': ''}
         else:
             return {'success': False, 'error_message': f"Код ответа: {response.status_code}"}
@@ -55,15 +64,17 @@ def reset_firmware(ip, username, password):
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
     }
     data = {"action": "reset"}
-    
+    _device_cache.invalidate(ip)
+    http = _http.session(ip, username, password)
+
     try:
-        requests.post(
+        http.post(
             url,
-            auth=(username, password),
             headers=headers,
             data=data,
             timeout=60
         )
+        _http.close(ip)
         return {'success': True, 'error_message': ''}
     except Exception as e:
         # Игнорируем ошибки, так как устройство перезагружается
@@ -1,19 +1,32 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import requests
-import time
+import os
 
-def run(ip: str, login: str, password: str) -> bool:
+import cancel as cancellation
+from progTest import _http
+
+# Куда домофон шлёт syslog: адрес машины, на которой запущен syslog_server.
+# Агенты (agent.py) задают свой адрес через переменную окружения SYSLOG_ADDRESS.
+DEFAULT_SYSLOG_ADDRESS = '192.168.0.69:5514'
+
+
+def run(ip: str, login: str, password: str, syslog_address: str = None, cancel=None,
+        session=None) -> bool:
     """
     Сбрасывает конфигурацию умного домофона и выполняет дополнительные настройки.
     :param ip: IP-адрес устройства (без порта)
     :param login: логин для HTTP-аутентификации
     :param password: пароль для HTTP-аутентификации
+    :param syslog_address: host:port syslog-сервера (по умолчанию SYSLOG_ADDRESS
+        из окружения или DEFAULT_SYSLOG_ADDRESS)
+    :param cancel: cancel.CancelToken — остановка прогона и бюджет времени шага
+    :param session: requests.Session домофона (по умолчанию из progTest._http)
     :return: True, если все запросы выполнены успешно (иначе бросает исключение)
     """
     base_url = f"http://{ip}"
-    auth = (login, password)
+    http = session or _http.session(ip, login, password)
+    syslog_address = syslog_address or os.environ.get('SYSLOG_ADDRESS', DEFAULT_SYSLOG_ADDRESS)
 
     # 1. Сброс конфигурации
     config_payload = {
@@ -76,34 +89,38 @@ def run(ip: str, login: str, password: str) -> bool:
     }
     print("Начало")
     url = f"{base_url}/api/v1/configuration"
-    resp = requests.put(url, json=config_payload, auth=auth, timeout=10)
+    resp = http.put(url, json=config_payload, timeout=_http.timeout(10, cancel))
     resp.raise_for_status()
 
     # Задержка 5 секунд после отправки конфига
-    time.sleep(10)
+    cancellation.sleep(10, cancel)
 
     # 2. Отключаем агент
-    requests.get(
+    cancellation.check(cancel)
+    http.get(
         f"{base_url}/cgi-bin/configManager.cgi?action=setConfig&Agent.Enable=false",
-        auth=auth, timeout=5
+        timeout=_http.timeout(5, cancel)
     ).raise_for_status()
 
     # 3. Отключаем автообновление
-    requests.get(
+    cancellation.check(cancel)
+    http.get(
         f"{base_url}/cgi-bin/configManager.cgi?action=setConfig&Autoupdate.Enable=false",
-        auth=auth, timeout=5
+        timeout=_http.timeout(5, cancel)
     ).raise_for_status()
 
     # 4. Включаем SysLOG на уровень 8
-    requests.get(
+    cancellation.check(cancel)
+    http.get(
         f"{base_url}/cgi-bin/configManager.cgi?action=setConfig&Syslog.Level=8",
-        auth=auth, timeout=5
+        timeout=_http.timeout(5, cancel)
     ).raise_for_status()
 
     # 5. Указываем SysLog сервер
-    requests.get(
-        f"{base_url}/cgi-bin/configManager.cgi?action=setConfig&Syslog.Address=192.168.0.69:5514",
-        auth=auth, timeout=5
+    cancellation.check(cancel)
+    http.get(
+        f"{base_url}/cgi-bin/configManager.cgi?action=setConfig&Syslog.Address={syslog_address}",
+        timeout=_http.timeout(5, cancel)
     ).raise_for_status()
 
     return True
@@ -1,90 +1,222 @@
 # screenshot.py
-import requests
+import threading
 import time
-import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from PIL import Image
-from io import BytesIO
 
-def run(ip, username, password, max_attempts=10, progress_callback=None):
-    """
-    Выполняет до max_attempts HTTP GET-запросов к http://{ip}/image.jpg и проверяет, является ли ответ действительным изображением.
-    Сохраняет успешные скриншоты в logs/screenshots/.
-    Выводит промежуточный прогресс в консоль.
-    Возвращает словарь:
-      - 'success': True (если успех ≥90%), False (иначе)
-      - 'success_rate': процент успешных запросов
-      - 'attempts': количество попыток
-      - 'successes': количество успешных запросов
-      - 'error_message': описание последней ошибки (если есть)
-    """
-    print(f"[{datetime.now()}] Начало теста скриншотов для IP {ip} (max_attempts={max_attempts})")
-    url = f"http://{ip}/image.jpg"
-    successes = 0
-    error_threshold = 100
-    consecutive_errors = 0
-    last_error = ""
+import requests
+from urllib3.exceptions import ReadTimeoutError
 
-    screenshot_dir = os.path.join("logs", "screenshots")
-    os.makedirs(screenshot_dir, exist_ok=True)
+import cancel as cancellation
+from progTest import _artifacts, _http, _jpeg
+from progTest._latency import Histogram
+from results import CANCELLED, FAIL, OK, TestResult
 
-    for i in range(max_attempts):
-        try:
-            response = requests.get(url, auth=(username, password), timeout=5)
-            if response.status_code != 200:
-                consecutive_errors += 1
-                last_error = f"Статус ответа: {response.status_code}"
-                continue
-
-            content_type = response.headers.get("Content-Type", "").lower()
-            if not content_type.startswith("image/"):
-                consecutive_errors += 1
-                last_error = f"Неверный Content-Type: {content_type}"
-                continue
-
-            content_length = len(response.content)
-            if content_length < 1024:
-                consecutive_errors += 1
-                last_error = f"Слишком маленький ответ: {content_length} байт"
-                continue
+# Столько ошибок подряд — и тест прерывается
+ERROR_THRESHOLD = 100
+# Каждый кадр проверяется по структуре JPEG, полностью декодируется каждый N-й
+DECODE_EVERY = 100
+# Тест успешен, если годных кадров не меньше этой доли (%)
+SUCCESS_THRESHOLD = 90.0
 
-            try:
-                img = Image.open(BytesIO(response.content))
-                img.verify()
-            except Exception as e:
-                consecutive_errors += 1
-                last_error = f"Невалидное изображение: {str(e)}"
-                continue
 
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-            screenshot_path = os.path.join(screenshot_dir, f"screenshot_{ip.replace(':', '_')}_{timestamp}.jpg")
-            with open(screenshot_path, 'wb') as f:
-                f.write(response.content)
+def _check(response, decode=False):
+    """(класс ошибки, описание) для негодного кадра или None, если кадр в порядке."""
+    if response.status_code != 200:
+        return f"http_{response.status_code}", f"Статус ответа: {response.status_code}"
+
+    content_type = response.headers.get("Content-Type", "").lower()
+    if not content_type.startswith("image/"):
+        return "content_type", f"Неверный Content-Type: {content_type}"
+
+    content_length = len(response.content)
+    if content_length < 1024:
+        return "too_small", f"Слишком маленький ответ: {content_length} байт"
+
+    try:
+        if _jpeg.is_jpeg(response.content):
+            _jpeg.validate(response.content)
+            if decode:
+                _jpeg.decode(response.content)
+        else:
+            _jpeg.decode(response.content)  # не JPEG — проверяем только декодированием
+    except Exception as e:
+        return "invalid_image", f"Невалидное изображение: {str(e)}"
+    return None
+
+
+class _Load:
+    """Общее состояние запросов одного прогона (все потоки нагрузки)."""
+
+    def __init__(self, max_attempts, rate):
+        self.max_attempts = max_attempts
+        self.rate = rate
+        self.issued = 0
+        self.done = 0
+        self.successes = 0
+        self.consecutive_errors = 0
+        self.last_error = ""
+        self.errors = Counter()
+        self.latency = Histogram()
+        self.stopped = False
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Номер следующего запроса и момент его отправки по графику (или None)."""
+        with self.lock:
+            if self.stopped or self.issued >= self.max_attempts:
+                return None, None
+            i = self.issued
+            self.issued += 1
+        slot = self.started + i / self.rate if self.rate else None
+        return i, slot
 
-            successes += 1
-            consecutive_errors = 0
 
+def _worker(load, http, url, ip, pack, progress_callback, cancel):
+    while True:
+        i, slot = load.take()
+        if i is None:
+            return
+        cancellation.check(cancel)
+        if slot is not None and slot > time.monotonic():
+            cancellation.sleep(slot - time.monotonic(), cancel)
+        # При заданной частоте задержка считается от запланированного момента:
+        # если домофон не успевает, ожидание очереди тоже входит в задержку
+        sent = slot if slot is not None else time.monotonic()
+        failure = None
+        try:
+            try:
+                response = http.get(url, timeout=_http.timeout(5, cancel))
+            finally:
+                # Таймауты и обрывы тоже попадают в гистограмму — это и есть хвост p95/p99
+                load.latency.record(time.monotonic() - sent)
+            failure = _check(response, decode=i % DECODE_EVERY == 0)
+            content_type = response.headers.get("Content-Type", "")
+            if failure is None:
+                pack.add(response.content, content_type=content_type)
+            elif response.content:
+                pack.add(response.content, ok=False, note=failure[1], content_type=content_type)
+        except requests.Timeout as e:
+            failure = "timeout", f"Ошибка: {str(e)}"
+        except requests.ConnectionError as e:
+            # С повторами только на соединение (_http.RETRIES) таймаут чтения
+            # приходит как ConnectionError(MaxRetryError(ReadTimeoutError))
+            reason = getattr(e.args[0], "reason", None) if e.args else None
+            kind = "timeout" if isinstance(reason, ReadTimeoutError) else "connect"
+            failure = kind, f"Ошибка: {str(e)}"
         except Exception as e:
-            consecutive_errors += 1
-            last_error = f"Ошибка: {str(e)}"
+            failure = "other", f"Ошибка: {str(e)}"
+
+        with load.lock:
+            load.done += 1
+            if failure is None:
+                load.successes += 1
+                load.consecutive_errors = 0
+            else:
+                load.consecutive_errors += 1
+                load.errors[failure[0]] += 1
+                load.last_error = failure[1]
+            done, successes = load.done, load.successes
+            if load.consecutive_errors >= ERROR_THRESHOLD and not load.stopped:
+                load.stopped = True
+                print(f"[{datetime.now()}] IP {ip}: Прервано из-за {load.consecutive_errors} последовательных ошибок: {load.last_error}")
+            if progress_callback:
+                progress_callback(done, load.max_attempts)
 
         # Выводим прогресс каждые 100 попыток
-        if (i + 1) % 100 == 0:
-            progress = round(((i + 1) / max_attempts) * 100, 1)
-            print(f"[{datetime.now()}] IP {ip}: Выполнено {i + 1}/{max_attempts} ({progress}%), Успехов: {successes}")
+        if done % 100 == 0:
+            progress = round((done / load.max_attempts) * 100, 1)
+            print(f"[{datetime.now()}] IP {ip}: Выполнено {done}/{load.max_attempts} ({progress}%), Успехов: {successes}")
+
+        if slot is None:
+            cancellation.sleep(0.01, cancel)
+
+
+def run(ip, username, password, max_attempts=10, concurrency=1, rate=0.0, keep_every=1,
+        progress_callback=None, cancel=None, session=None):
+    """
+    Выполняет до max_attempts HTTP GET-запросов к http://{ip}/image.jpg и проверяет, является ли ответ действительным изображением.
+    Кадр проверяется по структуре JPEG (`progTest._jpeg`), каждый
+    ``DECODE_EVERY``-й и не-JPEG ответы — полным декодированием PIL.
+    Кадры пишутся в фоне в один архив прогона logs/screenshots/<ip>_<ts>.pack
+    с индексом (`progTest._artifacts`): одинаковые кадры хранятся один раз,
+    из успешных сохраняется каждый ``keep_every``-й, неудачные — все.
+    Все запросы идут через одно keep-alive соединение (`progTest._http`).
+    Выводит промежуточный прогресс в консоль и, если передан
+    progress_callback(done, total), сообщает его после каждой попытки.
+
+    Нагрузочный режим: ``concurrency`` > 1 — столько запросов одновременно
+    (свой пул соединений такого размера, без повторов), ``rate`` > 0 —
+    целевая частота запросов в секунду на все потоки.  При заданной
+    частоте задержка считается от запланированного момента отправки.
 
-        if consecutive_errors >= error_threshold:
-            print(f"[{datetime.now()}] IP {ip}: Прервано из-за {consecutive_errors} последовательных ошибок: {last_error}")
-            break
+    Задержка учитывается для каждого запроса, включая таймауты и ошибки
+    соединения (время до отказа).
 
-        time.sleep(0.01)
+    Возвращает `results.TestResult`: статус ok, если успешных кадров не
+    меньше ``SUCCESS_THRESHOLD`` %, иначе fail, а при отмене (``cancel``)
+    — cancelled с уже сделанными попытками; в метриках и сообщении —
+    попытки, успехи и процент успеха, задержки p50/p95/p99 (мс),
+    пропускная способность (запросов/с) и число отказов по классам
+    (timeout, connect, http_<код>, content_type, too_small, invalid_image,
+    other).
+    """
+    max_attempts = int(max_attempts)
+    concurrency = max(1, int(concurrency or 1))
+    rate = float(rate or 0)
+    print(f"[{datetime.now()}] Начало теста скриншотов для IP {ip} (max_attempts={max_attempts}, "
+          f"concurrency={concurrency}, rate={rate or 'без ограничения'})")
+    url = f"http://{ip}/image.jpg"
 
-    attempts_made = i + 1
+    load = _Load(max_attempts, rate)
+    cancelled = None
+    with _artifacts.Pack(ip, keep_every) as pack:
+        worker_args = (url, ip, pack, progress_callback, cancel)
+        try:
+            if concurrency == 1:
+                http = session or _http.session(ip, username, password)
+                _worker(load, http, *worker_args)
+            else:
+                http = _http.new_session(username, password, pool_size=concurrency, retries=0)
+                try:
+                    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='screenshot') as pool:
+                        futures = [pool.submit(_worker, load, http, *worker_args) for _ in range(concurrency)]
+                        for future in futures:
+                            future.result()
+                finally:
+                    http.close()
+        except cancellation.Cancelled as e:
+            # Остановка или конец бюджета шага: отчитываемся о сделанных попытках
+            cancelled = e
+            load.stopped = True
+            print(f"[{datetime.now()}] IP {ip}: Отменено после {load.done}/{max_attempts}: {e}")
+        elapsed = time.monotonic() - load.started
+
+    attempts_made = load.done
+    successes = load.successes
     success_rate = round((successes / attempts_made) * 100, 2) if attempts_made > 0 else 0.0
-    success = success_rate >= 90.0
+    latency = load.latency.summary()
+    throughput = round(attempts_made / elapsed, 1) if elapsed > 0 else 0.0
 
+    metrics = {'Попыток': attempts_made, 'Успехов': successes, 'Успех': success_rate}
+    message = f": Попыток: {attempts_made}, Успехов: {successes}, Успех: {success_rate}%"
+    if latency['count']:
+        metrics.update({'p50': latency['p50'], 'p95': latency['p95'], 'p99': latency['p99'],
+                        'Запросов/с': throughput})
+        message += (f", p50: {latency['p50']} мс, p95: {latency['p95']} мс, p99: {latency['p99']} мс"
+                    f", Запросов/с: {throughput}")
+    if load.errors:
+        metrics['Отказов'] = sum(load.errors.values())
+        metrics.update(load.errors)
+        message += f", Отказов: {metrics['Отказов']}"
+        message += "".join(f", {kind}: {n}" for kind, n in load.errors.most_common())
+    if cancelled is not None:
+        status = CANCELLED
+        message += f", Отменено: {cancelled}"
+    else:
+        status = OK if attempts_made and success_rate >= SUCCESS_THRESHOLD else FAIL
     print(f"[{datetime.now()}] Попыток: {attempts_made}, Успехов: {successes}, Успех: {success_rate}%")
-    return (": Попыток: " + str(attempts_made) +
-        ", Успехов: " + str(successes) +
-        ", Успех: " + str(success_rate) + "%")
-
+    print(f"[{datetime.now()}] {pack.path}: {pack.summary()}")
+    return TestResult('screenshot', ip, status, metrics, artifacts=[pack.path] if pack.frames else [], message=message)
@@ -0,0 +1,139 @@
+"""Ход прогона: события шагов от воркеров до SSE.
+
+Сценарий публикует в `Progress` события ``start`` (сколько домофонов и
+шагов) и ``step`` (домофон, шаг, процент).  Долгие шаги сообщают процент
+сами через ``progress_callback(done, total)`` (например, скриншоты
+``i/max_attempts``); колбэк отбрасывает повторы одного и того же процента.
+Для заданий очереди (`jobs`) события сворачиваются в `Snapshot`; его
+состояние отдают ``/api/jobs/<id>`` и SSE-поток ``/api/jobs/<id>/stream``
+(`sse_stream`: не больше одного сообщения за ``interval`` секунд).
+"""
+import json
+import multiprocessing
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+SSE_INTERVAL = 0.5       # не чаще одного сообщения в столько секунд
+
+
+class Progress:
+    """Queue of progress events shared by the workers of one run."""
+
+    def __init__(self, events=None):
+        self.events = events if events is not None else queue.Queue()
+
+    def publish(self, event: dict) -> None:
+        self.events.put(event)
+
+    def start(self, devices: int, steps: int) -> None:
+        self.publish({'type': 'start', 'devices': devices, 'steps': steps})
+
+    def step(self, device: str, step: str, percent: float, status: Optional[str] = None) -> None:
+        event = {'type': 'step', 'device': device, 'step': step, 'percent': percent}
+        if status:
+            event['status'] = status
+        self.publish(event)
+
+    def callback(self, device: str, step: str) -> Callable[[int, int], None]:
+        """``progress_callback(done, total)`` for a long step."""
+        last = [-1]
+
+        def report(done: int, total: int) -> None:
+            percent = int(done * 100 / total) if total else 100
+            if percent != last[0]:
+                last[0] = percent
+                self.step(device, step, percent)
+        return report
+
+    def __getstate__(self):
+        if isinstance(self.events, queue.Queue):
+            raise TypeError('Progress с queue.Queue нельзя передать в другой процесс, см. across_processes')
+        return self.__dict__
+
+
+@contextmanager
+def across_processes(progress: Optional[Progress]):
+    """Yield a picklable ``Progress`` whose events are relayed into ``progress``."""
+    if progress is None:
+        yield None
+        return
+    manager = multiprocessing.Manager()
+    remote = Progress(manager.Queue())
+
+    def relay():
+        while True:
+            event = remote.events.get()
+            if event is None:
+                return
+            progress.publish(event)
+
+    thread = threading.Thread(target=relay, daemon=True)
+    thread.start()
+    try:
+        yield remote
+    finally:
+        remote.events.put(None)
+        thread.join()
+        manager.shutdown()
+
+
+class _Tracker:
+    """Overall percent from ``start``/``step`` events."""
+
+    def __init__(self):
+        self.total = 0
+        self.steps: Dict[Tuple[str, str], float] = {}
+        self.current: Dict[str, dict] = {}
+
+    def update(self, event: dict) -> None:
+        if event['type'] == 'start':
+            self.total = event['devices'] * event['steps']
+        elif event['type'] == 'step':
+            self.steps[(event['device'], event['step'])] = event['percent']
+            self.current[event['device']] = {'step': event['step'], 'percent': event['percent']}
+
+    @property
+    def percent(self) -> int:
+        if not self.total:
+            return 0
+        return min(99, int(sum(self.steps.values()) / self.total))
+
+
+class Snapshot:
+    """Event sink for ``Progress`` that keeps only the latest state (for polling)."""
+
+    def __init__(self):
+        self._tracker = _Tracker()
+        self._lock = threading.Lock()
+
+    def put(self, event: Optional[dict]) -> None:
+        if event is None:
+            return
+        with self._lock:
+            self._tracker.update(event)
+
+    def state(self) -> dict:
+        with self._lock:
+            return {'progress': self._tracker.percent, 'devices': dict(self._tracker.current)}
+
+
+def sse_stream(state: Callable[[], dict], interval: float = SSE_INTERVAL) -> Iterator[str]:
+    """Yield ``state()`` as SSE messages until it reports ``done``.
+
+    ``state`` is polled every ``interval`` seconds and only changes are sent,
+    so the browser gets at most one message per interval however often the
+    workers publish steps.
+    """
+    sent = None
+    while True:
+        message = state()
+        encoded = json.dumps(message, ensure_ascii=False, sort_keys=True)
+        if encoded != sent:
+            sent = encoded
+            yield f"data: {encoded}\n\n"
+        if message.get('done'):
+            return
+        time.sleep(interval)
@@ -0,0 +1,180 @@
+"""Structured test results.
+
+Every test step produces a :class:`TestResult`.  Results of a run are
+appended to ``logs/<kind>_<ts>.jsonl`` one JSON object per line as soon
+as they are known, and the human-readable ``.txt`` log is rendered from
+the same records, so the UI and aggregation can read fields directly
+instead of parsing text.
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional
+
+from cancel import Cancelled
+
+# Статусы результата
+OK = 'ok'
+FAIL = 'fail'
+ERROR = 'error'        # тест упал с исключением
+SKIPPED = 'skipped'
+CANCELLED = 'cancelled'  # прогон остановлен или шаг не уложился в своё время
+
+# Признаки неуспеха в свободном тексте, который возвращают тесты progTest
+_FAIL_MARKERS = ('ошибка', 'не удалось', 'неуспеш', 'неверное значение', 'error', 'failed', '❌')
+_SKIP_MARKERS = ('отключён', 'отключен')
+
+# «Успехов: 27», «Успех: 90.0%», «API метод: 3 из 5 попыток»
+_METRIC_RE = re.compile(r'([^\n:,]+?):\s*(-?\d+(?:\.\d+)?)\s*%?(?:\s*из\s*(\d+))?')
+
+
+class TestResult:
+    """Outcome of one test on one device."""
+
+    __slots__ = ('test', 'device', 'status', 'metrics', 'duration',
+                 'started', 'finished', 'artifacts', 'message')
+
+    def __init__(self, test: str, device: str, status: str = OK,
+                 metrics: Optional[dict] = None, duration: float = 0.0,
+                 started: Optional[float] = None, finished: Optional[float] = None,
+                 artifacts: Optional[List[str]] = None, message: str = ''):
+        self.test = test
+        self.device = device
+        self.status = status
+        self.metrics = metrics or {}
+        self.duration = duration
+        self.started = started
+        self.finished = finished
+        self.artifacts = artifacts or []
+        self.message = message
+
+    @property
+    def ok(self) -> bool:
+        return self.status in (OK, SKIPPED)
+
+    def line(self, title: Optional[str] = None) -> str:
+        """Text log line: ``<title>: <message>``."""
+        return f'{title or self.test}: {self.message}'
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'TestResult':
+        return cls(**{name: data.get(name) for name in cls.__slots__ if name in data})
+
+    def __repr__(self) -> str:
+        return f'TestResult({self.test!r}, {self.device!r}, {self.status!r})'
+
+
+def classify(message: str) -> str:
+    """Guess the status from a free-form result string."""
+    text = message.lower()
+    if any(marker in text for marker in _SKIP_MARKERS):
+        return SKIPPED
+    if any(marker in text for marker in _FAIL_MARKERS):
+        return FAIL
+    return OK
+
+
+def extract_metrics(message: str) -> dict:
+    """Pull ``label: number`` pairs (and ``N из M``) out of a result string."""
+    metrics = {}
+    for label, value, total in _METRIC_RE.findall(message):
+        label = label.strip()
+        metrics[label] = float(value) if '.' in value else int(value)
+        if total:
+            metrics[f'{label} (всего)'] = int(total)
+    return metrics
+
+
+def from_value(test: str, device: str, value, started: float, finished: float) -> TestResult:
+    """Build a result from whatever a test returned (str, bool, dict or TestResult)."""
+    if isinstance(value, TestResult):
+        # Тест сам выставил статус и метрики; имя шага и устройство — от вызывающего
+        value.test, value.device = test, device
+        value.started = value.started or started
+        value.finished = value.finished or finished
+        value.duration = value.duration or round(finished - started, 2)
+        return value
+    if isinstance(value, bool):
+        status, metrics = (OK if value else FAIL), {}
+    elif isinstance(value, dict):
+        metrics = dict(value)
+        status = OK if metrics.get('success', True) else FAIL
+    else:
+        status, metrics = classify(str(value)), extract_metrics(str(value))
+    return TestResult(test, device, status, metrics, round(finished - started, 2),
+                      started, finished, message=str(value))
+
+
+def measure(test: str, device: str, func, *args, **kwargs) -> TestResult:
+    """Call ``func`` and wrap its return value (or exception) into a result."""
+    started = time.time()
+    try:
+        value = func(*args, **kwargs)
+    except Cancelled as e:
+        finished = time.time()
+        return TestResult(test, device, CANCELLED, duration=round(finished - started, 2),
+                          started=started, finished=finished, message=f'Отменено: {e}')
+    except Exception as e:
+        finished = time.time()
+        return TestResult(test, device, ERROR, duration=round(finished - started, 2),
+                          started=started, finished=finished, message=f'Ошибка: {e}')
+    return from_value(test, device, value, started, time.time())
+
+
+class ResultSink:
+    """Append-only JSONL writer shared by the threads of one run."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, result: TestResult) -> None:
+        line = json.dumps(result.to_dict(), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def extend(self, results: Iterable[TestResult]) -> None:
+        for result in results:
+            self.write(result)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> 'ResultSink':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_results(path: str) -> Iterator[TestResult]:
+    """Read records back from a JSONL file, skipping a torn last line."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield TestResult.from_dict(json.loads(line))
+            except ValueError:
+                continue
+
+
+def render_device(cfg: dict, results: List[TestResult], titles: Optional[dict] = None) -> List[str]:
+    """Text block of one device: config line, one line per result, timing."""
+    titles = titles or {}
+    lines = [' '.join(f'{k}={v}' for k, v in cfg.items())]
+    lines.extend(r.line(titles.get(r.test)) for r in results)
+    timed = [r for r in results if r.started and r.finished]
+    if timed:
+        elapsed = max(r.finished for r in timed) - min(r.started for r in timed)
+        finished = max(r.finished for r in timed)
+        lines.append(f'Время выполнения (сек): {round(elapsed, 2)}')
+        lines.append(f"Текущее время: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(finished))}")
+    return lines
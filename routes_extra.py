@@ -1,12 +1,9 @@
 from flask import (
     Blueprint, render_template, jsonify, request,
-    send_from_directory, Response, stream_with_context
+    send_from_directory
 )
 import os
-import time
-import json
 from werkzeug.utils import secure_filename
-from PIL import Image
 
 extra_bp = Blueprint('extra', __name__)
 
@@ -68,6 +65,7 @@ def upload_file(version):
 
     # Если это изображение, сохраняем как info.png или info1.png, info2.png и т.д.
     if file.mimetype.startswith('image/'):
+        from PIL import Image
         try:
             img = Image.open(file.stream)
             img = img.convert('RGBA')
@@ -108,23 +106,9 @@ def delete_file(version, filename):
 
 # ===================== TEST RUN ROUTES =====================
 
-@extra_bp.route('/start2_progress')
+@extra_bp.route('/start2_progress', methods=['POST'])
 def start2_progress():
-    """Run Regression test with progress via Server-Sent Events."""
-    import Regression as regression
-
-    def generate():
-        devices = regression.load_device_configs('config.txt')
-        total = len(devices)
-        if total == 0:
-            yield f"data: {json.dumps({'progress': 100, 'done': True, 'result': 'Нет устройств'})}\n\n"
-            return
-        for idx in range(1, total + 1):
-            pct = int(idx / total * 100)
-            yield f"data: {json.dumps({'progress': pct, 'done': False})}\n\n"
-            time.sleep(0.1)
-        final = regression.run()
-        yield f"data: {json.dumps({'progress': 100, 'done': True, 'result': final})}\n\n"
-
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    """Queue a Regression run; step progress streams from /api/jobs/<id>/stream."""
+    from jobs import submit_response
+    return submit_response('regression')
 
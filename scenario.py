@@ -0,0 +1,316 @@
+"""Сценарии прогона, описанные данными (``scenarios/<name>.toml``).
+
+Сценарий — граф шагов.  Шаг вызывает функцию ``module:function`` с
+аргументами, где строка ``"$KEY"`` подставляет значение ``KEY`` из блока
+домофона в config.txt (или из ``[defaults]`` сценария; тип приводится к
+типу значения по умолчанию).  ``after`` перечисляет шаги, которые должны
+завершиться раньше; независимые шаги одного домофона выполняются
+одновременно.  ``progress = "progress_callback"`` передаёт шагу колбэк
+прогресса под этим именем (см. `progress`), ``timeout`` — бюджет времени
+шага в секундах: функции с аргументом ``cancel`` получают токен
+(`cancel.CancelToken`) с этим дедлайном, с аргументом ``session`` —
+keep-alive сессию домофона (`progTest._http`).  Время шагов с числом
+попыток растёт вместе с ним: ``timeout_per = ["$MAX_SCREENSHOTS", 6]``
+добавляет к ``timeout`` по 6 секунд на каждую попытку.  Без ``timeout``
+(или ``timeout = 0``) шаг ограничен только общей отменой.  Пример::
+
+    name = "regression"
+
+    [defaults]
+    MAX_SCREENSHOTS = 30
+
+    [[step]]
+    id = "screenshot"
+    title = "Скриншоты"
+    call = "progTest.screenshot:run"
+    args = ["$IP_CAMERA", "$LOGIN", "$PASSWORD", "$MAX_SCREENSHOTS"]
+    after = ["message_start"]
+
+Результат шага — `results.TestResult` с ``test`` = id шага.
+"""
+import contextlib
+import functools
+import importlib
+import inspect
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ModuleNotFoundError:
+        tomllib = None
+
+import cancel as cancellation
+from cancel import CancelToken
+from orchestrator import DEFAULT_MODE, run_devices
+from progress import Progress, across_processes
+from progTest import _http
+from ping_utils import filter_reachable_devices
+from results import CANCELLED, ResultSink, TestResult, measure, render_device
+from syslog_server import start_syslog_server, stop_syslog_server
+
+SCENARIO_DIR = 'scenarios'
+STOP_MESSAGE = 'Принудительное завершение'
+
+
+class ScenarioError(ValueError):
+    """Invalid scenario file."""
+
+
+class Step:
+    __slots__ = ('id', 'title', 'call', 'args', 'after', 'progress', 'timeout', 'timeout_per',
+                 '_func', '_params')
+
+    def __init__(self, id: str, call: str, args: list, after: List[str], title: Optional[str] = None,
+                 progress: Optional[str] = None, timeout: Optional[float] = None,
+                 timeout_per: Optional[list] = None):
+        self.id = id
+        self.title = title or id
+        self.call = call
+        self.args = args
+        self.after = after
+        self.progress = progress    # имя аргумента для колбэка прогресса (progress_callback)
+        self.timeout = timeout      # бюджет времени шага, секунд
+        self.timeout_per = timeout_per  # [число попыток или "$KEY", секунд на попытку]
+        self._func = None
+        self._params = frozenset()   # имена аргументов функции: cancel, session
+
+    @property
+    def func(self) -> Callable:
+        """Resolve ``module:function`` on first use (progTest is imported lazily)."""
+        if self._func is None:
+            module, _, name = self.call.partition(':')
+            func = getattr(importlib.import_module(module), name)
+            try:
+                self._params = frozenset(inspect.signature(func).parameters)
+            except (TypeError, ValueError):
+                self._params = frozenset()
+            self._func = func
+        return self._func
+
+    @staticmethod
+    def _value(arg, cfg: dict, defaults: dict):
+        if isinstance(arg, str) and arg.startswith('$'):
+            key = arg[1:]
+            default = defaults.get(key)
+            value = cfg.get(key, default)
+            if value is not None and default is not None and not isinstance(value, type(default)):
+                value = type(default)(value)
+            return value
+        return arg
+
+    def bind(self, cfg: dict, defaults: dict) -> list:
+        return [self._value(arg, cfg, defaults) for arg in self.args]
+
+    def budget(self, cfg: dict, defaults: dict) -> Optional[float]:
+        """Time budget for this device, seconds (None — no deadline)."""
+        if not self.timeout:
+            return None
+        if not self.timeout_per:
+            return self.timeout
+        count, seconds = self.timeout_per
+        return self.timeout + float(self._value(count, cfg, defaults) or 0) * seconds
+
+
+def _unavailable(call: str, error: Exception, *args, **kwargs):
+    raise RuntimeError(f'не удалось загрузить {call}: {error}')
+
+
+class Scenario:
+    def __init__(self, name: str, steps: List[Step], defaults: dict, max_parallel: Optional[int] = None):
+        self.name = name
+        self.steps = steps
+        self.defaults = defaults
+        self.max_parallel = max_parallel or len(steps)
+        self.titles = {step.id: step.title for step in steps}
+        self._validate()
+
+    def _validate(self) -> None:
+        ids = [step.id for step in self.steps]
+        if len(set(ids)) != len(ids):
+            raise ScenarioError(f'{self.name}: повторяющиеся id шагов')
+        for step in self.steps:
+            if ':' not in step.call:
+                raise ScenarioError(f'{self.name}/{step.id}: call должен иметь вид module:function')
+            if step.timeout_per is not None and (len(step.timeout_per) != 2 or not step.timeout):
+                raise ScenarioError(f'{self.name}/{step.id}: timeout_per = [попыток, секунд] задаётся вместе с timeout')
+            unknown = set(step.after) - set(ids)
+            if unknown:
+                raise ScenarioError(f'{self.name}/{step.id}: неизвестные шаги в after: {sorted(unknown)}')
+        # Проверка на циклы: снимаем шаги без невыполненных зависимостей
+        done, pending = set(), list(self.steps)
+        while pending:
+            ready = [s for s in pending if set(s.after) <= done]
+            if not ready:
+                raise ScenarioError(f'{self.name}: цикл в after: {[s.id for s in pending]}')
+            done.update(s.id for s in ready)
+            pending = [s for s in pending if s.id not in done]
+
+    def _run_step(self, step: Step, cfg: dict, progress: Optional[Progress],
+                  cancel: Optional[CancelToken]) -> TestResult:
+        ip = cfg.get('IP_CAMERA')
+        kwargs = {}
+        if progress:
+            progress.step(ip, step.id, 0)
+            if step.progress:
+                kwargs[step.progress] = progress.callback(ip, step.id)
+        try:
+            func = step.func
+        except (ImportError, AttributeError) as e:
+            func = functools.partial(_unavailable, step.call, e)
+        if cancel is not None and 'cancel' in step._params:
+            kwargs['cancel'] = cancel.child(step.budget(cfg, self.defaults))
+        if 'session' in step._params:
+            kwargs['session'] = _http.for_device(cfg)
+        result = measure(step.id, ip, func, *step.bind(cfg, self.defaults), **kwargs)
+        if progress:
+            progress.step(ip, step.id, 100, result.status)
+        return result
+
+    def run(self, cfg: dict, progress: Optional[Progress] = None,
+            cancel: Optional[CancelToken] = None) -> List[TestResult]:
+        """Run all steps for one device; results come back in definition order.
+
+        After ``cancel`` fires, steps that have not started are recorded as
+        cancelled, running ones stop at their next check, and the device is
+        told that the run was stopped.
+        """
+        ip = cfg.get('IP_CAMERA')
+        results: Dict[str, TestResult] = {}
+        waiting = list(self.steps)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix=f'{self.name}-step') as pool:
+            while waiting or running:
+                if cancel is not None and cancel.cancelled:
+                    for step in waiting:
+                        results[step.id] = TestResult(step.id, ip, CANCELLED, message=f'Не запущен: {cancel.reason}')
+                    waiting = []
+                for step in [s for s in waiting if all(dep in results for dep in s.after)]:
+                    waiting.remove(step)
+                    future = pool.submit(self._run_step, step, cfg, progress, cancel)
+                    running[future] = step
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    results[running.pop(future).id] = future.result()
+        if cancel is not None and cancel.cancelled:
+            _notify_stopped(cfg)
+        return [results[step.id] for step in self.steps]
+
+
+def _notify_stopped(cfg: dict) -> None:
+    """Show on the intercom display that the run was stopped."""
+    from progTest.Send_Text import run as send_text
+    ip = cfg.get('IP_CAMERA')
+    status = send_text(ip, cfg.get('LOGIN'), cfg.get('PASSWORD'), STOP_MESSAGE, 10)
+    print(f"[{ip}] Прогон остановлен, уведомление: {status}")
+
+
+_cache: Dict[str, tuple] = {}
+_cache_lock = threading.Lock()
+
+
+def scenario_path(name: str) -> str:
+    return name if name.endswith('.toml') else os.path.join(SCENARIO_DIR, f'{name}.toml')
+
+
+def load_scenario(name: str) -> Scenario:
+    """Load ``scenarios/<name>.toml`` (or a path), cached by mtime."""
+    if tomllib is None:
+        raise RuntimeError('Для сценариев нужен Python 3.11+ (tomllib) или пакет tomli')
+    path = scenario_path(name)
+    mtime = os.stat(path).st_mtime
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(path, 'rb') as f:
+        data = tomllib.load(f)
+    try:
+        steps = [Step(s['id'], s['call'], list(s.get('args', [])), list(s.get('after', [])),
+                      s.get('title'), s.get('progress'), s.get('timeout'), s.get('timeout_per'))
+                 for s in data.get('step', [])]
+    except KeyError as e:
+        raise ScenarioError(f'{path}: у шага нет поля {e}') from None
+    scenario = Scenario(data.get('name', os.path.splitext(os.path.basename(path))[0]),
+                        steps, data.get('defaults', {}), data.get('max_parallel'))
+    with _cache_lock:
+        _cache[path] = (mtime, scenario)
+    return scenario
+
+
+def run_scenario(name: str, cfg: dict, progress: Optional[Progress] = None,
+                 cancel: Optional[CancelToken] = None) -> List[TestResult]:
+    """``handle_one`` for any scenario: run it on one device config."""
+    return load_scenario(name).run(cfg, progress, cancel)
+
+
+def run_fleet(name: str, devices: List[dict], log_prefix: str, on_result=None,
+              concurrency: Optional[int] = None, mode: Optional[str] = None,
+              progress: Optional[Progress] = None, cancel: Optional[CancelToken] = None) -> str:
+    """Run scenario ``name`` on all reachable ``devices`` and return the text log.
+
+    Writes ``logs/<log_prefix>_<ts>.txt`` and the result records next to it
+    as ``.jsonl``; ``on_result`` gets each record as soon as it is known.
+    Step progress of every device is published to ``progress``.
+
+    The run registers a cancel token (``cancel`` or a new one), so
+    ``cancel.cancel_all()`` (``POST /stop``) ends it within about a second
+    with partial results in the logs.  Only the ``'threads'`` mode can be
+    stopped this way: the token does not cross process boundaries.
+    """
+    scenario = load_scenario(name)  # ошибки сценария — до опроса домофонов
+    token = cancel or CancelToken()
+    cancellation.register(token)
+    start_syslog_server()
+    try:
+        if not devices:
+            return "Нет устройств в config.txt"
+
+        devices, warnings = filter_reachable_devices(devices)
+        if not devices:
+            warnings.append("\u26a0\ufe0f \"Не удалось подключиться ни к одному домофону. Тестирование отменено.\"")
+            return "\n".join(warnings)
+
+        log_dir = 'logs'
+        os.makedirs(log_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        log_path = os.path.join(log_dir, f"{log_prefix}_{timestamp}.txt")
+
+        lines = list(warnings)
+        if progress:
+            progress.start(len(devices), len(scenario.steps))
+        in_process = (mode or DEFAULT_MODE) != 'processes'
+        if in_process:
+            shared = contextlib.nullcontext(progress)
+        else:
+            shared = across_processes(progress)
+        with shared as events, ResultSink(log_path[:-4] + '.jsonl') as sink:
+            handler = functools.partial(run_scenario, name, progress=events,
+                                        cancel=token if in_process else None)
+            # устройства отдаются по порядку config.txt, записи пишутся по мере готовности
+            for cfg, results in run_devices(handler, devices, concurrency, mode):
+                for result in results:
+                    sink.write(result)
+                    if on_result:
+                        on_result(result)
+                lines.extend(render_device(cfg, results, scenario.titles))
+                lines.append("")
+
+        log_text = "\n".join(lines).strip()
+
+        # Текстовый лог строится из тех же записей
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            log_file.write(log_text)
+
+        return log_text
+    finally:
+        cancellation.unregister(token)
+        stop_syslog_server()
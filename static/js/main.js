@@ -38,72 +38,64 @@ document.addEventListener('DOMContentLoaded', () => {
     clearInterval(timerInterval);
   }
 
+  // Прогон ставится в очередь заданий, ход приходит SSE-потоком /api/jobs/<id>/stream
+  function runJob(url, label) {
+    progressBar.value = 0;
+    output.textContent = 'Постановка в очередь...';
+    startTimer();
+    const finish = text => {
+      output.textContent = text;
+      stopTimer();
+      currentEvt = null;
+      if (stopBtn) stopBtn.disabled = true;
+    };
+    fetch(url, {method: 'POST'})
+      .then(r => r.json())
+      .then(job => {
+        if (!job.id) {
+          finish(job.error || `Ошибка запуска ${label}.`);
+          return;
+        }
+        const evt = new EventSource(`/api/jobs/${job.id}/stream`);
+        // СТОП не закрывает поток: ждём статус cancelled и частичный результат
+        const run = {stopping: false, close: () => { run.stopping = true; }};
+        currentEvt = run;
+        if (stopBtn) stopBtn.disabled = false;
+        evt.onmessage = e => {
+          const msg = JSON.parse(e.data);
+          progressBar.value = msg.progress;
+          if (msg.done) {
+            evt.close();
+            const prefix = msg.status === 'cancelled' ? 'Прогон остановлен.\n' : '';
+            finish(prefix + (msg.result || ''));
+            return;
+          }
+          const steps = Object.entries(msg.steps)
+            .map(([ip, s]) => `${ip}: ${s.step} ${s.percent}%`);
+          if (run.stopping) {
+            output.textContent = 'Остановка...';
+          } else {
+            output.textContent = msg.status === 'queued' ? 'В очереди...' : steps.join('\n');
+          }
+        };
+        evt.onerror = () => {
+          evt.close();
+          finish(`Ошибка соединения ${label}.`);
+        };
+      })
+      .catch(() => finish(`Ошибка соединения ${label}.`));
+  }
+
   // Start 1
   const start1Btn = document.getElementById('start1Btn');
   if (start1Btn) {
-    start1Btn.addEventListener('click', () => {
-      progressBar.value = 0;
-      output.textContent = '';
-      startTimer();
-
-      const evt1 = new EventSource('/start1_progress');
-      currentEvt = evt1;
-      if (stopBtn) stopBtn.disabled = false;
-      evt1.onmessage = e => {
-        const msg = JSON.parse(e.data);
-        if (msg.progress !== undefined) {
-          progressBar.value = msg.progress;
-        }
-        if (msg.done) {
-          output.textContent = msg.result;
-          stopTimer();
-          evt1.close();
-          currentEvt = null;
-          if (stopBtn) stopBtn.disabled = true;
-        }
-      };
-      evt1.onerror = () => {
-        output.textContent = 'Ошибка соединения Старт 1.';
-        stopTimer();
-        evt1.close();
-        currentEvt = null;
-        if (stopBtn) stopBtn.disabled = true;
-      };
-    });
+    start1Btn.addEventListener('click', () => runJob('/start1_progress', 'Старт 1'));
   }
 
   // Start 2
   const start2Btn = document.getElementById('start2Btn');
   if (start2Btn) {
-    start2Btn.addEventListener('click', () => {
-      progressBar.value = 0;
-      output.textContent = '';
-      startTimer();
-
-      const evt2 = new EventSource('/start2_progress');
-      currentEvt = evt2;
-      if (stopBtn) stopBtn.disabled = false;
-      evt2.onmessage = e => {
-        const msg = JSON.parse(e.data);
-        if (msg.progress !== undefined) {
-          progressBar.value = msg.progress;
-        }
-        if (msg.done) {
-          output.textContent = msg.result;
-          stopTimer();
-          evt2.close();
-          currentEvt = null;
-          if (stopBtn) stopBtn.disabled = true;
-        }
-      };
-      evt2.onerror = () => {
-        output.textContent = 'Ошибка соединения Старт 2.';
-        stopTimer();
-        evt2.close();
-        currentEvt = null;
-        if (stopBtn) stopBtn.disabled = true;
-      };
-    });
+    start2Btn.addEventListener('click', () => runJob('/start2_progress', 'Старт 2'));
   }
 
 // Start 3
@@ -172,11 +164,18 @@ if (start3Btn) {
       return row;
     }
 
+    // Заголовок блока: [defaults] или [<группа>] (см. inventory.py); пусто — блок домофона
+    function blockHeader(block) {
+      return block.querySelector('.block-header').value.trim().replace(/^\[|\]$/g, '').trim();
+    }
+
     function updateDoorphoneHeaders() {
       const blocks = doorphonesEl.querySelectorAll('.doorphone-block');
+      let number = 0;
       blocks.forEach((b, idx) => {
         const title = b.querySelector('.doorphone-title');
-        title.textContent = `\u0414\u043e\u043c\u043e\u0444\u043e\u043d #${idx}`; // Домофон
+        const name = blockHeader(b);
+        title.textContent = name ? `[${name}]` : `\u0414\u043e\u043c\u043e\u0444\u043e\u043d #${number++}`; // Домофон
         const delBtn = b.querySelector('.delete-doorphone');
         if (idx === 0) {
           delBtn.style.visibility = 'hidden';
@@ -197,6 +196,13 @@ if (start3Btn) {
       title.className = 'doorphone-title';
       header.appendChild(title);
 
+      const headerInput = document.createElement('input');
+      headerInput.type = 'text';
+      headerInput.className = 'block-header';
+      headerInput.placeholder = '[defaults] или [группа]';
+      headerInput.addEventListener('input', updateDoorphoneHeaders);
+      header.appendChild(headerInput);
+
       const del = document.createElement('span');
       del.className = 'delete-doorphone';
       del.textContent = '🗑️';
@@ -231,8 +237,12 @@ if (start3Btn) {
     initialConfig.split(/\r?\n/).forEach(line => {
       const trimmed = line.trim();
       if (!trimmed) return;
+      const headerMatch = trimmed.match(/^\[\s*([\w.-]+)\s*\]$/);
       if (trimmed === '__________________') {
         currentBlock = createDoorphoneBlock();
+      } else if (headerMatch) {
+        currentBlock.querySelector('.block-header').value = headerMatch[1];
+        updateDoorphoneHeaders();
       } else {
         const idx = trimmed.indexOf('=');
         if (idx !== -1) {
@@ -265,6 +275,10 @@ if (start3Btn) {
       const blocks = doorphonesEl.getElementsByClassName('doorphone-block');
       let lines = [];
       for (let i = 0; i < blocks.length; i++) {
+        const name = blockHeader(blocks[i]);
+        if (name) {
+          lines.push('[' + name + ']');
+        }
         const rows = blocks[i].querySelectorAll('.var-row');
         rows.forEach(row => {
           const n = row.querySelector('.var-name').value.trim();
@@ -0,0 +1,169 @@
+"""Счётчики и гистограммы приёма syslog.
+
+Всё хранится в памяти процесса-владельца слушателя (см. syslog_server) и
+отдаётся снимком через :meth:`SyslogMetrics.snapshot`.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Границы корзин гистограмм задержки, мс (последняя корзина — всё, что больше)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+RATE_WINDOW = 10.0  # окно расчёта скорости по источнику, с
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with approximate percentiles."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 3) if self.count else None,
+            'max_ms': round(self.max, 3),
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets_ms': dict(zip([str(b) for b in self.bounds] + ['inf'], self.counts)),
+        }
+
+
+class _Source:
+    __slots__ = ('messages', 'bytes', 'failures', 'last_seen',
+                 'window_start', 'window_count', 'rate')
+
+    def __init__(self, now: float):
+        self.messages = 0
+        self.bytes = 0
+        self.failures = 0
+        self.last_seen = now
+        self.window_start = now
+        self.window_count = 0
+        self.rate = 0.0
+
+
+class SyslogMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.time()
+            self.received = 0
+            self.bytes = 0
+            self.failures = 0
+            self.dropped = 0
+            self.sources: Dict[str, _Source] = {}
+            self.queue_latency = Histogram()
+            self.write_latency = Histogram()
+
+    def record(self, ip: str, nbytes: int, parsed: bool, now: float) -> None:
+        with self._lock:
+            self.received += 1
+            self.bytes += nbytes
+            src = self.sources.get(ip)
+            if src is None:
+                src = self.sources[ip] = _Source(now)
+            src.messages += 1
+            src.bytes += nbytes
+            src.last_seen = now
+            src.window_count += 1
+            if now - src.window_start >= RATE_WINDOW:
+                src.rate = src.window_count / (now - src.window_start)
+                src.window_start = now
+                src.window_count = 0
+            if not parsed:
+                self.failures += 1
+                src.failures += 1
+
+    def record_drop(self, count: int) -> None:
+        with self._lock:
+            self.dropped += count
+
+    def observe_queue(self, seconds: float) -> None:
+        with self._lock:
+            self.queue_latency.observe(seconds * 1000.0)
+
+    def observe_write(self, seconds: float) -> None:
+        with self._lock:
+            self.write_latency.observe(seconds * 1000.0)
+
+    def snapshot(self, port: int = None) -> dict:
+        now = time.time()
+        with self._lock:
+            sources = {}
+            for ip, src in self.sources.items():
+                # Текущее окно, пока оно не слишком короткое; у замолчавшего
+                # устройства скорость сама затухает к нулю
+                elapsed = now - src.window_start
+                rate = src.window_count / elapsed if elapsed >= 1.0 else src.rate
+                sources[ip] = {
+                    'messages': src.messages,
+                    'bytes': src.bytes,
+                    'parse_failures': src.failures,
+                    'failure_ratio': round(src.failures / src.messages, 4) if src.messages else 0.0,
+                    'rate_per_sec': round(rate, 2),
+                    'last_seen': src.last_seen,
+                }
+            snap = {
+                'uptime_sec': round(now - self.started, 1),
+                'received': self.received,
+                'bytes': self.bytes,
+                'parse_failures': self.failures,
+                'failure_ratio': round(self.failures / self.received, 4) if self.received else 0.0,
+                'dropped_queue': self.dropped,
+                'queue_latency': self.queue_latency.snapshot(),
+                'write_latency': self.write_latency.snapshot(),
+                'sources': dict(sorted(sources.items(),
+                                       key=lambda kv: kv[1]['rate_per_sec'], reverse=True)),
+            }
+        snap['kernel'] = kernel_udp_stats(port) if port else None
+        return snap
+
+
+def kernel_udp_stats(port: int) -> Optional[dict]:
+    """Kernel receive-queue size and drop counter for a UDP port (Linux only)."""
+    result = None
+    for table in ('/proc/net/udp', '/proc/net/udp6'):
+        try:
+            with open(table, 'r', encoding='ascii') as f:
+                rows: List[List[str]] = [line.split() for line in f.readlines()[1:]]
+        except OSError:
+            continue
+        for row in rows:
+            if len(row) < 13 or int(row[1].rsplit(':', 1)[1], 16) != port:
+                continue
+            if result is None:
+                result = {'drops': 0, 'rx_queue_bytes': 0}
+            result['drops'] += int(row[-1])
+            result['rx_queue_bytes'] += int(row[4].split(':')[1], 16)
+    return result
@@ -0,0 +1,203 @@
+"""Разбор syslog-сообщений RFC3164 и RFC5424 в структурированные записи.
+
+``parse()`` превращает датаграмму в :class:`SyslogRecord`; записи хранятся в
+кольцевом буфере syslog_server, пишутся в файл строкой прежнего формата
+(:meth:`SyslogRecord.line`) и восстанавливаются из неё (:func:`from_line`),
+так что потребителям не нужно заново разбирать текст.
+
+Заголовок RFC3164 разбирается одним якорным скомпилированным выражением:
+в CPython это быстрее посимвольного разбора на str-методах.  Имя программы,
+pid и текст выделяются из содержимого лениво, при первом обращении.
+"""
+import re
+from datetime import datetime
+from typing import Optional
+
+_RFC3164 = re.compile(r'<(\d{1,3})>([A-Z][a-z]{2}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2})\s+([^ ]+)\s+(.*)')
+# Время в формате RFC3164; всё остальное в строке файла пришло в RFC5424
+_RFC3164_TIME = re.compile(r'[A-Z][a-z]{2}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2}$')
+_NIL = '-'
+
+
+class SyslogRecord:
+    """One received syslog message.
+
+    ``received`` is the local receive time (epoch seconds, sub-second),
+    ``timestamp`` the device's own time field as sent.  ``content`` is the
+    part after the host (``prog[pid]: text``); ``program``, ``pid`` and
+    ``msg`` are split out of it on first access.  ``fmt`` is ``'3164'``,
+    ``'5424'`` or ``None`` for unparsed datagrams (then only ``content`` is
+    set).
+    """
+
+    __slots__ = ('received', 'ip', 'port', 'pri', 'timestamp', 'host',
+                 'content', 'fmt', '_tag')
+
+    def __init__(self, received, ip, port, pri=None, timestamp='', host='',
+                 content='', fmt=None, tag=None):
+        self.received = received
+        self.ip = ip
+        self.port = port
+        self.pri = pri
+        self.timestamp = timestamp
+        self.host = host
+        self.content = content
+        self.fmt = fmt
+        self._tag = tag
+
+    @property
+    def facility(self) -> Optional[int]:
+        return None if self.pri is None else self.pri >> 3
+
+    @property
+    def severity(self) -> Optional[int]:
+        return None if self.pri is None else self.pri & 7
+
+    def _split(self):
+        tag = self._tag
+        if tag is None:
+            tag = self._tag = _split_tag(self.content) if self.fmt else ('', '', self.content)
+        return tag
+
+    @property
+    def program(self) -> str:
+        return self._split()[0]
+
+    @property
+    def pid(self) -> str:
+        return self._split()[1]
+
+    @property
+    def msg(self) -> str:
+        return self._split()[2]
+
+    def line(self, stamp: str) -> str:
+        """Text line in the ``logsDomofon`` format; ``stamp`` is the formatted
+        receive time (``%Y-%m-%d %H:%M:%S``)."""
+        if self.fmt is None:
+            return f"{stamp} [{self.ip}:{self.port}] RAW: {self.content}\n"
+        pri = self.pri
+        return (
+            f"{stamp} [{self.ip}:{self.port}] PRI={pri} (fac={pri >> 3}, sev={pri & 7}), "
+            f"time={self.timestamp}, host={self.host}, msg={self.content}\n"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            'received': self.received, 'ip': self.ip, 'port': self.port,
+            'pri': self.pri, 'timestamp': self.timestamp, 'host': self.host,
+            'content': self.content, 'fmt': self.fmt,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SyslogRecord':
+        return cls(**data)
+
+    def __repr__(self):
+        return (f"SyslogRecord({self.ip}, pri={self.pri}, program={self.program!r}, "
+                f"msg={self.msg!r})")
+
+
+def _split_tag(content: str):
+    """``'prog[12]: text'`` -> ``('prog', '12', 'text')``."""
+    colon = content.find(': ', 0, 64)
+    if colon <= 0 or content.find(' ', 0, colon) >= 0:
+        return '', '', content
+    if content[colon - 1] == ']':
+        bracket = content.find('[', 0, colon)
+        if bracket > 0:
+            return content[:bracket], content[bracket + 1:colon - 1], content[colon + 2:]
+    return content[:colon], '', content[colon + 2:]
+
+
+def _parse_5424(data: str, pos: int):
+    """``1 TS HOST APP PROCID MSGID SD MSG`` -> fields or ``None``."""
+    if not data.startswith('1 ', pos):
+        return None
+    parts = data[pos + 2:].split(' ', 5)
+    if len(parts) < 5:
+        return None
+    timestamp, host, app, procid, msgid = parts[:5]
+    rest = parts[5] if len(parts) > 5 else ''
+    # Структурированные данные: '-' или последовательность [..]
+    if rest.startswith(_NIL):
+        msg = rest[2:]
+    elif rest.startswith('['):
+        depth = 0
+        i = 0
+        while i < len(rest):
+            ch = rest[i]
+            if ch == '\\':
+                i += 2
+                continue
+            if ch == '[':
+                depth += 1
+            elif ch == ']':
+                depth -= 1
+                if depth == 0 and (i + 1 == len(rest) or rest[i + 1] != '['):
+                    break
+            i += 1
+        msg = rest[i + 2:]
+    else:
+        msg = rest
+    if msg.startswith('\ufeff'):
+        msg = msg[1:]
+    app = '' if app == _NIL else app
+    procid = '' if procid == _NIL else procid
+    return timestamp, ('' if host == _NIL else host), app, procid, msg
+
+
+def parse(raw: bytes, ip: str, port: int, received: float) -> SyslogRecord:
+    """Parse one datagram; unrecognised input yields a ``fmt=None`` record."""
+    data = raw.decode('utf-8', errors='replace').strip()
+    match = _RFC3164.match(data)
+    if match is not None:
+        pri, timestamp, host, content = match.groups()
+        return SyslogRecord(received, ip, port, int(pri), timestamp, host, content, '3164')
+    end = data.find('>', 1, 5) if data[:1] == '<' else -1
+    if end > 1 and data[1:end].isdigit():
+        parsed = _parse_5424(data, end + 1)
+        if parsed is not None:
+            timestamp, host, program, pid, msg = parsed
+            if program:
+                content = f"{program}[{pid}]: {msg}" if pid else f"{program}: {msg}"
+            else:
+                content = msg
+            return SyslogRecord(received, ip, port, int(data[1:end]), timestamp, host,
+                                content, '5424', (program, pid, msg))
+    return SyslogRecord(received, ip, port, content=data)
+
+
+def from_line(line: str, received: float = None) -> Optional[SyslogRecord]:
+    """Rebuild a record from a ``logsDomofon`` line written by :meth:`SyslogRecord.line`.
+
+    ``received`` defaults to the second-resolution time in the line header.
+    The line does not store the format; it is recovered from the time field,
+    which ``parse`` only accepts as ``Mmm dd hh:mm:ss`` for RFC3164.
+    """
+    if len(line) < 22 or line[19:21] != ' [':
+        return None
+    close = line.find('] ', 21)
+    if close < 0:
+        return None
+    ip, _, port = line[21:close].rpartition(':')
+    if received is None:
+        try:
+            received = datetime.strptime(line[:19], '%Y-%m-%d %H:%M:%S').timestamp()
+        except ValueError:
+            return None
+    body = line[close + 2:].rstrip('\n')
+    if body.startswith('RAW: '):
+        return SyslogRecord(received, ip, int(port or 0), content=body[5:])
+    if not body.startswith('PRI='):
+        return None
+    pri_end = body.find(' ', 4)
+    time_at = body.find(', time=', pri_end)
+    host_at = body.find(', host=', time_at)
+    msg_at = body.find(', msg=', host_at)
+    if min(pri_end, time_at, host_at, msg_at) < 0:
+        return None
+    timestamp = body[time_at + 7:host_at]
+    fmt = '3164' if _RFC3164_TIME.match(timestamp) else '5424'
+    return SyslogRecord(received, ip, int(port or 0), int(body[4:pri_end]),
+                        timestamp, body[host_at + 7:msg_at], body[msg_at + 6:], fmt)
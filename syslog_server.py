@@ -1,18 +1,75 @@
+import json
 import os
+import queue
+import select
+import socket
 import socketserver
 import threading
+import time
+from collections import OrderedDict, deque, namedtuple
 from datetime import datetime
 import re
 
+import cancel as cancellation
+import log_store
+import syslog_parser
+from syslog_metrics import SyslogMetrics
+
 _LOG_DIR = os.path.join(os.getcwd(), 'logsDomofon')
-_PORT = 5514
+# Порты можно переопределить окружением (несколько агентов на одной машине)
+_PORT = int(os.environ.get('SYSLOG_PORT', 5514))
 _server_thread = None
 _server = None
 _server_started = False
 _lock = threading.Lock()
 _log_positions = {}
+_log_finished = set()         # сжатые сегменты, прочитанные до конца (follow=True)
+_ready = threading.Event()
+
+# Общий сервис: один слушатель на машину, остальные процессы подключаются к
+# нему по локальному TCP-порту управления.  Слушатель живёт, пока есть хотя бы
+# одна ссылка, и ещё _IDLE_TIMEOUT секунд после последней.  Если владелец
+# перестал отвечать (процесс завершился), подключённый процесс сам занимает
+# UDP-порт со всеми своими ссылками.
+_CONTROL_PORT = int(os.environ.get('SYSLOG_CONTROL_PORT', _PORT + 1))
+_IDLE_TIMEOUT = 300
+_WATCH_INTERVAL = 2.0         # как часто подключённый процесс проверяет владельца
+_TAKEOVER_ATTEMPTS = 5        # попыток занять порт или подключиться к новому владельцу
+_TAKEOVER_BACKOFF = 0.5       # пауза перед повтором растёт: 0.5, 1, 1.5 ... с
+_refs = 0
+_owner_pid = None
+_idle_timer = None
+_closing = False              # слушатель останавливается, новые ссылки не выдаются
+_control = None
+_remote_conn = None
+_remote_refs = 0
+_watcher = None
+# Запуск, остановка и перехват слушателя идут строго по очереди
+_lifecycle = threading.RLock()
+
+# Параметры буферизованной записи логов
+_MAX_OPEN_FILES = 64          # сколько файлов держать открытыми одновременно
+_FLUSH_BYTES = 64 * 1024      # сброс на диск при накоплении такого объёма
+_FLUSH_INTERVAL = 0.5         # ... или не реже чем раз в столько секунд
+_MAINTAIN_INTERVAL = 60       # как часто сжимать закрытые сегменты (log_store.maintain)
+
+# Движок приёма: 'batch' — один поток читает сокет пачками и отдаёт их
+# обработчику через очередь; 'threading' — прежний ThreadingUDPServer
+_ENGINE = 'batch'
+_RCVBUF = 4 * 1024 * 1024     # желаемый SO_RCVBUF для движка 'batch'
+_BATCH_SIZE = 256             # максимум датаграмм за один проход по сокету
+_QUEUE_SIZE = 1024            # максимум пачек в очереди на обработку
 
-RFC3164_RE = re.compile(r'<(\d+)>([A-Z][a-z]{2}\s+\d{1,2}\s+\d{2}:\d{2}:\d{2})\s+([^ ]+)\s+(.*)')
+# Последние строки каждого домофона в памяти для wait_for_log()
+_RING_SIZE = 2000
+_rings = {}
+_ring_cond = threading.Condition()
+_POLL_INTERVAL = 0.2          # опрос файла, если сервер запущен в другом процессе
+
+LogMatch = namedtuple('LogMatch', 'line received elapsed record')
+
+_metrics = SyslogMetrics()
+_engine = None
 
 
 def _ensure_log_dir():
@@ -22,94 +79,783 @@ def _ensure_log_dir():
 def _log_server_message(msg: str) -> None:
     _ensure_log_dir()
     path = os.path.join(_LOG_DIR, 'server.log')
+    log_store.rotate_if_large(path)
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     with open(path, 'a', encoding='utf-8') as f:
         f.write(f"{timestamp} {msg}\n")
 
 
+class _LogWriter:
+    """Buffered writer for ``logsDomofon``.
+
+    Lines are accumulated per file and written in batches, either when
+    ``flush_bytes`` is reached or every ``flush_interval`` seconds.  Open file
+    handles are kept in an LRU cache so that a busy device does not reopen its
+    file on every datagram.  Timestamps are formatted once per second and the
+    day rollover (new ``<ip>_<dd.mm.yyyy>.log`` name) is handled in
+    :meth:`stamp`.
+    """
+
+    def __init__(self, log_dir: str, max_open: int = _MAX_OPEN_FILES,
+                 flush_bytes: int = _FLUSH_BYTES,
+                 flush_interval: float = _FLUSH_INTERVAL):
+        self.log_dir = log_dir
+        self.max_open = max_open
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self._handles = OrderedDict()
+        self._pending = {}
+        self._pending_size = 0
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._second = None
+        self._stamp = ('', '')
+        self._day = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.segments = log_store.SegmentTracker(log_dir)
+        os.makedirs(log_dir, exist_ok=True)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._thread.start()
+
+    def stamp(self, now: float):
+        """Return ``(time_str, day_str)`` for ``now``, cached per second."""
+        second = int(now)
+        if second != self._second:
+            dt = datetime.fromtimestamp(second)
+            day = dt.strftime('%d.%m.%Y')
+            if day != self._day:
+                self._roll_day(day)
+            self._stamp = (dt.strftime('%Y-%m-%d %H:%M:%S'), day)
+            self._second = second
+        return self._stamp
+
+    def _roll_day(self, day: str) -> None:
+        # Смена суток: дописываем хвосты и закрываем файлы прошлого дня
+        if self._day is not None:
+            self.flush(close=True)
+            with self._lock:
+                self.segments.clear()
+        self._day = day
+
+    def _append(self, filename: str, data: bytes) -> None:
+        if self._oldest is None:
+            self._oldest = time.time()
+        chunks = self._pending.get(filename)
+        if chunks is None:
+            chunks = self._pending[filename] = []
+        chunks.append(data)
+        self._pending_size += len(data)
+
+    def write(self, filename: str, line: str) -> None:
+        data = line.encode('utf-8')
+        with self._lock:
+            self._append(filename, data)
+            need_flush = self._pending_size >= self.flush_bytes
+        if need_flush:
+            self.flush()
+
+    def write_device(self, ip: str, day: str, received: float, line: str) -> None:
+        """Append a device line to its current segment and sparse index."""
+        data = line.encode('utf-8')
+        with self._lock:
+            filename, entry = self.segments.place(ip, day, received, len(data))
+            self._append(filename, data)
+            if entry is not None:
+                self._append(log_store.index_name(filename), entry)
+            need_flush = self._pending_size >= self.flush_bytes
+        if need_flush:
+            self.flush()
+
+    def flush(self, close: bool = False) -> None:
+        # Приём новых строк не ждёт, пока идёт запись на диск: под _lock
+        # только забираем накопленное, порядок пачек держит _io_lock
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._pending_size = 0
+                oldest, self._oldest = self._oldest, None
+            for filename, chunks in pending.items():
+                f = self._handle(filename)
+                f.write(b''.join(chunks))
+                f.flush()
+                if filename == 'raw.log' and f.tell() >= log_store.ROTATE_SIZE:
+                    f.close()
+                    del self._handles[filename]
+                    log_store.rotate_if_large(os.path.join(self.log_dir, filename))
+            if oldest is not None:
+                # Задержка от приёма самой старой строки пачки до записи в файл
+                _metrics.observe_write(time.time() - oldest)
+            if close:
+                for f in self._handles.values():
+                    f.close()
+                self._handles.clear()
+
+    def _handle(self, filename: str):
+        f = self._handles.get(filename)
+        if f is not None:
+            self._handles.move_to_end(filename)
+            return f
+        if len(self._handles) >= self.max_open:
+            _, old = self._handles.popitem(last=False)
+            old.close()
+        f = open(os.path.join(self.log_dir, filename), 'ab')
+        self._handles[filename] = f
+        return f
+
+    def _flush_loop(self) -> None:
+        next_maintain = time.time() + _MAINTAIN_INTERVAL
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                _log_server_message(f'Write error: {e}')
+            if time.time() >= next_maintain:
+                self.maintain()
+                next_maintain = time.time() + _MAINTAIN_INTERVAL
+
+    def maintain(self) -> None:
+        """Compress closed segments and drop expired archives."""
+        with self._lock:
+            active = self.segments.active_names()
+        try:
+            stats = log_store.maintain(self.log_dir, active)
+        except Exception as e:
+            _log_server_message(f'Maintenance error: {e}')
+            return
+        if stats['compressed'] or stats['deleted']:
+            _log_server_message(
+                f"Maintenance: compressed {stats['compressed']}, deleted {stats['deleted']}")
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush(close=True)
+
+
+_writer = None
+
+
+def _process_datagram(raw: bytes, client_address, writer: _LogWriter) -> None:
+    ip, port = client_address
+    received = time.time()
+    now, day = writer.stamp(received)
+    record = syslog_parser.parse(raw, ip, port, received)
+    _metrics.record(ip, len(raw), record.fmt is not None, received)
+    if record.fmt is not None:
+        writer.write_device(ip, day, received, record.line(now))
+        _remember(record)
+    else:
+        writer.write('raw.log', record.line(now))
+
+
+def _remember(record) -> None:
+    with _ring_cond:
+        ring = _rings.get(record.ip)
+        if ring is None:
+            ring = _rings[record.ip] = deque(maxlen=_RING_SIZE)
+        ring.append(record)
+        _ring_cond.notify_all()
+
+
 class _SyslogHandler(socketserver.BaseRequestHandler):
     def handle(self):
-        data = self.request[0].decode('utf-8', errors='replace').strip()
-        ip, port = self.client_address
-        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        match = RFC3164_RE.match(data)
-        if match:
-            pri = int(match.group(1))
-            facility = pri >> 3
-            severity = pri & 7
-            timestamp = match.group(2)
-            host = match.group(3)
-            msg = match.group(4)
-            line = (
-                f"{now} [{ip}:{port}] PRI={pri} (fac={facility}, sev={severity}), "
-                f"time={timestamp}, host={host}, msg={msg}\n"
-            )
-            filename = f"{ip}_{datetime.now().strftime('%d.%m.%Y')}.log"
-            path = os.path.join(_LOG_DIR, filename)
-        else:
-            line = f"{now} [{ip}:{port}] RAW: {data}\n"
-            path = os.path.join(_LOG_DIR, 'raw.log')
-        _ensure_log_dir()
-        with open(path, 'a', encoding='utf-8') as f:
-            f.write(line)
-            f.flush()
+        _process_datagram(self.request[0], self.client_address, _writer)
+
+
+class _BatchUDPServer:
+    """UDP receiver that drains the socket in batches on one thread.
+
+    Datagrams are read until the socket is empty (or ``batch_size`` is
+    reached) and the whole batch is handed to a worker thread through a
+    bounded queue.  If the worker falls behind and the queue is full, the
+    batch is dropped and counted in ``dropped``.  The interface mirrors the
+    parts of ``socketserver`` used by :func:`_run_server`.
+    """
+
+    def __init__(self, address, writer: _LogWriter, rcvbuf: int = _RCVBUF,
+                 batch_size: int = _BATCH_SIZE, queue_size: int = _QUEUE_SIZE):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.received = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._shutdown = threading.Event()
+        self._stopped = threading.Event()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if rcvbuf:
+            try:
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+            except OSError as e:
+                _log_server_message(f'SO_RCVBUF={rcvbuf} not applied: {e}')
+        self.socket.bind(address)
+        self.socket.setblocking(False)
+        self.rcvbuf = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+    def serve_forever(self, poll_interval: float = 0.5) -> None:
+        worker = threading.Thread(target=self._work, daemon=True)
+        worker.start()
+        sock = self.socket
+        try:
+            while not self._shutdown.is_set():
+                ready, _, _ = select.select([sock], [], [], poll_interval)
+                if not ready:
+                    continue
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(sock.recvfrom(65535))
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        # Например, ICMP port unreachable на Windows
+                        continue
+                self.received += len(batch)
+                try:
+                    self._queue.put_nowait((time.time(), batch))
+                except queue.Full:
+                    self.dropped += len(batch)
+                    _metrics.record_drop(len(batch))
+        finally:
+            self._queue.put(None)
+            worker.join()
+            self._stopped.set()
+
+    def _work(self) -> None:
+        writer = self.writer
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            queued, batch = item
+            _metrics.observe_queue(time.time() - queued)
+            for raw, addr in batch:
+                try:
+                    _process_datagram(raw, addr, writer)
+                except Exception as e:
+                    _log_server_message(f'Handler error from {addr[0]}: {e}')
+
+    def shutdown(self) -> None:
+        self._shutdown.set()
+        self._stopped.wait()
+
+    def server_close(self) -> None:
+        self.socket.close()
+
+
+def _make_server(engine: str, writer: _LogWriter, rcvbuf: int):
+    if engine == 'threading':
+        return socketserver.ThreadingUDPServer(('0.0.0.0', _PORT), _SyslogHandler)
+    if engine == 'batch':
+        return _BatchUDPServer(('0.0.0.0', _PORT), writer, rcvbuf=rcvbuf)
+    raise ValueError(f'Неизвестный движок syslog: {engine}')
 
 
-def _run_server():
-    global _server, _server_started
-    server = socketserver.ThreadingUDPServer(('0.0.0.0', _PORT), _SyslogHandler)
+def _run_server(engine: str = _ENGINE, rcvbuf: int = _RCVBUF):
+    global _server, _server_started, _writer, _control, _engine, _refs
+    _metrics.reset()
+    _engine = engine
+    _writer = _LogWriter(_LOG_DIR)
+    _writer.start()
+    try:
+        server = _make_server(engine, _writer, rcvbuf)
+    except Exception as e:
+        _writer.close()
+        _log_server_message(f'Failed to start ({engine}): {e}')
+        with _lock:
+            _server_started = False
+            _refs = 0       # ссылок на несостоявшийся слушатель нет
+        _ready.set()
+        return
     _server = server
-    _log_server_message(f'Started on UDP :{_PORT}')
+    try:
+        _control = _ControlServer(('127.0.0.1', _CONTROL_PORT), _ControlHandler)
+        threading.Thread(target=_control.serve_forever, args=(0.5,), daemon=True).start()
+    except OSError as e:
+        _control = None
+        _log_server_message(f'Control port :{_CONTROL_PORT} unavailable: {e}')
+    _ready.set()
+    _log_server_message(f'Started on UDP :{_PORT} (engine={engine})')
     try:
         server.serve_forever(poll_interval=0.1)
     finally:
+        if _control is not None:
+            _control.shutdown()
+            _control.server_close()
+            _control = None
         server.server_close()
+        _writer.close()
         _log_server_message('Stopped')
         with _lock:
             _server_started = False
             _server = None
 
 
-def start_syslog_server() -> None:
-    global _server_thread, _server_started
+class _ControlServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    # На Windows SO_REUSEADDR позволяет второму процессу занять тот же порт
+    allow_reuse_address = os.name != 'nt'
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """JSON-lines protocol used by other processes to share the listener.
+
+    References taken with ``acquire`` belong to the connection and are
+    released when it closes, so a crashed client cannot pin the service.
+    """
+
+    def handle(self):
+        held = 0
+        try:
+            for raw in self.rfile:
+                try:
+                    req = json.loads(raw)
+                    reply = self._dispatch(req)
+                except Exception as e:
+                    reply = {'ok': False, 'error': str(e)}
+                else:
+                    if req.get('op') == 'acquire':
+                        held += 1
+                    elif req.get('op') == 'release' and held:
+                        held -= 1
+                self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            for _ in range(held):
+                stop_syslog_server()
+
+    def _dispatch(self, req: dict) -> dict:
+        op = req.get('op')
+        if op == 'ping':
+            return {'ok': True, 'pid': os.getpid()}
+        if op == 'acquire':
+            if not _acquire_local():
+                raise RuntimeError('syslog service is shutting down')
+            return {'ok': True}
+        if op == 'release':
+            stop_syslog_server()
+            return {'ok': True}
+        if op == 'flush':
+            if _writer is not None:
+                _writer.flush()
+            return {'ok': True}
+        if op == 'metrics':
+            return {'ok': True, 'metrics': syslog_metrics()}
+        if op == 'wait':
+            pattern = None
+            if req.get('pattern') is not None:
+                pattern = re.compile(req['pattern'], req.get('flags', 0))
+            deadline = time.time() + float(req.get('timeout', 10.0))
+            found = _wait_in_ring(req['ip'], pattern, float(req['since']), deadline,
+                                  req.get('program'))
+            return {'ok': True, 'found': found.to_dict() if found else None}
+        raise ValueError(f'unknown op: {op}')
+
+
+def _control_request(req: dict, timeout: float = 2.0, conn=None) -> dict:
+    """Send one request to the service owner; raises OSError if unreachable."""
+    if conn is None:
+        with socket.create_connection(('127.0.0.1', _CONTROL_PORT), timeout=1.0) as sock:
+            return _control_request(req, timeout, sock)
+    conn.settimeout(timeout)
+    conn.sendall(json.dumps(req).encode('utf-8') + b'\n')
+    buf = b''
+    while not buf.endswith(b'\n'):
+        chunk = conn.recv(65536)
+        if not chunk:
+            raise ConnectionError('syslog service closed the connection')
+        buf += chunk
+    reply = json.loads(buf)
+    if not reply.get('ok'):
+        raise RuntimeError(reply.get('error', 'syslog service error'))
+    return reply
+
+
+def _is_owner() -> bool:
+    return _server_started and _owner_pid == os.getpid()
+
+
+def _acquire_local() -> bool:
+    """Take a reference on the listener of this process (False while it stops)."""
+    global _refs, _idle_timer
     with _lock:
-        if _server_started:
+        if _closing:
+            return False
+        _refs += 1
+        if _idle_timer is not None:
+            _idle_timer.cancel()
+            _idle_timer = None
+    return True
+
+
+def _attach_remote() -> bool:
+    """Take a reference on a service running in another process (under ``_lock``)."""
+    global _remote_conn, _remote_refs, _watcher
+    try:
+        if _remote_conn is None:
+            conn = socket.create_connection(('127.0.0.1', _CONTROL_PORT), timeout=1.0)
+            try:
+                if _control_request({'op': 'ping'}, conn=conn)['pid'] == os.getpid():
+                    conn.close()
+                    return False
+            except Exception:
+                conn.close()
+                raise
+            _remote_conn = conn
+        _control_request({'op': 'acquire'}, conn=_remote_conn)
+    except (OSError, ValueError, RuntimeError):
+        if _remote_conn is not None:
+            _remote_conn.close()
+        _remote_conn = None
+        return False
+    _remote_refs += 1
+    if _watcher is None:
+        _watcher = threading.Thread(target=_watch_owner, name='syslog-watch', daemon=True)
+        _watcher.start()
+    return True
+
+
+def _watch_owner() -> None:
+    """While attached, ping the owner; if it is gone, bind the listener here."""
+    global _remote_conn, _remote_refs, _watcher
+    while True:
+        time.sleep(_WATCH_INTERVAL)
+        with _lifecycle:
+            with _lock:
+                if not _remote_refs:
+                    _watcher = None
+                    return
+                try:
+                    _control_request({'op': 'ping'}, conn=_remote_conn)
+                    continue
+                except (OSError, ValueError, RuntimeError):
+                    pass
+                refs = _remote_refs
+                _remote_conn.close()
+                _remote_conn = None
+                _remote_refs = 0
+                _watcher = None
+            _log_server_message(f'Control port :{_CONTROL_PORT} stopped answering, rebinding ({refs} refs)')
+            _take_over(refs)
             return
-        _server_started = True
-        _server_thread = threading.Thread(target=_run_server, daemon=True)
-        _server_thread.start()
+
+
+def _take_over(refs: int) -> None:
+    """Move ``refs`` references to a new listener: bound here or in another process.
+
+    Several attached processes lose the owner at once; one binds UDP, the
+    others fail to bind and attach to the winner once its control port is up.
+    """
+    for attempt in range(1, _TAKEOVER_ATTEMPTS + 1):
+        start_syslog_server()
+        _ready.wait(5)
+        with _lock:
+            if _is_owner() or _remote_refs:
+                break
+        time.sleep(_TAKEOVER_BACKOFF * attempt)
+    else:
+        _log_server_message(f'Takeover failed after {_TAKEOVER_ATTEMPTS} attempts, {refs} refs dropped')
+        return
+    for _ in range(refs - 1):
+        start_syslog_server()
+
+
+def start_syslog_server(engine: str = None, rcvbuf: int = None) -> None:
+    """Take a reference on the shared syslog listener, starting it if needed.
+
+    If another process on this host already runs the listener, this process
+    attaches to it over the control port instead of binding UDP again.
+    ``engine`` is ``'batch'`` (default, see ``_ENGINE``) or ``'threading'``;
+    ``rcvbuf`` overrides the requested ``SO_RCVBUF`` for the batch engine.
+    Every call must be paired with :func:`stop_syslog_server`.
+    """
+    global _server_thread, _server_started, _refs, _owner_pid
+    with _lifecycle:
+        if _is_owner() and _acquire_local():
+            return
+        with _lock:
+            if _attach_remote():
+                return
+            _server_started = True
+            _owner_pid = os.getpid()
+            _refs = 1
+            _ready.clear()
+            _server_thread = threading.Thread(
+                target=_run_server,
+                args=(engine or _ENGINE, _RCVBUF if rcvbuf is None else rcvbuf),
+                daemon=True,
+            )
+            _server_thread.start()
 
 
 def stop_syslog_server() -> None:
-    global _server_thread
+    """Release a reference taken by :func:`start_syslog_server`.
+
+    The listener keeps running for ``_IDLE_TIMEOUT`` seconds after the last
+    reference is gone, so back-to-back runs do not rebind the port.
+    """
+    global _refs, _idle_timer, _remote_conn, _remote_refs
     with _lock:
-        if not _server_started or _server is None:
+        if _remote_refs:
+            _remote_refs -= 1
+            try:
+                _control_request({'op': 'release'}, conn=_remote_conn)
+            except (OSError, ValueError, RuntimeError):
+                pass
+            if not _remote_refs:
+                _remote_conn.close()
+                _remote_conn = None
+            return
+        if not _is_owner() or _refs == 0:
+            return
+        _refs -= 1
+        if _refs:
             return
-        _server.shutdown()
-    if _server_thread:
-        _server_thread.join()
-        _server_thread = None
+        if _IDLE_TIMEOUT > 0:
+            _idle_timer = threading.Timer(_IDLE_TIMEOUT, _shutdown_if_idle)
+            _idle_timer.daemon = True
+            _idle_timer.start()
+            return
+    _shutdown(force=False)
+
+
+def _shutdown_if_idle() -> None:
+    _shutdown(force=False)
+
+
+def shutdown_syslog_server() -> None:
+    """Stop the listener owned by this process regardless of references."""
+    _shutdown(force=True)
+
+
+def _shutdown(force: bool) -> None:
+    global _server_thread, _refs, _idle_timer, _closing
+    _ready.wait(5)
+    with _lifecycle:
+        with _lock:
+            # Таймер простоя мог сработать одновременно с новым acquire
+            # (или после него был взведён новый таймер) — тогда не останавливаем
+            if not force and (_refs or _idle_timer not in (None, threading.current_thread())):
+                return
+            if _idle_timer is not None:
+                _idle_timer.cancel()
+                _idle_timer = None
+            _refs = 0
+            if not _is_owner() or _server is None:
+                return
+            _closing = True
+            server = _server
+        try:
+            server.shutdown()
+            if _server_thread:
+                _server_thread.join()
+                _server_thread = None
+        finally:
+            with _lock:
+                _closing = False
+
+
+def syslog_metrics() -> dict:
+    """Snapshot of ingest counters: per-source rates, bytes, parse failures,
+    queue/kernel drops and receipt-to-write latency histograms.
+
+    Called outside the owner process, the snapshot is fetched from the
+    shared service; ``{'running': False}`` is returned if there is none.
+    """
+    if not _is_owner():
+        try:
+            return _control_request({'op': 'metrics'})['metrics']
+        except (OSError, ValueError, RuntimeError):
+            return {'running': False}
+    snap = _metrics.snapshot(port=_PORT)
+    snap.update(running=True, engine=_engine, port=_PORT, refs=_refs)
+    if isinstance(_server, _BatchUDPServer):
+        snap['rcvbuf'] = _server.rcvbuf
+    return snap
+
+
+def _flush_writer() -> None:
+    """Make buffered lines visible on disk, locally or in the owner process."""
+    if _is_owner():
+        if _writer is not None:
+            _writer.flush()
+        return
+    try:
+        _control_request({'op': 'flush'})
+    except (OSError, ValueError, RuntimeError):
+        pass
 
 
 def LogDomofon(ip: str, follow: bool = False):
     """Return logs for given IP. If ``follow`` is True, only new lines since the
     last call are returned."""
     _ensure_log_dir()
-    filename = f"{ip}_{datetime.now().strftime('%d.%m.%Y')}.log"
-    path = os.path.join(_LOG_DIR, filename)
-    if follow:
-        pos = _log_positions.get(path, 0)
+    # Дописываем буфер, чтобы читатель увидел все принятые строки
+    _flush_writer()
+    day = datetime.now().strftime('%d.%m.%Y')
+    if not follow:
+        return log_store.read_day(_LOG_DIR, ip, day)
+    lines = []
+    for path in log_store.list_segments(_LOG_DIR, ip, day):
+        # Позиция хранится по несжатому имени: сегмент мог успеть сжаться
+        key = log_store.plain_path(path)
+        if key in _log_finished:
+            continue
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                f.seek(pos)
-                lines = f.readlines()
-                _log_positions[path] = f.tell()
-                return lines
+            path, f = log_store.open_segment(path)
         except FileNotFoundError:
-            return []
+            continue    # удалён по сроку хранения
+        with f:
+            f.seek(_log_positions.get(key, 0))
+            data = f.read()
+            _log_positions[key] = f.tell()
+        if path != key:
+            # Архив больше не меняется: не распаковываем его заново при каждом вызове
+            _log_finished.add(key)
+        lines.extend(data.decode('utf-8', errors='replace').splitlines(keepends=True))
+    return lines
+
+
+def iter_device_log(ip: str, day: str = None):
+    """Yield all lines of ``ip`` for ``day`` (``dd.mm.yyyy``, default today),
+    decompressing archived segments on the fly."""
+    _flush_writer()
+    day = day or datetime.now().strftime('%d.%m.%Y')
+    for segment in log_store.list_segments(_LOG_DIR, ip, day):
+        yield from log_store.iter_lines(segment)
+
+
+def LogDomofonRange(ip: str, since: float, until: float = None):
+    """Return lines of ``ip`` received between ``since`` and ``until``
+    (epoch seconds, ``until`` defaults to now) using the segment index."""
+    _flush_writer()
+    if until is None:
+        until = time.time()
+    return log_store.read_range(_LOG_DIR, ip, since, until)
+
+
+def _matches(record, pattern, program) -> bool:
+    if program is not None and record.program != program:
+        return False
+    return pattern is None or pattern.search(record.content) is not None
+
+
+def _search_ring(ip: str, pattern, since: float, program=None):
+    # Идём с конца до первой записи раньше since, запоминая самое раннее совпадение
+    found = None
+    for record in reversed(_rings.get(ip, ())):
+        if record.received < since:
+            break
+        if _matches(record, pattern, program):
+            found = record
+    return found
+
+
+def _wait_in_file(ip: str, pattern, since: float, deadline: float, program=None, cancel=None):
+    """Fallback for processes without the listener: poll today's segments."""
+    day = datetime.now().strftime('%d.%m.%Y')
+    since_str = datetime.fromtimestamp(int(since)).strftime('%Y-%m-%d %H:%M:%S')
+    positions = {}
+    finished = set()    # сжатые сегменты, уже прочитанные до конца
+    while True:
+        for path in log_store.list_segments(_LOG_DIR, ip, day):
+            key = log_store.plain_path(path)
+            if key in finished:
+                continue
+            pos = positions.get(key, 0)
+            try:
+                path, f = log_store.open_segment(path)
+            except FileNotFoundError:
+                continue
+            with f:
+                f.seek(pos)
+                for raw in log_store.split_lines(f):
+                    if not raw.endswith(b'\n'):
+                        break
+                    pos += len(raw)
+                    line = raw.decode('utf-8', errors='replace')
+                    if line[:19] < since_str:
+                        continue
+                    record = syslog_parser.from_line(line)
+                    if record is not None and _matches(record, pattern, program):
+                        record.received = max(since, record.received)
+                        return record
+            positions[key] = pos
+            if path != key:
+                finished.add(key)
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        if cancel is None:
+            time.sleep(min(_POLL_INTERVAL, remaining))
+        else:
+            cancel.wait(min(_POLL_INTERVAL, remaining))
+
+
+def _wait_in_ring(ip: str, pattern, since: float, deadline: float, program=None, cancel=None):
+    with _ring_cond:
+        while True:
+            cancellation.raise_if_stopped(cancel)
+            found = _search_ring(ip, pattern, since, program)
+            remaining = deadline - time.time()
+            if found or remaining <= 0:
+                return found
+            # с токеном отмены просыпаемся регулярно, чтобы заметить остановку
+            _ring_cond.wait(remaining if cancel is None else min(remaining, cancellation.POLL_INTERVAL))
+
+
+def wait_for_log(ip: str, pattern=None, since: float = None, timeout: float = 10.0,
+                 program: str = None, cancel=None):
+    """Block until a message from ``ip`` matching the filters arrives.
+
+    ``pattern`` (regex or string) is searched in the message content
+    (``prog[pid]: text``), ``program`` must equal the record's program name.
+    Only messages received at or after ``since`` (epoch seconds, default:
+    now) are considered.  Returns :class:`LogMatch`
+    ``(line, received, elapsed, record)`` where ``elapsed`` is the time from
+    ``since`` to the receipt, or ``None`` if nothing matched within
+    ``timeout`` seconds.  Works from any process: without a local listener
+    the request goes to the shared service, and if there is none, today's
+    files are polled.  ``cancel`` (`cancel.CancelToken`) shortens the wait
+    to the step deadline and raises `cancel.Cancelled` on stop.
+    """
+    if isinstance(pattern, str):
+        pattern = re.compile(pattern)
+    if since is None:
+        since = time.time()
+    timeout = cancellation.timeout(timeout, cancel)
+    deadline = time.time() + timeout
+    if _is_owner():
+        record = _wait_in_ring(ip, pattern, since, deadline, program, cancel)
     else:
+        req = {'op': 'wait', 'ip': ip, 'since': since, 'program': program}
+        if pattern is not None:
+            req.update(pattern=pattern.pattern, flags=pattern.flags & ~re.UNICODE)
+        # Ждём короткими запросами, чтобы между ними проверять отмену
+        chunk = timeout if cancel is None else cancellation.POLL_INTERVAL * 4
+        record = None
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return f.readlines()
-        except FileNotFoundError:
-            return []
+            while True:
+                cancellation.raise_if_stopped(cancel)
+                remaining = deadline - time.time()
+                req['timeout'] = max(0.0, min(chunk, remaining))
+                found = _control_request(req, timeout=req['timeout'] + 2.0)['found']
+                if found or remaining <= chunk:
+                    record = syslog_parser.SyslogRecord.from_dict(found) if found else None
+                    break
+        except (OSError, ValueError, RuntimeError):
+            record = _wait_in_file(ip, pattern, since, deadline, program, cancel)
+    if record is None:
+        return None
+    stamp = datetime.fromtimestamp(int(record.received)).strftime('%Y-%m-%d %H:%M:%S')
+    return LogMatch(record.line(stamp), record.received,
+                    max(0.0, record.received - since), record)
@@ -1,42 +1,92 @@
 """ Это тот саммый продвиннутый запуск
 
 1. `_discover_tests()` — находит все `.py`-файлы в `progTest`, где есть функция `run` или аналог, добавляет их в словарь `TEST_MAP`.(По данной причине любой файл теста должна быть функция run)
+   Модули не импортируются: функции ищутся разбором AST, результат кешируется в `MANIFEST_PATH` по mtime файла. Импорт происходит только при запуске теста.
 
 2. `list_tests()` — возвращает список найденных тестов.
 
-3. `run_selected_tests(selected)` — загружает устройства из `config.txt`, отфильтровывает недоступные, запускает выбранные тесты на доступных IP, сохраняет лог в файл, возвращает текст с результатами.
+3. `run_selected_tests(selected, workers)` — загружает устройства из `config.txt`, отфильтровывает недоступные, запускает выбранные тесты на доступных IP (до `workers` домофонов параллельно, тесты одного домофона — по очереди), сохраняет лог в файл, возвращает текст с результатами.
+   Вывод каждого теста перехватывается отдельно (`output_capture`) и пишется в лог блоком своего домофона.
+   Через `on_event` можно получать события по ходу прогона (для SSE в `/api/tests/stream`).
 """
 
 
+import ast
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import importlib
-from typing import Dict, List
-import Regression as regression
+import importlib.util
+import inspect
+from typing import Callable, Dict, List, Optional
 from ping_utils import filter_reachable_devices
+from output_capture import LineSink, capture
+from results import CANCELLED, ResultSink, TestResult, measure
+import cancel as cancellation
+from cancel import CancelToken
 from syslog_server import start_syslog_server, stop_syslog_server
 
 
+# Кеш результатов статического разбора progTest: {файл: {mtime, size, entry}}
+MANIFEST_PATH = os.path.join('progTest', '.manifest.json')
+
+
+def _entry_point(path: str, name: str) -> Optional[str]:
+    """Return the test entry function of a module without importing it."""
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    functions = {node.name for node in tree.body
+                 if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))}
+    for candidate in ('run', 'get_device_info', name):
+        if candidate in functions:
+            return candidate
+    return None
+
+
+def _load_manifest() -> dict:
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
 def _discover_tests() -> Dict[str, tuple]:
-    """Dynamically discover tests inside ``progTest`` folder.
+    """Discover tests inside ``progTest`` folder without importing them.
 
-    A test is a module that contains a ``run`` function.  Some modules have
-    specific entry points, so we handle them here as well.
+    A test is a module that defines a top-level ``run`` function.  Some
+    modules have specific entry points, so we handle them here as well.
+    Entry points are found by parsing the source and cached by mtime.
     """
     tests: Dict[str, tuple] = {}
     base = 'progTest'
-    for file in os.listdir(base):
+    manifest = _load_manifest()
+    fresh = {}
+    for file in sorted(os.listdir(base)):
         if not file.endswith('.py') or file.startswith('_'):
             continue
         name = os.path.splitext(file)[0]
-        module_name = f'{base}.{name}'
-        module = importlib.import_module(module_name)
-        if hasattr(module, 'run'):
-            tests[name] = (module_name, 'run')
-        elif hasattr(module, 'get_device_info'):
-            tests[name] = (module_name, 'get_device_info')
-        elif hasattr(module, name):
-            tests[name] = (module_name, name)
+        path = os.path.join(base, file)
+        st = os.stat(path)
+        cached = manifest.get(file)
+        if cached and cached['mtime'] == st.st_mtime and cached['size'] == st.st_size:
+            entry = cached['entry']
+        else:
+            try:
+                entry = _entry_point(path, name)
+            except SyntaxError:
+                entry = None
+        fresh[file] = {'mtime': st.st_mtime, 'size': st.st_size, 'entry': entry}
+        if entry:
+            tests[name] = (f'{base}.{name}', entry)
+
+    if fresh != manifest:
+        try:
+            with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+                json.dump(fresh, f, ensure_ascii=False, indent=1)
+        except OSError:
+            pass
 
     # Дополнительные тесты вне папки progTest
     if importlib.util.find_spec('test_firmware'):
@@ -47,68 +97,140 @@ def _discover_tests() -> Dict[str, tuple]:
 
 TEST_MAP = _discover_tests()
 
+# Сколько домофонов тестировать одновременно по умолчанию
+DEFAULT_WORKERS = 4
+
 
 def list_tests() -> List[str]:
     """Return discovered test names."""
     return sorted(TEST_MAP.keys())
 
 
-def run_selected_tests(selected: List[str]) -> str:
+def _call_test(name: str, ip: str, login: str, password: str, cancel: Optional[CancelToken] = None):
+    mod_info = TEST_MAP.get(name)
+    if not mod_info:
+        raise LookupError('неизвестный тест')
+    module = importlib.import_module(mod_info[0])
+    func = getattr(module, mod_info[1])
+    params = inspect.signature(func).parameters
+    kwargs = {}
+    if cancel is not None and 'cancel' in params:
+        kwargs['cancel'] = cancel
+    if 'session' in params:
+        from progTest import _http
+        kwargs['session'] = _http.session(ip, login, password)
+    return func(ip, login, password, **kwargs)
+
+
+def _run_device(cfg: dict, selected: List[str],
+                on_event: Optional[Callable[[dict], None]] = None,
+                sink: Optional[ResultSink] = None,
+                on_result: Optional[Callable[[TestResult], None]] = None,
+                cancel: Optional[CancelToken] = None) -> List[tuple]:
+    """Run ``selected`` tests one after another on a single device.
+
+    Once ``cancel`` fires the remaining tests are recorded as cancelled.
+
+    Returns ``(result, output)`` per test, where ``result`` is a
+    ``TestResult`` (also appended to ``sink`` and passed to ``on_result``)
+    and ``output`` holds the test's captured output.  ``on_event`` gets a
+    ``'result'`` event as soon as each test finishes.
+    """
+    ip = cfg.get('IP_CAMERA', '')
+    login = cfg.get('LOGIN', '')
+    password = cfg.get('PASSWORD', '')
+    outcomes = []
+    for name in selected:
+        output = LineSink()
+        if cancel is not None and cancel.cancelled:
+            result = TestResult(name, ip, CANCELLED, message=f'Не запущен: {cancel.reason}')
+        else:
+            with capture(output):
+                result = measure(name, ip, _call_test, name, ip, login, password, cancel)
+        if sink:
+            sink.write(result)
+        if on_result:
+            on_result(result)
+        outcomes.append((result, output))
+        if on_event:
+            on_event({'type': 'result', 'device': ip, 'test': name, 'ok': result.ok,
+                      'status': result.status, 'duration': result.duration,
+                      'result': result.message})
+    return outcomes
+
+
+def run_selected_tests(selected: List[str], workers: Optional[int] = None,
+                       on_event: Optional[Callable[[dict], None]] = None,
+                       devices: Optional[List[dict]] = None,
+                       on_result: Optional[Callable[[TestResult], None]] = None,
+                       cancel: Optional[CancelToken] = None) -> str:
+    """Run ``selected`` tests on every reachable device from ``config.txt``
+    (or on the given ``devices`` configs).
+
+    Up to ``workers`` devices (default ``DEFAULT_WORKERS``) are tested in
+    parallel.  The log is streamed to ``logs/selected_<ts>.txt`` as devices
+    finish, one block per device in config order: the config line, then
+    each test's captured output followed by its result.  Returns the log
+    text.
+
+    ``on_event`` is called from worker threads with dicts: ``'start'``
+    (``devices``, ``tests``, ``log``), ``'warning'`` (``text``), ``'error'``
+    (``text``: no devices or none reachable, nothing was run) and one
+    ``'result'`` per finished test (``device``, ``test``, ``ok``,
+    ``status``, ``duration``, ``result``).  Result records are appended to
+    ``logs/selected_<ts>.jsonl`` next to the text log and passed to
+    ``on_result``.  ``POST /stop`` (``cancel.cancel_all``) or ``cancel``
+    stops the run; finished results stay in the log.
+    """
+    emit = on_event or (lambda event: None)
+    import Regression as regression
+
+    token = cancel or CancelToken()
+    cancellation.register(token)
     start_syslog_server()
     try:
-        devices = regression.load_device_configs('config.txt')
+        if devices is None:
+            devices = regression.load_device_configs('config.txt')
         if not devices:
-            return 'Нет устройств в config.txt'
+            text = 'Нет устройств в config.txt'
+            emit({'type': 'error', 'text': text})
+            return text
 
         devices, warnings = filter_reachable_devices(devices)
+        for text in warnings:
+            emit({'type': 'warning', 'text': text})
         if not devices:
-            warnings.append("\u26a0\ufe0f \"Не удалось подключиться ни к одному домофону. Тестирование отменено.\"")
+            text = "\u26a0\ufe0f \"Не удалось подключиться ни к одному домофону. Тестирование отменено.\""
+            emit({'type': 'error', 'text': text})
+            warnings.append(text)
             return "\n".join(warnings)
 
-        lines: List[str] = list(warnings)
-        from io import StringIO
-        from contextlib import redirect_stdout
-
-        buf = StringIO()
-        with redirect_stdout(buf):
-            for cfg in devices:
-                ip = cfg.get('IP_CAMERA', '')
-                login = cfg.get('LOGIN', '')
-                password = cfg.get('PASSWORD', '')
-                lines.append(' '.join(f'{k}={v}' for k, v in cfg.items()))
-                for name in selected:
-                    mod_info = TEST_MAP.get(name)
-                    if not mod_info:
-                        lines.append(f'{name}: неизвестный тест')
-                        continue
-                    module = importlib.import_module(mod_info[0])
-                    func = getattr(module, mod_info[1])
-                    try:
-                        result = func(ip, login, password)
-                    except Exception as e:
-                        result = f'Ошибка: {e}'
-                    lines.append(f'{name}: {result}')
-                lines.append('')
-
-        captured = buf.getvalue()
-
         log_dir = 'logs'
         os.makedirs(log_dir, exist_ok=True)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         log_file = os.path.join(log_dir, f'selected_{timestamp}.txt')
-        with open(log_file, 'w', encoding='utf-8') as f:
-            f.write(captured)
-            f.write('\n')
-            f.write('\n'.join(lines).strip())
-
-        output = (captured + '\n' + '\n'.join(lines)).strip()
-
-        clean = []
-        for ln in output.splitlines():
-            if 'GET /' in ln or 'POST /' in ln:
-                continue
-            clean.append(ln)
-        return '\n'.join(clean)
+        emit({'type': 'start', 'devices': len(devices), 'tests': len(selected),
+              'log': os.path.basename(log_file)})
+
+        workers = max(1, min(workers or DEFAULT_WORKERS, len(devices)))
+        with open(log_file, 'w', encoding='utf-8') as f, \
+                ResultSink(log_file[:-4] + '.jsonl') as sink, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            for line in warnings:
+                f.write(line + '\n')
+            # map сохраняет порядок устройств из config.txt
+            results = pool.map(lambda cfg: _run_device(cfg, selected, on_event, sink, on_result, token), devices)
+            for cfg, outcomes in zip(devices, results):
+                f.write(' '.join(f'{k}={v}' for k, v in cfg.items()) + '\n')
+                for result, output in outcomes:
+                    output.copy_to(f)
+                    output.close()
+                    f.write(result.line() + '\n')
+                f.write('\n')
+                f.flush()
+
+        with open(log_file, 'r', encoding='utf-8') as f:
+            return f.read().strip()
     finally:
+        cancellation.unregister(token)
         stop_syslog_server()
-